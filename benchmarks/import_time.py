@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""Import-time budget of the ``python -m src`` commands.
+
+Every command is started with ``--help`` in a fresh interpreter under
+``python -X importtime``. Its import time is the sum of the cumulative times
+of the top-level imports, best of ``repeat`` runs. A command fails the check
+when its import time exceeds its budget, or when it imports a package it does
+not need: the group help must not import the data stack, and only ``train``
+may import scikit-learn or SciPy.
+
+The budgets were measured on a single core with about 2x headroom; ``--scale``
+multiplies them on slower machines. ``tests/test_import_time.py`` runs the same
+check with the test suite (``make test``), scaled by ``IMPORT_TIME_SCALE``.
+"""
+import logging
+import subprocess
+import sys
+import time
+
+import click
+
+# Command line after ``python -m src``: import time budget in seconds
+BUDGETS = {
+    (): 0.15,
+    ('features',): 1.0,
+    ('manifest',): 1.0,
+    ('preprocess',): 1.0,
+    ('train',): 2.5,
+    ('predict',): 1.0,
+}
+
+# Top-level packages a command must not import
+FORBIDDEN = {
+    (): ['pandas', 'numpy', 'sklearn', 'scipy', 'dotenv'],
+    ('features',): ['sklearn', 'scipy'],
+    ('manifest',): ['sklearn', 'scipy'],
+    ('preprocess',): ['sklearn', 'scipy'],
+    ('predict',): ['sklearn', 'scipy'],
+}
+
+
+def parse_importtime(stderr):
+    """
+    Read the report of ``python -X importtime``.
+
+    Returns:
+    - The total import time in seconds, the sum of the cumulative times of the top-level imports.
+    - The set of imported top-level packages.
+    """
+    total = 0
+    packages = set()
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        packages.add(name.strip().split('.')[0])
+        # Nested imports are indented below the one that triggered them
+        if not name.startswith('  '):
+            total += int(cumulative)
+    return total / 1e6, packages
+
+
+def measure(command, repeat=3):
+    """Best import time and wall time of ``python -m src <command> --help``, and its imported packages."""
+    best_import, best_wall, packages = float('inf'), float('inf'), set()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-m', 'src', *command, '--help'],
+                                capture_output=True, text=True, check=True)
+        best_wall = min(best_wall, time.perf_counter() - start)
+        import_seconds, packages = parse_importtime(result.stderr)
+        best_import = min(best_import, import_seconds)
+    return best_import, best_wall, packages
+
+
+@click.command()
+@click.option('--repeat', type=click.IntRange(min=1), default=3, show_default=True,
+              help='Runs per command, the best one is kept.')
+@click.option('--scale', type=click.FloatRange(min=0, min_open=True), default=1.0, show_default=True,
+              help='Factor applied to the budgets.')
+def main(repeat=3, scale=1.0):
+    """Checks the import time of every command of python -m src against its budget."""
+    logger = logging.getLogger(__name__)
+    failures = []
+    for command, budget in BUDGETS.items():
+        name = ' '.join(command) or '(group)'
+        import_seconds, wall_seconds, packages = measure(command, repeat)
+        logger.info('%-10s imports %.3f s (budget %.3f s), starts in %.3f s',
+                    name, import_seconds, budget * scale, wall_seconds)
+        if import_seconds > budget * scale:
+            failures.append(f'{name} imports in {import_seconds:.3f} s, over its {budget * scale:.3f} s budget')
+        unexpected = sorted(packages & set(FORBIDDEN.get(command, [])))
+        if unexpected:
+            failures.append(f'{name} imports {", ".join(unexpected)}')
+
+    for failure in failures:
+        logger.error(failure)
+    if failures:
+        raise click.ClickException(f'{len(failures)} import budget failure(s)')
+
+
+if __name__ == '__main__':
+    log_fmt = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    logging.basicConfig(level=logging.INFO, format=log_fmt)
+
+    main()
@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""Timed benchmarks of the feature pipeline on synthetic sessions.
+
+Synthetic raw sessions are generated once (see ``benchmarks.synthetic``), then
+every pipeline stage is benchmarked on them:
+
+- ``feature_engineering``: movement kinematics and traffic flow features of every raw file;
+- ``process_data``: interval statistics of the four fast/slow movement/traffic datasets;
+- ``preprocess``: cleaning of the statistics datasets, reading and writing included;
+- ``train_model``: fitting and evaluating an ExtraTreesClassifier on every cleaned dataset.
+
+The inputs of every stage are prepared on disk beforehand. Each benchmark
+runs in a fresh process, so its peak resident set size (RSS) covers that
+stage only: loading its inputs and running it ``repeat`` times, or more for
+short stages. The best time of the runs is reported as rows per second of the
+stage's input.
+
+Results are written as JSON. When compared against a baseline, a stage
+regresses if its throughput drops, or its peak RSS grows, by more than the
+tolerance.
+"""
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import click
+
+from benchmarks.synthetic import generate_dataset
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+# Allowed relative slowdown or memory growth before a stage counts as a regression
+DEFAULT_TOLERANCE = 0.25
+
+# Short stages are repeated for at least this long, as their best time is noisy otherwise
+MIN_SECONDS = 5
+
+TIME_WINDOW = 10
+
+# Minutes of the slow game ``train_model`` trains and tests on
+TRAIN_MINUTES = 8
+TEST_MINUTES = 2
+
+
+def _raw_datasets(workdir):
+    """The four datasets of ``build_features.main`` over the synthetic raw files."""
+    from src.data.manifest import scan
+
+    return scan(os.path.join(workdir, 'raw'), os.path.join(workdir, 'raw_manifest.json')).datasets()
+
+
+def _stat_paths(workdir, format):
+    from src.data.storage import table_path
+
+    return {name: table_path(os.path.join(workdir, 'processed'), name, format)
+            for name in ['movement_fast_stat', 'movement_slow_stat', 'traffic_fast_stat', 'traffic_slow_stat']}
+
+
+def prepare(workdir, users, duration, movement_rate, traffic_rate, format='parquet', seed=0):
+    """Generate the raw sessions and the statistics and cleaned datasets the later stages start from."""
+    from src.data.storage import write_table
+    from src.features.build_features import process_datasets
+    from src.process.process_data import preprocess
+
+    generate_dataset(os.path.join(workdir, 'raw'), users, duration, movement_rate, traffic_rate, seed)
+    os.makedirs(os.path.join(workdir, 'processed'), exist_ok=True)
+    stats = process_datasets(_raw_datasets(workdir), TIME_WINDOW)
+    paths = _stat_paths(workdir, format)
+    for name, df in stats.items():
+        write_table(df, paths[name])
+    preprocess(paths, os.path.join(workdir, 'processed'), format)
+
+
+def setup_feature_engineering(workdir, format):
+    from src.data.storage import read_table
+
+    return [(read_table(filepath), data_type)
+            for filepaths, data_type in _raw_datasets(workdir).values() for filepath in filepaths]
+
+
+def run_feature_engineering(frames):
+    from src.features.build_features import feature_engineering
+
+    for df, data_type in frames:
+        feature_engineering(df.copy(), data_type)
+    return sum(len(df) for df, _ in frames)
+
+
+def setup_process_data(workdir, format):
+    from src.data.storage import read_table
+
+    datasets = _raw_datasets(workdir)
+    rows = sum(len(read_table(filepath, columns=['time'])) for filepaths, _ in datasets.values()
+               for filepath in filepaths)
+    return datasets, rows
+
+
+def run_process_data(state):
+    from src.features.build_features import process_datasets
+
+    datasets, rows = state
+    process_datasets(datasets, TIME_WINDOW)
+    return rows
+
+
+def setup_preprocess(workdir, format):
+    from src.data.storage import read_table
+
+    paths = _stat_paths(workdir, format)
+    output_dir = os.path.join(workdir, 'preprocessed')
+    os.makedirs(output_dir, exist_ok=True)
+    return paths, output_dir, sum(len(read_table(path)) for path in paths.values())
+
+
+def run_preprocess(state):
+    from src.process.process_data import preprocess
+
+    paths, output_dir, rows = state
+    preprocess(paths, output_dir, None)
+    return rows
+
+
+def setup_train_model(workdir, format):
+    from src.data.storage import read_table, table_path
+    from src.models.train_model import minute_split
+
+    processed = os.path.join(workdir, 'processed')
+    splits = []
+    for data_type in ['movement', 'traffic']:
+        slow = read_table(table_path(processed, f'{data_type}_slow_stat_cleaned', format))
+        fast = read_table(table_path(processed, f'{data_type}_fast_stat_cleaned', format))
+        splits.append(minute_split(slow, fast, TRAIN_MINUTES, TEST_MINUTES))
+    return splits
+
+
+def run_train_model(splits):
+    from src.models.train_model import SEED, evaluate_classifier
+    from sklearn.ensemble import ExtraTreesClassifier
+
+    for data in splits:
+        evaluate_classifier('ExtraTreesClassifier', ExtraTreesClassifier(random_state=SEED, n_jobs=1), data)
+    return sum(len(data[0]) for data in splits)
+
+
+# Stage name: (setup, run); ``setup(workdir, format)`` loads the inputs untimed, ``run(inputs)`` returns the rows
+BENCHMARKS = {
+    'feature_engineering': (setup_feature_engineering, run_feature_engineering),
+    'process_data': (setup_process_data, run_process_data),
+    'preprocess': (setup_preprocess, run_preprocess),
+    'train_model': (setup_train_model, run_train_model),
+}
+
+
+def peak_rss_mb():
+    """Peak resident set size of the current process in MB, None where it is not available."""
+    # ``ru_maxrss`` survives exec on Linux, so a spawned process would report its parent's peak
+    if os.path.exists('/proc/self/status'):
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+def _measure(task):
+    """Set up and run one benchmark at least ``repeat`` times and ``MIN_SECONDS``, in the current process."""
+    name, workdir, format, repeat = task
+    setup, run = BENCHMARKS[name]
+    inputs = setup(workdir, format)
+    seconds = []
+    while len(seconds) < repeat or sum(seconds) < MIN_SECONDS:
+        start = time.perf_counter()
+        rows = run(inputs)
+        seconds.append(time.perf_counter() - start)
+    best = min(seconds)
+    return {
+        'rows': rows,
+        'seconds': best,
+        'rows_per_sec': rows / best if best > 0 else None,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def measure(name, workdir, format='parquet', repeat=3):
+    """Run one benchmark in a fresh process and return its measurements."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+        return executor.submit(_measure, (name, workdir, format, repeat)).result()
+
+
+def environment():
+    """Description of the machine and library versions the results were obtained with."""
+    import numpy
+    import pandas
+    import sklearn
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'numpy': numpy.__version__,
+        'pandas': pandas.__version__,
+        'sklearn': sklearn.__version__,
+    }
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compare benchmark results against a baseline.
+
+    Parameters:
+    - results, baseline: Results as written by ``main``.
+    - tolerance: Allowed relative drop in throughput and growth in peak RSS.
+
+    Returns:
+    - A list of ``(benchmark, metric, baseline value, value)`` regressions.
+    """
+    regressions = []
+    for name, current in results['benchmarks'].items():
+        reference = baseline.get('benchmarks', {}).get(name)
+        if reference is None:
+            continue
+        if reference.get('rows_per_sec') and current.get('rows_per_sec') is not None:
+            if current['rows_per_sec'] < reference['rows_per_sec'] * (1 - tolerance):
+                regressions.append((name, 'rows_per_sec', reference['rows_per_sec'], current['rows_per_sec']))
+        if reference.get('peak_rss_mb') and current.get('peak_rss_mb') is not None:
+            if current['peak_rss_mb'] > reference['peak_rss_mb'] * (1 + tolerance):
+                regressions.append((name, 'peak_rss_mb', reference['peak_rss_mb'], current['peak_rss_mb']))
+    return regressions
+
+
+@click.command()
+@click.argument('output_filepath', type=click.Path(dir_okay=False), default='reports/benchmarks.json')
+@click.option('--benchmark', 'names', type=click.Choice(list(BENCHMARKS)), multiple=True,
+              help='Benchmark to run, repeatable; all by default.')
+@click.option('--users', type=click.IntRange(min=1), default=4, show_default=True, help='Number of synthetic users.')
+@click.option('--duration', type=click.FloatRange(min=1), default=600, show_default=True,
+              help='Session length in seconds.')
+@click.option('--movement-rate', type=click.FloatRange(min=1), default=60, show_default=True,
+              help='Movement samples per second.')
+@click.option('--traffic-rate', type=click.FloatRange(min=1), default=50, show_default=True,
+              help='Mean packets per second.')
+@click.option('--format', type=click.Choice(['csv', 'parquet']), default='parquet', show_default=True,
+              help='Storage format of the intermediate datasets.')
+@click.option('--repeat', type=click.IntRange(min=1), default=3, show_default=True,
+              help='Minimum runs of every benchmark, the best one is reported.')
+@click.option('--baseline', 'baseline_filepath', type=click.Path(dir_okay=False), default=BASELINE_PATH,
+              show_default=True, help='Results to compare against, skipped if the file does not exist.')
+@click.option('--tolerance', type=click.FloatRange(min=0), default=DEFAULT_TOLERANCE, show_default=True,
+              help='Allowed relative throughput drop and peak RSS growth.')
+@click.option('--save-baseline', is_flag=True, help='Store the results as the new baseline instead of comparing.')
+@click.option('--workdir', type=click.Path(file_okay=False), default=None,
+              help='Directory of the synthetic data, a temporary one by default.')
+def main(output_filepath='reports/benchmarks.json', names=(), users=4, duration=600, movement_rate=60,
+         traffic_rate=50, format='parquet', repeat=3, baseline_filepath=BASELINE_PATH, tolerance=DEFAULT_TOLERANCE,
+         save_baseline=False, workdir=None):
+    """Benchmarks the feature pipeline on synthetic sessions and checks for regressions."""
+    logger = logging.getLogger(__name__)
+    names = names or tuple(BENCHMARKS)
+    split_seconds = 60 * (TRAIN_MINUTES + TEST_MINUTES)
+    if 'train_model' in names and duration < split_seconds:
+        raise click.BadParameter(f'train_model needs sessions of at least {split_seconds} s, '
+                                 f'{TRAIN_MINUTES} training and {TEST_MINUTES} test minutes', param_hint='--duration')
+    config = {'users': users, 'duration': duration, 'movement_rate': movement_rate, 'traffic_rate': traffic_rate,
+              'format': format, 'repeat': repeat, 'time_window': TIME_WINDOW}
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        workdir = workdir or tmpdir
+        logger.info('Generating %d synthetic users in %s', users, workdir)
+        prepare(workdir, users, duration, movement_rate, traffic_rate, format)
+
+        results = {'environment': environment(), 'config': config, 'benchmarks': {}}
+        for name in names:
+            results['benchmarks'][name] = measure(name, workdir, format, repeat)
+            logger.info('%s: %.0f rows/s, peak RSS %s MB', name, results['benchmarks'][name]['rows_per_sec'],
+                        results['benchmarks'][name]['peak_rss_mb'])
+
+    output_dir = os.path.dirname(output_filepath)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    with open(output_filepath, 'w') as f:
+        json.dump(results, f, indent=1)
+
+    if save_baseline:
+        with open(baseline_filepath, 'w') as f:
+            json.dump(results, f, indent=1)
+        logger.info('Saved baseline to %s', baseline_filepath)
+        return
+    if not os.path.exists(baseline_filepath):
+        return
+
+    with open(baseline_filepath) as f:
+        baseline = json.load(f)
+    if baseline.get('config') != config:
+        logger.warning('Baseline was run with %s, not %s', baseline.get('config'), config)
+    regressions = compare(results, baseline, tolerance)
+    for name, metric, reference, value in regressions:
+        logger.error('%s regressed: %s %.1f -> %.1f', name, metric, reference, value)
+    if regressions:
+        raise click.ClickException(f'{len(regressions)} regression(s) against {baseline_filepath}')
+    logger.info('No regression against %s', baseline_filepath)
+
+
+if __name__ == '__main__':
+    log_fmt = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    logging.basicConfig(level=logging.INFO, format=log_fmt)
+
+    main()
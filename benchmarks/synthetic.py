@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""Synthetic VR sessions with the schemas of the raw data.
+
+Every user gets a ``group<g>_order<o>_user<u>`` directory holding a ``fast``
+and a ``slow`` session, each made of a ``user<u>_<speed>_movement.csv`` and a
+``user<u>_<speed>_traffic.csv`` file, as in ``data/raw``:
+
+- movement: ``time`` and the Pos/Orientation X/Y/Z columns of the Head,
+  LeftTouch and RightTouch segments, sampled at a fixed rate with jitter;
+- traffic: ``time``, ``direction`` (``UL``/``DL``) and ``size`` of every
+  packet, with Poisson arrivals.
+
+Every user has their own posture, sway and traffic profile, so the sessions
+can be told apart by the classifiers.
+"""
+import logging
+import os
+
+import click
+import numpy as np
+import pandas as pd
+
+from src.features.kinematics import SEGMENTS, block_columns
+
+MOVEMENT_COLUMNS = ['time'] + block_columns(SEGMENTS, 'Pos') + block_columns(SEGMENTS, 'Orientation')
+TRAFFIC_COLUMNS = ['time', 'direction', 'size']
+
+SPEEDS = ['fast', 'slow']
+
+# Packet sizes of the captures: acknowledgements, media packets and jumbo segments
+PACKET_SIZES = np.array([27, 66, 1051, 1514, 65535])
+
+
+def user_profile(rng):
+    """Random per-user parameters shared by the user's sessions."""
+    return {
+        'posture': rng.normal(0, 0.3, (len(SEGMENTS), 3)),
+        'sway': rng.uniform(0.005, 0.05, len(SEGMENTS)),
+        'turn': rng.uniform(0.2, 2.0, len(SEGMENTS)),
+        'frequency': rng.uniform(0.2, 2.0, len(SEGMENTS)),
+        'uplink_share': rng.uniform(0.2, 0.5),
+        'size_weights': rng.dirichlet(np.ones(len(PACKET_SIZES))),
+    }
+
+
+def movement_session(rng, profile, duration, sample_rate):
+    """
+    Movement samples of one session.
+
+    Parameters:
+    - profile: ``user_profile`` of the session's user.
+    - duration: Session length in seconds.
+    - sample_rate: Samples per second; sample times jitter by 5% of the period.
+
+    Returns:
+    - A DataFrame with ``MOVEMENT_COLUMNS``.
+    """
+    n = max(2, int(duration * sample_rate))
+    period = 1 / sample_rate
+    time = np.arange(n) * period + rng.uniform(-0.05, 0.05, n) * period
+    time = np.maximum.accumulate(np.clip(time, 0, None))
+
+    phase = 2 * np.pi * profile['frequency'][None, :, None] * time[:, None, None]
+    position = (profile['posture'][None]
+                + profile['sway'][None, :, None] * np.sin(phase + rng.uniform(0, 2 * np.pi, (1, len(SEGMENTS), 3)))
+                + np.cumsum(rng.normal(0, 0.002, (n, len(SEGMENTS), 3)), axis=0))
+    orientation = np.cumsum(rng.normal(0, 1, (n, len(SEGMENTS), 3)) * profile['turn'][None, :, None], axis=0)
+    orientation = (orientation + 180) % 360 - 180
+
+    data = np.column_stack([time, position.reshape(n, -1), orientation.reshape(n, -1)])
+    return pd.DataFrame(data, columns=MOVEMENT_COLUMNS)
+
+
+def traffic_session(rng, profile, duration, packet_rate):
+    """
+    Packets of one session.
+
+    Parameters:
+    - profile: ``user_profile`` of the session's user.
+    - duration: Session length in seconds.
+    - packet_rate: Mean packets per second.
+
+    Returns:
+    - A DataFrame with ``TRAFFIC_COLUMNS``, times rounded to the millisecond as in the captures.
+    """
+    n = max(2, rng.poisson(duration * packet_rate))
+    time = np.round(np.sort(rng.uniform(0, duration, n)), 3)
+    uplink = rng.random(n) < profile['uplink_share']
+    return pd.DataFrame({
+        'time': time,
+        'direction': np.where(uplink, 'UL', 'DL'),
+        'size': rng.choice(PACKET_SIZES, n, p=profile['size_weights']),
+    })
+
+
+def generate_dataset(root, users=4, duration=600, movement_rate=60, traffic_rate=50, seed=0):
+    """
+    Write the raw sessions of ``users`` synthetic users under ``root``.
+
+    Parameters:
+    - root: Directory playing the role of ``data/raw``.
+    - users: Number of users, each with a fast and a slow session.
+    - duration: Session length in seconds.
+    - movement_rate: Movement samples per second.
+    - traffic_rate: Mean packets per second.
+    - seed: Seed of the generator, the same seed writes the same files.
+
+    Returns:
+    - The number of movement and traffic rows written.
+    """
+    rng = np.random.default_rng(seed)
+    rows = {'movement': 0, 'traffic': 0}
+    for user in range(users):
+        profile = user_profile(rng)
+        session_dir = os.path.join(root, f'group{user // 2 + 1}_order{user % 2 + 1}_user{user}')
+        for speed in SPEEDS:
+            os.makedirs(os.path.join(session_dir, speed), exist_ok=True)
+            prefix = os.path.join(session_dir, speed, f'user{user}_{speed}')
+
+            movement = movement_session(rng, profile, duration, movement_rate)
+            movement.to_csv(f'{prefix}_movement.csv', index=False)
+            traffic = traffic_session(rng, profile, duration, traffic_rate)
+            traffic.to_csv(f'{prefix}_traffic.csv', index=False)
+
+            rows['movement'] += len(movement)
+            rows['traffic'] += len(traffic)
+    return rows
+
+
+@click.command()
+@click.argument('output_dir', type=click.Path(file_okay=False))
+@click.option('--users', type=click.IntRange(min=1), default=4, show_default=True, help='Number of users.')
+@click.option('--duration', type=click.FloatRange(min=1), default=600, show_default=True,
+              help='Session length in seconds.')
+@click.option('--movement-rate', type=click.FloatRange(min=1), default=60, show_default=True,
+              help='Movement samples per second.')
+@click.option('--traffic-rate', type=click.FloatRange(min=1), default=50, show_default=True,
+              help='Mean packets per second.')
+@click.option('--seed', type=int, default=0, show_default=True)
+def main(output_dir, users=4, duration=600, movement_rate=60, traffic_rate=50, seed=0):
+    """Writes synthetic raw movement and traffic sessions."""
+    logger = logging.getLogger(__name__)
+    rows = generate_dataset(output_dir, users, duration, movement_rate, traffic_rate, seed)
+    logger.info('Wrote %d movement and %d traffic rows for %d users to %s',
+                rows['movement'], rows['traffic'], users, output_dir)
+
+
+if __name__ == '__main__':
+    log_fmt = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    logging.basicConfig(level=logging.INFO, format=log_fmt)
+
+    main()
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""Command line entry point of the pipeline, ``python -m src <command>``.
+
+Every command is the click command of a pipeline module, imported only when
+the command is run or asked for its help. ``python -m src --help`` imports
+click alone, and a command imports its own dependencies only: ``features``
+needs neither scikit-learn nor SciPy, and ``preprocess`` imports scikit-learn
+only when it fits a dataset. The ``.env`` file is looked up once a command runs.
+"""
+import importlib
+import logging
+
+import click
+
+# Command name: module and attribute of its click command, and its one-line help
+COMMANDS = {
+    'features': ('src.features.build_features', 'main',
+                 'Compute the interval statistics datasets from the raw data.'),
+    'manifest': ('src.data.manifest', 'main', 'Index the raw files for the other stages.'),
+    'preprocess': ('src.process.process_data', 'main', 'Clean statistics datasets for training.'),
+    'train': ('src.models.train_model', 'main', 'Train the classifier zoo and save the best model.'),
+    'predict': ('src.models.predict_model', 'main', 'Predict the users of cleaned or raw statistics rows.'),
+}
+
+
+class LazyGroup(click.Group):
+    """Group importing the module of a command only when the command is resolved."""
+
+    def __init__(self, *args, lazy_commands=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy_commands = lazy_commands or {}
+
+    def list_commands(self, ctx):
+        return sorted(set(super().list_commands(ctx)) | set(self.lazy_commands))
+
+    def get_command(self, ctx, cmd_name):
+        if cmd_name not in self.lazy_commands:
+            return super().get_command(ctx, cmd_name)
+        module_name, attribute, _ = self.lazy_commands[cmd_name]
+        return getattr(importlib.import_module(module_name), attribute)
+
+    def format_commands(self, ctx, formatter):
+        # The help of the group lists the stored one-line helps instead of importing every command
+        rows = [(name, self.lazy_commands[name][2] if name in self.lazy_commands
+                 else super().get_command(ctx, name).get_short_help_str())
+                for name in self.list_commands(ctx)]
+        if rows:
+            with formatter.section('Commands'):
+                formatter.write_dl(rows)
+
+
+@click.group(cls=LazyGroup, lazy_commands=COMMANDS)
+def cli():
+    """Data pipeline of the VR user identification project."""
+    from dotenv import find_dotenv, load_dotenv
+
+    # Find .env automagically by walking up directories until it's found,
+    # then load up the .env entries as environment variables
+    load_dotenv(find_dotenv())
+
+
+if __name__ == '__main__':
+    log_fmt = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    logging.basicConfig(level=logging.INFO, format=log_fmt)
+
+    cli()
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""Lazy, memoized access to a processed feature table.
+
+``FeatureDataset`` opens a ``*_stat_cleaned`` table without reading it. A
+query names the columns it needs (e.g. the top-k important features), a set
+of ``time_interval`` values and a set of IDs. Only those are read: the columns
+are projected and, for Parquet tables, the row filters are pushed down to the
+reader.
+
+Query results are kept in a small LRU cache. A query is answered from a cached
+result that holds all its columns and rows, filtering it in memory, so the
+steps of a learning curve or a feature selection sweep do not reparse the
+table. Returned frames are copies of the cached ones: modifying them in
+place, even through ``.values``, does not change later results.
+"""
+import os
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from src.data.storage import read_table, table_columns
+
+# Movement statistics flatten to ``ID_``/``time_interval_``, traffic ones to ``ID``/``time_interval``
+LABEL_COLUMNS = ['ID', 'ID_']
+INTERVAL_COLUMNS = ['time_interval', 'time_interval_']
+
+# Query results kept by every dataset
+DEFAULT_CACHE_SIZE = 16
+
+
+def find_column(columns, candidates):
+    """First of ``candidates`` present in ``columns``, a DataFrame or a list of names."""
+    columns = columns.columns if isinstance(columns, pd.DataFrame) else columns
+    for col in candidates:
+        if col in columns:
+            return col
+    raise KeyError(f'None of {candidates} in the dataset')
+
+
+def features_and_labels(df):
+    """Split a cleaned dataset into its features, with the time interval, and its ID labels."""
+    label = find_column(df, LABEL_COLUMNS)
+    X = df.drop(columns=[label] + [col for col in df.columns if col.startswith('Unnamed:')])
+    return X, df[label]
+
+
+def _value_set(values):
+    """Filter values as a hashable set, None meaning no filter."""
+    if values is None:
+        return None
+    if np.isscalar(values):
+        values = [values]
+    return frozenset(value.item() if hasattr(value, 'item') else value for value in values)
+
+
+class FeatureDataset:
+    """
+    Lazily opened processed feature table.
+
+    Parameters:
+    - path: Table to read, in any format of ``storage.FORMATS``.
+    - cache_size: Number of query results kept in memory.
+    """
+
+    def __init__(self, path, cache_size=DEFAULT_CACHE_SIZE):
+        self.path = path
+        self.cache_size = cache_size
+        self._columns = None
+        self._mtime = None
+        self._cache = OrderedDict()
+
+    def __repr__(self):
+        return f'FeatureDataset({self.path!r})'
+
+    def _check_fresh(self):
+        """Forget what was read if the table changed on disk since."""
+        mtime = os.path.getmtime(self.path)
+        if mtime != self._mtime:
+            self._mtime = mtime
+            self._columns = None
+            self._cache.clear()
+
+    @property
+    def columns(self):
+        """All the columns of the table, read from its header or schema only."""
+        self._check_fresh()
+        if self._columns is None:
+            self._columns = table_columns(self.path)
+        return self._columns
+
+    @property
+    def label_column(self):
+        return find_column(self.columns, LABEL_COLUMNS)
+
+    @property
+    def interval_column(self):
+        return find_column(self.columns, INTERVAL_COLUMNS)
+
+    @property
+    def feature_columns(self):
+        """Columns other than the ID, the time interval and saved index columns."""
+        keys = {self.label_column, self.interval_column}
+        return [col for col in self.columns if col not in keys and not str(col).startswith('Unnamed:')]
+
+    def minutes(self):
+        """The ``time_interval`` values in order of appearance, as the notebooks split them."""
+        interval = self.interval_column
+        return pd.unique(self.select([interval], with_keys=False)[interval])
+
+    def ids(self):
+        """The sorted IDs of the table."""
+        return np.sort(pd.unique(self.select([self.label_column], with_keys=False)[self.label_column]))
+
+    def select(self, columns=None, intervals=None, ids=None, with_keys=True):
+        """
+        Read a slice of the table.
+
+        Parameters:
+        - columns: Feature columns to read, all of them by default.
+        - intervals: ``time_interval`` values of the rows to read, e.g. ``range(1, 9)``; all by default.
+        - ids: IDs of the rows to read, all by default.
+        - with_keys: Also read the ID and time interval columns.
+
+        Returns:
+        - The selected rows and columns as a DataFrame, both in table order.
+        """
+        self._check_fresh()
+        wanted = set(self.feature_columns if columns is None else columns)
+        missing = wanted - set(self.columns)
+        if missing:
+            raise KeyError(f'Columns {sorted(missing)} not in {self.path}')
+        if with_keys:
+            wanted |= {self.label_column, self.interval_column}
+        columns = [col for col in self.columns if col in wanted]
+        filters = {}
+        if intervals is not None:
+            filters[self.interval_column] = _value_set(intervals)
+        if ids is not None:
+            filters[self.label_column] = _value_set(ids)
+
+        key = (tuple(columns), tuple(sorted(filters.items(), key=lambda item: item[0])))
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key].copy()
+
+        df = self._from_cache(columns, filters)
+        if df is None:
+            read_columns = list(dict.fromkeys(columns + list(filters)))
+            df = read_table(self.path, read_columns, {col: sorted(values) for col, values in filters.items()})
+            df = df[columns]
+        self._cache[key] = df
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return df.copy()
+
+    def _from_cache(self, columns, filters):
+        """Answer a query from a cached result holding all of its rows and columns, if any."""
+        needed = set(columns) | set(filters)
+        for (cached_columns, cached_filters), cached in reversed(self._cache.items()):
+            if not needed <= set(cached_columns):
+                continue
+            cached_filters = dict(cached_filters)
+            if any(col not in filters or not filters[col] <= values for col, values in cached_filters.items()):
+                continue
+            keep = np.ones(len(cached), dtype=bool)
+            for col, values in filters.items():
+                if cached_filters.get(col) != values:
+                    keep &= cached[col].isin(list(values)).to_numpy()
+            return cached.loc[keep, columns].reset_index(drop=True)
+        return None
+
+    def clear(self):
+        """Forget the cached query results."""
+        self._cache.clear()
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+"""Index of the raw session files.
+
+``Manifest`` records every raw table under a directory, e.g.
+``group1_order2_user3/slow/user3_slow_traffic.csv``. For each one it keeps the
+group, order, user, speed and data type parsed from its path, its size and its
+mtime. Paths are split on both ``/`` and ``\\``, so Windows paths parse the same
+on every platform. Stages select their inputs with ``select`` or ``datasets``
+instead of walking the tree and matching substrings of the paths.
+
+The index is saved as JSON together with the mtime of every directory. A
+refresh stats each known directory. Only the directories whose mtime changed,
+because entries were added, removed or renamed, are listed and have their
+files stat'ed again. A file rewritten in place does not change its directory's
+mtime: ``refresh(full=True)`` re-stats every file. Directories are visited
+level by level, optionally on a thread pool, which hides the latency of
+network-mounted trees.
+"""
+import json
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+
+from src.data.storage import table_format
+
+INDEX_VERSION = 1
+
+# Statistics datasets: data type and speed of their raw tables, in processing order
+DATASETS = {
+    'movement_fast_stat': ('movement', 'fast'),
+    'movement_slow_stat': ('movement', 'slow'),
+    'traffic_fast_stat': ('traffic', 'fast'),
+    'traffic_slow_stat': ('traffic', 'slow'),
+}
+
+DATA_TYPES = ('movement', 'traffic')
+SPEEDS = ('fast', 'slow')
+
+# Numbers of a session directory name, e.g. ``group1_order2_user3``
+SESSION_PATTERN = re.compile(r'group(?P<group>\d+)_order(?P<order>\d+)_user(?P<user>\d+)')
+
+# Default number of threads listing directories
+DEFAULT_THREADS = 1
+
+
+def path_parts(filepath):
+    """Components of a path written with either separator."""
+    return [part for part in re.split(r'[\\/]+', str(filepath)) if part]
+
+
+def _words(part):
+    return set(re.split(r'[^a-z0-9]+', part.lower()))
+
+
+def session_id(filepath):
+    """Name of the session directory of a raw file, the first path component naming a group, order and user."""
+    for part in path_parts(filepath):
+        if 'group' in part and 'order' in part and 'user' in part:
+            return part
+    return None
+
+
+def parse_path(filepath):
+    """
+    Fields of a raw file given by its path.
+
+    Returns:
+    - A dictionary with the session ``id``, its ``group``, ``order`` and ``user`` numbers, the
+      ``speed`` (fast or slow) and the ``data_type`` (movement or traffic). Fields that cannot
+      be parsed are None.
+    """
+    parts = path_parts(filepath)
+    fields = dict.fromkeys(['id', 'group', 'order', 'user', 'speed', 'data_type'])
+    fields['id'] = session_id(filepath)
+    if fields['id'] is not None:
+        match = SESSION_PATTERN.search(fields['id'])
+        if match:
+            fields.update({key: int(value) for key, value in match.groupdict().items()})
+    if parts:
+        stem = parts[-1].split('.')[0]
+        fields['data_type'] = next((value for value in DATA_TYPES if value in _words(stem)), None)
+        # The file name gives the speed, or else the closest directory naming one
+        for part in [stem] + parts[-2::-1]:
+            speed = next((value for value in SPEEDS if value in _words(part)), None)
+            if speed is not None or part == fields['id']:
+                fields['speed'] = speed
+                break
+    return fields
+
+
+def _relative_join(directory, name):
+    return f'{directory}/{name}' if directory else name
+
+
+class Manifest:
+    """
+    Raw tables under a directory, with the directory mtimes needed to refresh them.
+
+    Parameters:
+    - root: Raw data directory.
+    - directories: Per directory relative to ``root``: its mtime and the names of its subdirectories and tables.
+    - files: Per table relative to ``root``: its size, mtime and the fields of ``parse_path``.
+    """
+
+    def __init__(self, root, directories=None, files=None):
+        self.root = str(root)
+        self.directories = directories or {}
+        self.files = files or {}
+        # Directories listed by the last refresh
+        self.rescanned = 0
+
+    def __len__(self):
+        return len(self.files)
+
+    def __repr__(self):
+        return f'Manifest({self.root!r}, {len(self)} files)'
+
+    @classmethod
+    def load(cls, root, index_path):
+        """The index of ``root`` saved at ``index_path``, or an empty manifest if there is none yet."""
+        if not os.path.exists(index_path):
+            return cls(root)
+        with open(index_path) as f:
+            state = json.load(f)
+        # An index of another tree would only be rescanned
+        if state.get('version') != INDEX_VERSION or state.get('root') != os.path.abspath(root):
+            return cls(root)
+        return cls(root, state['directories'], state['files'])
+
+    def save(self, index_path):
+        """Store the index as JSON."""
+        directory = os.path.dirname(index_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        state = {'version': INDEX_VERSION, 'root': os.path.abspath(self.root), 'directories': self.directories,
+                 'files': self.files}
+        with open(index_path, 'w') as f:
+            json.dump(state, f)
+
+    def path(self, relative_path):
+        """Path of a file or directory of the index."""
+        return os.path.join(self.root, *relative_path.split('/'))
+
+    def _visit(self, directory, full=False):
+        """List ``directory`` if it changed since it was indexed, returning its entry and the stats of its tables."""
+        try:
+            mtime = os.stat(self.path(directory)).st_mtime_ns
+            known = self.directories.get(directory)
+            if not full and known is not None and known['mtime_ns'] == mtime:
+                return directory, known, None
+            subdirectories, tables = [], {}
+            with os.scandir(self.path(directory)) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirectories.append(entry.name)
+                    elif table_format(entry.name) is not None:
+                        stat = entry.stat()
+                        tables[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        except FileNotFoundError:
+            # Removed while the tree was being scanned
+            return directory, None, None
+        entry = {'mtime_ns': mtime, 'dirs': sorted(subdirectories), 'files': sorted(tables)}
+        return directory, entry, tables
+
+    def refresh(self, threads=DEFAULT_THREADS, full=False):
+        """
+        Bring the index up to date with the tree.
+
+        Parameters:
+        - threads: Number of threads listing directories.
+        - full: List every directory and stat every file, not only the changed directories.
+
+        Returns:
+        - The manifest itself.
+        """
+        directories, files = {}, {}
+        self.rescanned = 0
+        executor = ThreadPoolExecutor(threads) if threads > 1 else None
+        try:
+            level = ['']
+            while level:
+                next_level = []
+                visits = executor.map(lambda directory: self._visit(directory, full), level) if executor else \
+                    (self._visit(directory, full) for directory in level)
+                for directory, entry, tables in visits:
+                    if entry is None:
+                        continue
+                    directories[directory] = entry
+                    next_level += [_relative_join(directory, name) for name in entry['dirs']]
+                    if tables is None:
+                        for name in entry['files']:
+                            relative_path = _relative_join(directory, name)
+                            files[relative_path] = self.files[relative_path]
+                        continue
+                    self.rescanned += 1
+                    for name, (size, mtime) in tables.items():
+                        relative_path = _relative_join(directory, name)
+                        files[relative_path] = dict(parse_path(self.path(relative_path)), size=size, mtime_ns=mtime)
+                level = next_level
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        self.directories, self.files = directories, files
+        return self
+
+    def select(self, data_type=None, speed=None, ids=None):
+        """
+        Paths of the raw tables matching every given field, sorted.
+
+        Parameters:
+        - data_type: ``movement`` or ``traffic``, any by default.
+        - speed: ``fast`` or ``slow``, any by default.
+        - ids: Session IDs, e.g. ``['group1_order2_user3']``, all by default.
+        """
+        ids = None if ids is None else set(ids)
+        return [self.path(relative_path) for relative_path, record in sorted(self.files.items())
+                if (data_type is None or record['data_type'] == data_type)
+                and (speed is None or record['speed'] == speed)
+                and (ids is None or record['id'] in ids)]
+
+    def datasets(self):
+        """The raw tables of every statistics dataset, as ``{name: (filepaths, data_type)}``."""
+        return {name: (self.select(data_type, speed), data_type) for name, (data_type, speed) in DATASETS.items()}
+
+
+def scan(root, index_path=None, threads=DEFAULT_THREADS, full=False):
+    """
+    Index the raw tables under ``root``.
+
+    Parameters:
+    - root: Raw data directory.
+    - index_path: JSON index refreshed and saved back, the whole tree is listed without it.
+    - threads: Number of threads listing directories.
+    - full: Re-stat every file even if its directory did not change.
+
+    Returns:
+    - The up to date ``Manifest``.
+    """
+    manifest = Manifest.load(root, index_path) if index_path else Manifest(root)
+    manifest.refresh(threads, full)
+    if index_path:
+        manifest.save(index_path)
+    return manifest
+
+
+@click.command()
+@click.argument('input_filepath', type=click.Path(exists=True, file_okay=False))
+@click.argument('index_filepath', type=click.Path(dir_okay=False))
+@click.option('--threads', type=click.IntRange(min=1), default=DEFAULT_THREADS, show_default=True,
+              help='Number of threads listing directories.')
+@click.option('--full', is_flag=True, help='Re-stat every file, not only those of changed directories.')
+def main(input_filepath, index_filepath, threads=DEFAULT_THREADS, full=False):
+    """Indexes the raw tables under INPUT_FILEPATH into INDEX_FILEPATH."""
+    logger = logging.getLogger(__name__)
+    manifest = scan(input_filepath, index_filepath, threads, full)
+    logger.info('Indexed %d raw tables, %d of %d directories listed', len(manifest), manifest.rescanned,
+                len(manifest.directories))
+    for name, (filepaths, _) in manifest.datasets().items():
+        logger.info('%s: %d files', name, len(filepaths))
+
+
+if __name__ == '__main__':
+    log_fmt = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    logging.basicConfig(level=logging.INFO, format=log_fmt)
+
+    main()
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""Memory-compact feature matrices for training and evaluation.
+
+A cleaned statistics table is mostly float features plus, for every
+categorical raw column, one ``<col>_count_<category>`` column per category.
+A given interval only sees a few categories, so these count columns are
+mostly zeros once the datasets are aligned. ``FeatureMatrix`` holds the other
+features as one contiguous float32 block and the count columns as a float32
+sparse block, zeros being implicit, and the IDs as a categorical.
+
+The counts are min-max scaled by ``preprocess``, so a 0 is the smallest count
+seen, not a missing category. Categories missing from an interval stay NaN
+and are stored as explicit entries, so the models get the same values as
+from the DataFrame.
+
+``model_input`` hands the matrix to scikit-learn as a CSR matrix only when that
+is smaller than the dense float32 array. The dense block and the NaN entries
+of the missing categories make that rare for cleaned statistics, so models
+usually get a dense float32 array: the saving over the float64 DataFrames is
+the float32 cast, about half their memory, and the categorical IDs. The sparse
+block only saves memory while the matrix is held, e.g. when taking rows.
+"""
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from src.features.interval_stats import NUM_STATS
+
+# Marker of the category count columns of the interval statistics
+COUNT_MARKER = '_count_'
+
+
+def count_columns(columns):
+    """Category count columns among ``columns``, not the statistics of a numeric ``*_count`` feature."""
+    return [col for col in columns if COUNT_MARKER in str(col) and str(col).rsplit('_', 1)[-1] not in NUM_STATS]
+
+
+def compact_labels(y):
+    """IDs as a categorical Series, one small code per row instead of one object per row."""
+    return y if isinstance(y.dtype, pd.CategoricalDtype) else y.astype('category')
+
+
+class FeatureMatrix:
+    """
+    Features split into a dense float32 block and a sparse float32 block of category counts.
+
+    Parameters:
+    - dense: ``(rows, dense columns)`` float32 array.
+    - counts: ``(rows, count columns)`` float32 CSR matrix.
+    - columns: All the feature columns, in their original order.
+    - dense_columns, count_columns: Columns of each block, in their original order.
+    """
+
+    def __init__(self, dense, counts, columns, dense_columns, count_columns):
+        self.dense = dense
+        self.counts = counts
+        self.columns = list(columns)
+        self.dense_columns = list(dense_columns)
+        self.count_columns = list(count_columns)
+
+        position = {col: j for j, col in enumerate(self.columns)}
+        self._dense_positions = np.array([position[col] for col in self.dense_columns], dtype=np.intp)
+        self._count_positions = np.array([position[col] for col in self.count_columns], dtype=np.intp)
+
+    @classmethod
+    def from_frame(cls, X, sparse_columns=None):
+        """
+        Compact a feature DataFrame.
+
+        Parameters:
+        - X: Features, without the ID column.
+        - sparse_columns: Columns stored in the sparse block, the category counts by default.
+        """
+        columns = list(X.columns)
+        sparse_columns = set(count_columns(columns) if sparse_columns is None else sparse_columns)
+        dense_columns = [col for col in columns if col not in sparse_columns]
+        sparse_columns = [col for col in columns if col in sparse_columns]
+
+        dense = np.ascontiguousarray(X[dense_columns].to_numpy(dtype=np.float32))
+        # NaN is nonzero, so missing categories stay explicit NaN entries rather than becoming scaled zeros
+        counts = X[sparse_columns].to_numpy(dtype=np.float32)
+        return cls(dense, sparse.csr_matrix(counts, shape=(len(X), len(sparse_columns))),
+                   columns, dense_columns, sparse_columns)
+
+    def __len__(self):
+        return self.dense.shape[0]
+
+    @property
+    def shape(self):
+        return len(self), len(self.columns)
+
+    @property
+    def nbytes(self):
+        """Memory held by both blocks."""
+        counts = self.counts
+        return self.dense.nbytes + counts.data.nbytes + counts.indices.nbytes + counts.indptr.nbytes
+
+    def take(self, rows):
+        """Matrix of the selected rows, given as positions or a boolean mask."""
+        rows = np.asarray(rows)
+        if rows.dtype == bool:
+            rows = np.flatnonzero(rows)
+        return FeatureMatrix(self.dense[rows], self.counts[rows], self.columns, self.dense_columns,
+                             self.count_columns)
+
+    def is_sparse_smaller(self):
+        """Whether a CSR copy of the whole matrix, float32 values and int32 indices, beats the dense array."""
+        nonzero = np.count_nonzero(self.dense) + self.counts.nnz
+        return 8 * nonzero + 4 * (len(self) + 1) < 4 * len(self) * len(self.columns)
+
+    def model_input(self, as_sparse=None):
+        """
+        Features in their original column order, as scikit-learn takes them.
+
+        Parameters:
+        - as_sparse: Return a CSR matrix, by default only when it is smaller than the dense array.
+
+        Returns:
+        - A float32 CSR matrix or a C-contiguous float32 array.
+        """
+        if as_sparse is None:
+            as_sparse = bool(self.count_columns) and self.is_sparse_smaller()
+        if as_sparse:
+            order = np.argsort(np.r_[self._dense_positions, self._count_positions])
+            stacked = sparse.hstack([sparse.csr_matrix(self.dense), self.counts], format='csc')
+            return stacked[:, order].tocsr()
+
+        X = np.empty(self.shape, dtype=np.float32)
+        X[:, self._dense_positions] = self.dense
+        if self.count_columns:
+            X[:, self._count_positions] = self.counts.toarray()
+        return X
+
+    def to_frame(self):
+        """Dense float32 DataFrame of the features."""
+        return pd.DataFrame(self.model_input(as_sparse=False), columns=self.columns)
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""Replay raw session tables as live telemetry.
+
+The rows of a raw ``_movement``/``_traffic`` table are written as CSV lines,
+header first, at the pace given by their ``time`` column. This feeds
+``src.models.identify_live`` as if a headset were streaming:
+
+    python -m src.data.replay user1_slow_traffic.csv | python -m src.models.identify_live MODEL STATE traffic
+
+With ``--port`` every table is sent over its own TCP connection, concurrently.
+"""
+import asyncio
+import logging
+import sys
+import time
+
+import click
+
+from src.data.storage import read_table
+
+
+class _StdoutWriter:
+    """``asyncio.StreamWriter`` look-alike writing to stdout."""
+
+    def write(self, data):
+        sys.stdout.buffer.write(data)
+
+    async def drain(self):
+        sys.stdout.buffer.flush()
+
+    def close(self):
+        sys.stdout.buffer.flush()
+
+
+def _format_row(row):
+    return ','.join('' if value != value else str(value) for value in row) + '\n'
+
+
+async def replay(filepath, writer, speed=1.0):
+    """
+    Write the rows of a raw table to ``writer`` in real time.
+
+    Parameters:
+    - filepath: Raw table with a ``time`` column in seconds, ordered by time.
+    - writer: ``asyncio.StreamWriter`` or any object with ``write(bytes)`` and ``async drain()``.
+    - speed: Playback speed factor; 0 writes the rows as fast as possible.
+    """
+    df = read_table(filepath)
+    writer.write(_format_row(df.columns).encode())
+    times = df['time'].to_numpy()
+    start = time.monotonic()
+
+    for i, row in enumerate(df.itertuples(index=False, name=None)):
+        if speed:
+            delay = (times[i] - times[0]) / speed - (time.monotonic() - start)
+            # Rows due within the same millisecond are sent together
+            if delay > 1e-3:
+                await writer.drain()
+                await asyncio.sleep(delay)
+        writer.write(_format_row(row).encode())
+    await writer.drain()
+
+
+async def replay_to_socket(filepaths, host, port, speed=1.0):
+    """Replay every table over its own connection to ``host:port``, concurrently."""
+
+    async def send(filepath):
+        reader, writer = await asyncio.open_connection(host, port)
+        await replay(filepath, writer, speed)
+        writer.write_eof()
+        # Pass on whatever the server answers until it closes the connection
+        async for line in reader:
+            sys.stdout.write(line.decode())
+        writer.close()
+
+    await asyncio.gather(*(send(filepath) for filepath in filepaths))
+
+
+@click.command()
+@click.argument('filepaths', nargs=-1, required=True, type=click.Path(exists=True))
+@click.option('--speed', type=click.FloatRange(min=0), default=1.0, show_default=True,
+              help='Playback speed factor, 0 sends the rows as fast as possible.')
+@click.option('--port', type=int, default=None, help='Send every table to this TCP port instead of stdout.')
+@click.option('--host', default='127.0.0.1', show_default=True, help='Address to connect to with --port.')
+def main(filepaths, speed=1.0, port=None, host='127.0.0.1'):
+    """Replays raw session tables in real time."""
+    if port is None:
+        if len(filepaths) != 1:
+            raise click.UsageError('Only one table can be replayed to stdout, use --port for several.')
+        asyncio.run(replay(filepaths[0], _StdoutWriter(), speed))
+    else:
+        asyncio.run(replay_to_socket(filepaths, host, port, speed))
+
+
+if __name__ == '__main__':
+    log_fmt = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    logging.basicConfig(level=logging.INFO, format=log_fmt, stream=sys.stderr)
+
+    main()
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""Reading and writing of the raw and processed tables.
+
+Tables are stored as Parquet by default, with CSV kept as an export format.
+The format of a file is given by its extension. Parquet tables are written
+with a compact typed schema (float32 features, categorical labels) and can be
+read back with column projection and with filters pushed down to the reader,
+e.g. on ``ID``/``time_interval``. Parquet support requires ``pyarrow``.
+
+Appending to a Parquet table turns it into a directory of part files, which
+reads back as a single table.
+
+New formats can be plugged in with ``register_format``.
+"""
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+FORMATS = {}
+
+
+def register_format(name, extension, reader, writer, chunk_reader, appender, column_reader=None):
+    """
+    Make a table format available to ``read_table``/``write_table``.
+
+    Parameters:
+    - name: Format name, as accepted by the ``--format`` CLI options.
+    - extension: File extension of the format, including the dot.
+    - reader: ``reader(path, columns, filters)`` returning a DataFrame.
+    - writer: ``writer(df, path, compact)`` storing a DataFrame.
+    - chunk_reader: ``chunk_reader(path, chunksize)`` yielding DataFrames.
+    - appender: ``appender(df, path, compact)`` adding rows to an existing table.
+    - column_reader: ``column_reader(path)`` returning the column names without reading the rows,
+      by default the whole table is read.
+    """
+    FORMATS[name] = {'extension': extension, 'reader': reader, 'writer': writer, 'chunk_reader': chunk_reader,
+                     'appender': appender, 'column_reader': column_reader}
+
+
+def table_format(path):
+    """Name of the format of a file, or None if its extension is not a known table format."""
+    for name, table in FORMATS.items():
+        if str(path).endswith(table['extension']):
+            return name
+    return None
+
+
+def table_path(directory, name, format='parquet'):
+    """Path of the table ``name`` stored in ``directory`` with the given format."""
+    return os.path.join(directory, name + FORMATS[format]['extension'])
+
+
+def compact_dtypes(df):
+    """Cast floating point columns to float32 and text columns to categories."""
+    dtypes = {}
+    for col, dtype in df.dtypes.items():
+        if pd.api.types.is_float_dtype(dtype):
+            dtypes[col] = np.float32
+        elif pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype):
+            dtypes[col] = 'category'
+    return df.astype(dtypes)
+
+
+def _filter_rows(df, filters):
+    """Keep the rows whose values are allowed by every filter."""
+    if not filters:
+        return df
+    keep = np.ones(len(df), dtype=bool)
+    for col, values in filters.items():
+        keep &= df[col].isin(list(values)).to_numpy()
+    return df[keep].reset_index(drop=True)
+
+
+def _read_csv(path, columns=None, filters=None):
+    usecols = None
+    if columns is not None:
+        usecols = list(dict.fromkeys(list(columns) + list(filters or {})))
+    df = _filter_rows(pd.read_csv(path, usecols=usecols), filters)
+    return df if columns is None else df[list(columns)]
+
+
+def _write_csv(df, path, compact=True):
+    # Text has no dtypes, values are always exported at full precision
+    df.to_csv(path, index=False)
+
+
+def _csv_columns(path):
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def _iter_csv(path, chunksize):
+    with pd.read_csv(path, chunksize=chunksize) as reader:
+        yield from reader
+
+
+def _append_csv(df, path, compact=True):
+    header = pd.read_csv(path, nrows=0).columns
+    df[header].to_csv(path, mode='a', header=False, index=False)
+
+
+def _read_parquet(path, columns=None, filters=None):
+    pushdown = [(col, 'in', list(values)) for col, values in (filters or {}).items()]
+    df = pd.read_parquet(path, columns=None if columns is None else list(columns), filters=pushdown or None)
+    return df.reset_index(drop=True)
+
+
+def _write_parquet(df, path, compact=True):
+    if compact:
+        df = compact_dtypes(df)
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    df.to_parquet(path, index=False)
+
+
+def _parquet_columns(path):
+    import pyarrow.dataset as ds
+
+    return ds.dataset(path, format='parquet').schema.names
+
+
+def _iter_parquet(path, chunksize):
+    import pyarrow.dataset as ds
+
+    for batch in ds.dataset(path, format='parquet').to_batches(batch_size=chunksize):
+        yield batch.to_pandas()
+
+
+def _append_parquet(df, path, compact=True):
+    import pyarrow.dataset as ds
+
+    if os.path.isfile(path):
+        first_part = path + '.part'
+        os.replace(path, first_part)
+        os.mkdir(path)
+        os.replace(first_part, os.path.join(path, 'part-00000.parquet'))
+
+    columns = ds.dataset(path, format='parquet').schema.names
+    part = os.path.join(path, f'part-{len(os.listdir(path)):05d}.parquet')
+    _write_parquet(df[columns], part, compact)
+
+
+register_format('parquet', '.parquet', _read_parquet, _write_parquet, _iter_parquet, _append_parquet, _parquet_columns)
+register_format('csv', '.csv', _read_csv, _write_csv, _iter_csv, _append_csv, _csv_columns)
+
+
+def _format_of(path):
+    format = table_format(path)
+    if format is None:
+        raise ValueError(f'Unknown table format for {path}, expected one of {sorted(FORMATS)}')
+    return format
+
+
+def read_table(path, columns=None, filters=None):
+    """
+    Load a table, reading only what is asked for.
+
+    Parameters:
+    - path: File to read, its extension selects the format.
+    - columns: Columns to load, all of them by default.
+    - filters: A dictionary with column names as keys and the allowed values as
+      values, e.g. ``{'ID': ids, 'time_interval': range(1, 9)}``.
+
+    Returns:
+    - The selected rows and columns as a DataFrame.
+    """
+    return FORMATS[_format_of(path)]['reader'](path, columns, filters)
+
+
+def table_columns(path):
+    """Column names of a stored table, read from its header or schema when the format allows."""
+    column_reader = FORMATS[_format_of(path)]['column_reader']
+    if column_reader is None:
+        return list(read_table(path).columns)
+    return list(column_reader(path))
+
+
+def write_table(df, path, compact=True):
+    """Store a table, its extension selects the format.
+
+    With ``compact`` typed formats store floats as float32 and text as categories.
+    """
+    FORMATS[_format_of(path)]['writer'](df, path, compact)
+
+
+def append_table(df, path, compact=True):
+    """Add the rows of ``df`` to a stored table, creating it if needed.
+
+    ``df`` must hold the table's columns; they are written in the table's order.
+    """
+    if not os.path.exists(path):
+        write_table(df, path, compact)
+    else:
+        FORMATS[_format_of(path)]['appender'](df, path, compact)
+
+
+def iter_table_chunks(path, chunksize):
+    """Read a table ``chunksize`` rows at a time."""
+    return FORMATS[_format_of(path)]['chunk_reader'](path, chunksize)
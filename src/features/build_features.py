@@ -2,141 +2,131 @@
 import click
 import logging
 from pathlib import Path
-from dotenv import find_dotenv, load_dotenv
 import pandas as pd
-import numpy as np
 import os
-from scipy.spatial.distance import euclidean
-
-def get_all_files(data_path):
-    """Retrieve all files in the specified directory."""
-    all_files = []
-    for path, _, files in os.walk(data_path):
-        all_files.extend([os.path.join(path, name) for name in files])
-    return all_files
-
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+from src import profiling
+from src.data.manifest import DEFAULT_THREADS, scan, session_id
+from src.data.storage import FORMATS, read_table, table_path, write_table
+from src.features.cache import DEFAULT_MAX_BYTES, FeatureCache
+from src.features.interval_stats import ENGINES
+from src.features.kinematics import movement_kinematics
+from src.features.spectral import add_spectral_statistics
+from src.features.streaming import iter_interval_stats
+from src.features.traffic import traffic_features
 
 def extract_ids(filepath):
-    """Extract IDs from the file path."""
-    parts = filepath.split('\\') 
-    for part in parts:
-        if 'group' in part and 'order' in part and 'user' in part:
-            return part
-
-def feature_engineering(df, data_type):
-    if data_type=="movement":
-        # Calculate time deltas
-        df['Δt'] = df['time'].diff().shift(-1)  
-        df.loc[df.index[-1], 'Δt'] = df['Δt'].iloc[-2]
-        
-        segments = ['Head', 'LeftTouch', 'RightTouch']
-        
-        for segment in segments:
-            df[f'Velocity_{segment}PosX'] = df[f'{segment}PosX'].diff() / df['Δt']
-            df[f'Velocity_{segment}PosY'] = df[f'{segment}PosY'].diff() / df['Δt']
-            df[f'Velocity_{segment}PosZ'] = df[f'{segment}PosZ'].diff() / df['Δt']
-            df[f'{segment}_Velocity'] = np.sqrt(sum(df[col]**2 for col in [f'Velocity_{segment}PosX', f'Velocity_{segment}PosY',f'Velocity_{segment}PosZ']))
-
+    """Extract IDs from the file path, e.g. ``group1_order2_user3``, with either path separator."""
+    return session_id(filepath)
 
-            df[f'Accel_{segment}PosX'] = df[f'Velocity_{segment}PosX'].diff() / df['Δt']
-            df[f'Accel_{segment}PosY'] = df[f'Velocity_{segment}PosY'].diff() / df['Δt']
-            df[f'Accel_{segment}PosZ'] = df[f'Velocity_{segment}PosZ'].diff() / df['Δt']
+def raw_datasets(input_filepath, manifest_path=None, threads=DEFAULT_THREADS):
+    """
+    Raw tables of the participants under ``input_filepath``, grouped into the statistics datasets.
 
-            df[f'{segment}_OrientationVelocityX'] = df[f'{segment}OrientationX'].diff() / df['Δt']
-            df[f'{segment}_OrientationVelocityY'] = df[f'{segment}OrientationY'].diff() / df['Δt']
-            df[f'{segment}_OrientationVelocityZ'] = df[f'{segment}OrientationZ'].diff() / df['Δt']
+    Parameters:
+    - input_filepath: Raw data directory.
+    - manifest_path: Index of the raw tables, refreshed instead of listing the whole tree; see ``Manifest``.
+    - threads: Number of threads listing directories.
 
-            df[f'{segment}_OrientationAccelX'] = df[f'{segment}_OrientationVelocityX'].diff() / df['Δt']
-            df[f'{segment}_OrientationAccelY'] = df[f'{segment}_OrientationVelocityY'].diff() / df['Δt']
-            df[f'{segment}_OrientationAccelZ'] = df[f'{segment}_OrientationVelocityZ'].diff() / df['Δt']
+    Returns:
+    - A dictionary with dataset names as keys and ``(filepaths, data_type)`` as values.
+    """
+    # Fast/slow movement and traffic data are processed together
+    return scan(input_filepath, manifest_path, threads).datasets()
 
-        
-        
-        # Relative Positioning and Distance Features
-        for pair in [('LeftTouch', 'Head'), ('RightTouch', 'Head'), ('LeftTouch', 'RightTouch')]:
-            segment1, segment2 = pair
-            # Calculate Euclidean distance between pairs of segments for each row
-            df[f'distance_{segment1}_to_{segment2}'] = df.apply(lambda row: euclidean(
-                (row[f'{segment1}PosX'], row[f'{segment1}PosY'], row[f'{segment1}PosZ']),
-                (row[f'{segment2}PosX'], row[f'{segment2}PosY'], row[f'{segment2}PosZ'])
-            ), axis=1)
+def feature_engineering(df, data_type, segments=None):
+    if data_type=="movement":
+        # Velocities, accelerations, orientation derivatives and relative
+        # distances of the tracked segments, computed in bulk
+        df = pd.concat([df, movement_kinematics(df, segments)], axis=1)
     if data_type=="traffic":
-        df['Δt'] = df['time'].diff().fillna(0) 
-
-        # Traffic Flow Features
-        df['size_cumsum'] = df.groupby('direction')['size'].cumsum()
-        df['size_rate'] = df['size'] / df['Δt'].replace({0: np.nan})
-        df['packet_count'] = df.groupby('direction').cumcount() + 1
-
-    # Drop the temporary Δt column
-    df.drop(columns=["Δt"], inplace=True)
+        # Traffic flow features: running totals, inter-arrival times, bursts
+        # and windowed rates per direction, in one pass over the packets
+        df = pd.concat([df, traffic_features(df)], axis=1)
     return df
 
         
 
 
-def process_data(filepaths, time_window, data_type):
-    result_stat = pd.DataFrame()
-
-    for filepath in filepaths:
-        df = pd.read_csv(filepath)
+def process_file(filepath, time_window, data_type, engine='groupby', chunksize=None, spectral=False):
+    """Engineer the features of one session file and summarise its time intervals.
+
+    With ``chunksize`` the file is streamed ``chunksize`` rows at a time instead
+    of being loaded whole, see ``streaming.iter_interval_stats``. With
+    ``spectral`` movement intervals also get frequency-domain features, see
+    ``spectral.spectral_statistics``.
+    """
+    if chunksize:
+        with profiling.stage('stream', file=filepath):
+            frames = list(iter_interval_stats(filepath, extract_ids(filepath), time_window, data_type, engine,
+                                              chunksize, spectral))
+            return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    with profiling.stage('read', file=filepath) as span:
+        df = read_table(filepath)
+        span.count(len(df))
+    with profiling.stage('kinematics' if data_type == "movement" else 'traffic_features', file=filepath) as span:
         df = feature_engineering(df, data_type)
-
-        df['time_interval'] = (df['time'] / 10).astype(int)
-        max_interval = time_window * 6
-        df = df[df['time_interval'] < max_interval]
-
-        interval_stats = pd.DataFrame()
-
-        for interval in range(max_interval):
-            interval_df = df[df['time_interval'] == interval].drop(columns=['time', 'time_interval'])
-            if interval_df.empty:
-                continue
-
-            num_cols = interval_df.select_dtypes(include=['number']).columns
-            cat_cols = interval_df.select_dtypes(exclude=['number']).columns
-
-            stats = pd.DataFrame()
-
-            if not num_cols.empty:
-                num_stats = interval_df[num_cols].describe().transpose()
-                num_stats['skew'] = interval_df[num_cols].skew()
-                num_stats['kurtosis'] = interval_df[num_cols].kurtosis()
-                stats = pd.concat([stats, num_stats.drop(columns=['count']).stack().to_frame().T], axis=1)
-
-            if not cat_cols.empty:
-                cat_stats = pd.DataFrame(index=[0])  # Ensure a single-row DataFrame for concatenation
-                for col in cat_cols:
-                    # Calculate mode and handle if the mode series is empty
-                    mode_series = interval_df[col].mode()
-                    if mode_series.empty:
-                        mode_val = np.nan
-                    else:
-                        mode_val = mode_series[0]
-
-                    # Add calculated statistics to the cat_stats DataFrame
-                    cat_stats[col + '_mode'] = [mode_val]  # Mode value
-
-                    # Count each category and add as separate columns
-                    category_counts = interval_df[col].value_counts()
-                    for category, count in category_counts.items():
-                        # Format the column name to include the category name, making it URL-friendly
-                        category_name = str(category).replace(" ", "_").replace("/", "_").lower()
-                        cat_stats[f'{col}_count_{category_name}'] = count
-
-                stats = pd.concat([stats, cat_stats], axis=1)
-
-
-            if stats.empty:
-                continue
-
-            ids = extract_ids(filepath)
-            stats['time_interval'] =int(interval/ 6) + 1 
-            stats['ID'] = ids
-
-            interval_stats = pd.concat([interval_stats, stats], ignore_index=True)
-
-        result_stat = pd.concat([result_stat, interval_stats], ignore_index=True)
+        span.count(len(df))
+
+    df['time_interval'] = (df['time'] / 10).astype(int)
+    max_interval = time_window * 6
+    df = df[(df['time_interval'] >= 0) & (df['time_interval'] < max_interval)]
+
+    with profiling.stage('interval_stats', file=filepath, engine=engine) as span:
+        interval_stats = ENGINES[engine](df, extract_ids(filepath))
+        span.count(len(df))
+    if spectral and data_type == "movement":
+        with profiling.stage('spectral', file=filepath) as span:
+            interval_stats = add_spectral_statistics(interval_stats, df)
+            span.count(len(df))
+    return interval_stats
+
+
+def _process_task(task):
+    """Run ``process_file`` for a pool task, returning the error instead of raising.
+
+    With ``profile`` the task records its stages into a profiler of its own, for tasks
+    run in worker processes.
+
+    Returns ``(name, filepath, interval_stats, error, cache_hit, events)``, ``events`` being
+    the profiling records of a ``profile`` task.
+    """
+    name, filepath, time_window, data_type, engine, chunksize, cache, spectral, profile = task
+    # A worker process records into its own profiler, whose events the parent merges
+    profiler = profiling.enable() if profile else None
+    try:
+        with profiling.stage('file', file=filepath, dataset=name):
+            result = _process_file_task(name, filepath, time_window, data_type, engine, chunksize, cache, spectral)
+    finally:
+        if profile:
+            profiling.disable()
+    return result + (profiler.events if profile else [],)
+
+
+def _process_file_task(name, filepath, time_window, data_type, engine, chunksize, cache, spectral):
+    try:
+        if cache is not None:
+            key = cache.key(filepath, data_type=data_type, time_window=time_window, ids=extract_ids(filepath),
+                            spectral=spectral)
+            interval_stats = cache.get(key)
+            if interval_stats is not None:
+                return name, filepath, interval_stats, None, True
+
+        interval_stats = process_file(filepath, time_window, data_type, engine, chunksize, spectral)
+        if cache is not None:
+            cache.put(key, interval_stats)
+        return name, filepath, interval_stats, None, False
+    except Exception:
+        return name, filepath, None, traceback.format_exc(), False
+
+
+def combine_stats(frames):
+    """Concatenate per-file interval statistics into one flat-column dataset."""
+    frames = [frame for frame in frames if not frame.empty]
+    result_stat = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
 
     new_columns = ['_'.join(col) if isinstance(col, tuple) else col for col in result_stat.columns]
     result_stat.columns = new_columns
@@ -145,46 +135,127 @@ def process_data(filepaths, time_window, data_type):
     return result_stat
 
 
+def process_datasets(datasets, time_window, engine='groupby', workers=1, chunksize=None, cache=None, spectral=False):
+    """
+    Extract the interval statistics of several datasets at once.
+
+    Parameters:
+    - datasets: A dictionary with dataset names as keys and ``(filepaths, data_type)`` as values.
+    - time_window: Number of minutes kept from the start of each session.
+    - engine: Interval statistics implementation, see ``interval_stats.ENGINES``.
+    - workers: Number of processes; every file of every dataset is a separate task.
+    - chunksize: Stream raw files this many rows at a time instead of loading them whole.
+    - cache: Optional ``FeatureCache``; only new or changed files are processed.
+    - spectral: Add frequency-domain features to the movement statistics.
+
+    Returns:
+    - A dictionary with dataset names as keys and statistics DataFrames as values,
+      rows ordered as the given filepaths. Files that fail are logged and skipped.
+    """
+    logger = logging.getLogger(__name__)
+    tasks = [(name, filepath, time_window, data_type, engine, chunksize, cache, spectral)
+             for name, (filepaths, data_type) in datasets.items()
+             for filepath in filepaths]
+    parallel = workers > 1 and len(tasks) > 1
+    # Worker processes profile into their own profiler when the parent does
+    profile = parallel and profiling.active() is not None
+    tasks = [task + (profile,) for task in tasks]
+
+    if parallel:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_process_task, tasks))
+    else:
+        results = [_process_task(task) for task in tasks]
+
+    frames = {name: [] for name in datasets}
+    failed = []
+    hits = 0
+    for name, filepath, interval_stats, error, cache_hit, events in results:
+        if events:
+            profiling.active().extend(events)
+        profiling.count('files')
+        profiling.count('cache_hits', cache_hit)
+        if error is not None:
+            logger.error('Failed to process %s:\n%s', filepath, error)
+            failed.append(filepath)
+            continue
+        frames[name].append(interval_stats)
+        hits += cache_hit
+
+    if failed:
+        logger.warning('%d of %d files failed and were skipped', len(failed), len(tasks))
+    if cache is not None:
+        logger.info('Feature cache: %d hits, %d misses', hits, len(tasks) - len(failed) - hits)
+        cache.evict()
+
+    with profiling.stage('combine') as span:
+        combined = {name: combine_stats(name_frames) for name, name_frames in frames.items()}
+        span.count(sum(len(df) for df in combined.values()))
+    return combined
+
+
+def process_data(filepaths, time_window, data_type, engine='groupby', workers=1, chunksize=None, cache=None,
+                 spectral=False):
+    """Extract the interval statistics of a single dataset, see ``process_datasets``."""
+    datasets = {data_type: (filepaths, data_type)}
+    return process_datasets(datasets, time_window, engine, workers, chunksize, cache, spectral)[data_type]
+
+
 
 @click.command()
 @click.argument('input_filepath', type=click.Path(exists=True))
 @click.argument('output_filepath', type=click.Path())
 @click.argument('time_window', type=int)
-def main(input_filepath, output_filepath, time_window = 10):
+@click.option('--engine', type=click.Choice(sorted(ENGINES)), default='groupby', show_default=True,
+              help='Interval statistics implementation.')
+@click.option('--workers', type=click.IntRange(min=1), default=1, show_default=True,
+              help='Number of processes extracting features in parallel.')
+@click.option('--chunksize', type=click.IntRange(min=1), default=None,
+              help='Stream raw files this many rows at a time instead of loading them whole.')
+@click.option('--format', type=click.Choice(sorted(FORMATS)), default='parquet', show_default=True,
+              help='Storage format of the statistics datasets.')
+@click.option('--cache-dir', type=click.Path(file_okay=False), default=None,
+              help='Reuse the features of unchanged raw files cached in this directory.')
+@click.option('--cache-size', type=click.IntRange(min=0), default=DEFAULT_MAX_BYTES // 1024 ** 2, show_default=True,
+              help='Size budget of the feature cache in MB.')
+@click.option('--spectral', is_flag=True, help='Add frequency-domain features to the movement statistics.')
+@click.option('--profile', is_flag=True,
+              help='Time every stage, log a summary and save a Chrome trace next to the datasets.')
+@click.option('--manifest', 'manifest_path', type=click.Path(dir_okay=False), default=None,
+              help='Index of the raw files, refreshed instead of listing the whole raw tree.')
+@click.option('--threads', type=click.IntRange(min=1), default=DEFAULT_THREADS, show_default=True,
+              help='Number of threads listing the raw directories, e.g. on network-mounted trees.')
+def main(input_filepath, output_filepath, time_window = 10, engine='groupby', workers=1, chunksize=None,
+         format='parquet', cache_dir=None, cache_size=DEFAULT_MAX_BYTES // 1024 ** 2, spectral=False, profile=False,
+         manifest_path=None, threads=DEFAULT_THREADS):
     """Runs data processing scripts to extract features from raw data."""
     logger = logging.getLogger(__name__)
+    profiler = profiling.enable() if profile else None
     logger.info('Making final statistical summary dataset from raw data')
 
-    # Get all files related to the participants' data
-    all_files = get_all_files(input_filepath)
-
-    # Separate traffic data and movement data paths
-    traffic_data = [x for x in all_files if '_traffic.csv' in x]
-    movement_data = [x for x in all_files if '_movement.csv' in x]
-
-    # # # Process movement data
-    logger.info('Processing Fast Movement Data')
-    movement_fast_stat = process_data([filepath for filepath in movement_data if 'fast' in filepath],time_window,"movement")
-    logger.info('Processing Slow Movement Data')
-    movement_slow_stat = process_data([filepath for filepath in movement_data if 'slow' in filepath], time_window,"movement")
-
-    # # Process traffic data
-    logger.info('Processing Fast Traffic Data')
-    traffic_fast_stat = process_data([filepath for filepath in traffic_data if 'fast' in filepath], time_window,"traffic")
-    logger.info('Processing Slow Traffic Data')
-    traffic_slow_stat = process_data([filepath for filepath in traffic_data if 'slow' in filepath], time_window,"traffic")
+    datasets = raw_datasets(input_filepath, manifest_path, threads)
+    logger.info('Processing %d files with %d worker(s)',
+                sum(len(filepaths) for filepaths, _ in datasets.values()), workers)
+    cache = FeatureCache(cache_dir, cache_size * 1024 ** 2) if cache_dir else None
+    results = process_datasets(datasets, time_window, engine, workers, chunksize, cache, spectral)
 
     # # Save the resulting dataframes
-    movement_fast_stat.to_csv(output_filepath + 'movement_fast_stat.csv', index=False)
-    movement_slow_stat.to_csv(output_filepath + 'movement_slow_stat.csv', index=False)
-    traffic_fast_stat.to_csv(output_filepath + 'traffic_fast_stat.csv', index=False)
-    traffic_slow_stat.to_csv(output_filepath + 'traffic_slow_stat.csv', index=False)
+    for name, result_stat in results.items():
+        with profiling.stage('write', dataset=name) as span:
+            write_table(result_stat, table_path(output_filepath, name, format))
+            span.count(len(result_stat))
 
 
     logger.info('Save processed data')
+    if profiler is not None:
+        profiling.disable()
+        profiler.write_trace(os.path.join(output_filepath, 'build_features_trace.json'))
+        logger.info('Stage profile:\n%s', profiler.summary().to_string(index=False, float_format='%.3f'))
 
 
 if __name__ == '__main__':
+    from dotenv import find_dotenv, load_dotenv
+
     log_fmt = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     logging.basicConfig(level=logging.INFO, format=log_fmt)
 
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""Content-addressed on-disk cache of per-file interval statistics.
+
+Entries are keyed by the SHA-256 of the raw file's content together with the
+parameters the statistics depend on and ``FEATURE_VERSION``, so renamed or
+touched files still hit and edited files miss. The cache directory is kept
+under a size budget by evicting the least recently used entries.
+"""
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+import pandas as pd
+
+# Bump whenever feature_engineering or the interval statistics change their output
+FEATURE_VERSION = 2
+
+DEFAULT_MAX_BYTES = 1024 ** 3
+
+
+def file_digest(filepath, block_size=1 << 20):
+    """SHA-256 hex digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class FeatureCache:
+    """Per-file feature cache stored as pickles in ``directory``.
+
+    Entries are written atomically, so worker processes can share a cache.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def key(self, filepath, **params):
+        """Cache key of a raw file processed with the given parameters."""
+        params = json.dumps(dict(params, version=FEATURE_VERSION), sort_keys=True)
+        return hashlib.sha256(f'{file_digest(filepath)}:{params}'.encode()).hexdigest()
+
+    def _path(self, key):
+        return self.directory / f'{key}.pkl'
+
+    def get(self, key):
+        """Cached DataFrame of ``key``, or None on a miss. Unreadable entries are removed and count as misses."""
+        path = self._path(key)
+        try:
+            df = pd.read_pickle(path)
+        except FileNotFoundError:
+            return None
+        except Exception as error:
+            # Truncated, corrupted or written by an incompatible pandas: recompute rather than fail the build
+            logging.getLogger(__name__).warning('Removing unreadable cache entry %s: %s', path, error)
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            return None
+        # Record the access for LRU eviction
+        os.utime(path)
+        return df
+
+    def put(self, key, df):
+        """Store the DataFrame of ``key``."""
+        path = self._path(key)
+        tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+        df.to_pickle(tmp_path)
+        os.replace(tmp_path, path)
+
+    def evict(self):
+        """Delete the least recently used entries until the cache fits in ``max_bytes``."""
+        entries = []
+        for path in self.directory.glob('*.pkl'):
+            stat = path.stat()
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            evicted += 1
+
+        if evicted:
+            logging.getLogger(__name__).info('Evicted %d feature cache entries', evicted)
+        return evicted
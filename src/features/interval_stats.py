@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""Per-interval summary statistics of the engineered session features.
+
+Two interchangeable engines are provided. ``interval_statistics_loop`` is the
+original implementation that filters, describes and concatenates one
+``time_interval`` bucket at a time. ``interval_statistics`` computes the same
+columns for every bucket in a single grouped pass and is the default engine
+used by ``build_features.process_data``.
+"""
+import numpy as np
+import pandas as pd
+
+NUM_STATS = ['mean', 'std', 'min', '25%', '50%', '75%', 'max', 'skew', 'kurtosis']
+QUANTILES = [0.25, 0.5, 0.75]
+
+
+def category_column_name(col, category):
+    """Format the count column name of a category, making it URL-friendly."""
+    category_name = str(category).replace(" ", "_").replace("/", "_").lower()
+    return f'{col}_count_{category_name}'
+
+
+def _zero_out_fperr(moment, tolerance):
+    """Treat central moments within rounding error of zero as exactly zero."""
+    return np.where(np.abs(moment) < tolerance, 0, moment)
+
+
+def _grouped_moments(values, starts, sizes):
+    """Count, mean and central moment sums of every column of each group.
+
+    ``values`` must already be ordered by group, ``starts`` holding the first
+    row of each group and ``sizes`` its number of rows. Missing values are
+    skipped the same way pandas' ``nanops`` does, so the results match
+    ``Series.mean``/``std``/``skew``/``kurtosis`` on each group.
+    """
+    mask = np.isnan(values)
+    filled = np.where(mask, 0.0, values)
+
+    count = np.add.reduceat(~mask, starts, axis=0).astype(np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.add.reduceat(filled, starts, axis=0) / count
+        adjusted = filled - np.repeat(mean, sizes, axis=0)
+    adjusted[mask] = 0
+    adjusted2 = adjusted ** 2
+
+    m2 = np.add.reduceat(adjusted2, starts, axis=0)
+    m3 = np.add.reduceat(adjusted2 * adjusted, starts, axis=0)
+    m4 = np.add.reduceat(adjusted2 ** 2, starts, axis=0)
+
+    max_abs = np.fmax.reduceat(np.abs(filled), starts, axis=0)
+    eps = np.finfo(np.float64).eps
+    m2 = _zero_out_fperr(m2, ((eps * max_abs) ** 2) * count)
+    m3 = _zero_out_fperr(m3, ((eps * max_abs) ** 3) * count)
+    m4 = _zero_out_fperr(m4, ((eps * max_abs) ** 4) * count)
+    return count, mean, m2, m3, m4
+
+
+def moments_to_stats(count, mean, m2, m3, m4):
+    """Sample std, skewness and excess kurtosis from central moment sums."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        std = np.sqrt(m2 / (count - 1))
+        skew = (count * (count - 1) ** 0.5 / (count - 2)) * (m3 / m2 ** 1.5)
+        adj = 3 * (count - 1) ** 2 / ((count - 2) * (count - 3))
+        numerator = count * (count + 1) * (count - 1) * m4
+        denominator = (count - 2) * (count - 3) * m2 ** 2
+        kurtosis = numerator / denominator - adj
+
+    std[count <= 1] = np.nan
+    skew = np.where(m2 == 0, 0, skew)
+    skew[count < 3] = np.nan
+    kurtosis = np.where(denominator == 0, 0, kurtosis)
+    kurtosis[count < 4] = np.nan
+    return std, skew, kurtosis
+
+
+def _numeric_statistics(num_df, keys):
+    """``describe()`` + skew + kurtosis of every column for each interval."""
+    values = num_df.to_numpy(dtype=np.float64)
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    values = values[order]
+
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    sizes = np.diff(np.r_[starts, len(sorted_keys)])
+
+    count, mean, m2, m3, m4 = _grouped_moments(values, starts, sizes)
+    std, skew, kurtosis = moments_to_stats(count, mean, m2, m3, m4)
+    minimum = np.fmin.reduceat(values, starts, axis=0)
+    maximum = np.fmax.reduceat(values, starts, axis=0)
+
+    quantiles = (pd.DataFrame(values, columns=range(values.shape[1]))
+                 .groupby(sorted_keys, sort=True)
+                 .quantile(QUANTILES))
+    q25, q50, q75 = (quantiles.xs(q, level=1).to_numpy() for q in QUANTILES)
+
+    # Stat-major (groups, stats, columns) -> column-major (groups, columns * stats)
+    stats = np.stack([mean, std, minimum, q25, q50, q75, maximum, skew, kurtosis], axis=2)
+    stats = stats.reshape(len(starts), -1)
+
+    columns = pd.MultiIndex.from_product([num_df.columns, NUM_STATS])
+    return pd.DataFrame(stats, index=sorted_keys[starts], columns=columns)
+
+
+def category_statistics(counts, first_rows, intervals):
+    """
+    Mode and count columns of the categorical columns, ordered as ``interval_statistics_loop`` adds them.
+
+    The loop concatenates one row per interval, whose count columns come in ``value_counts()``
+    order: by decreasing count, ties by first appearance. The categories of the first interval
+    therefore follow their mode column, and the categories first seen in a later interval are
+    appended after every other column, interval by interval.
+
+    Parameters:
+    - counts: Per column, a DataFrame of category counts with one row per interval and sorted categories.
+    - first_rows: Per column, the row each category first appears at in each interval, NaN where it
+      is absent, in the layout of ``counts``.
+    - intervals: Indexes of the intervals, in time order.
+
+    Returns:
+    - The mode and the count columns of the first interval's categories, and the count columns of
+      the later categories, which go after ``time_interval`` and ``ID``.
+    """
+    cat_stats = pd.DataFrame(index=intervals)
+    late = []
+    for position, (col, col_counts) in enumerate(counts.items()):
+        col_counts = col_counts.loc[:, col_counts.sum() > 0]
+        if col_counts.empty:
+            cat_stats[col + '_mode'] = np.nan
+            continue
+        present = col_counts > 0
+        # Categories are sorted, so the first maximum is the value ``Series.mode()[0]`` returns
+        cat_stats[col + '_mode'] = pd.Series(
+            col_counts.idxmax(axis=1).where(present.any(axis=1)).to_numpy(), index=intervals)
+
+        # Counts stay integers unless the category is missing from an interval, as in the loop's rows
+        wide = col_counts.where(present).astype(np.float64)
+        wide = wide.astype({category: np.int64 for category in col_counts.columns[present.all().to_numpy()]})
+        wide.columns = [category_column_name(col, category) for category in col_counts.columns]
+        wide.index = intervals
+
+        # Each category is ranked within the interval it first appears in
+        categories = np.arange(col_counts.shape[1])
+        first_interval = present.to_numpy().argmax(axis=0)
+        count = col_counts.to_numpy()[first_interval, categories]
+        first_row = first_rows[col][col_counts.columns].to_numpy()[first_interval, categories]
+        order = np.lexsort((first_row, -count, first_interval))
+        cat_stats = pd.concat([cat_stats, wide.iloc[:, [k for k in order if first_interval[k] == 0]]], axis=1)
+        late += [(first_interval[k], position, rank, wide.iloc[:, k])
+                 for rank, k in enumerate(order) if first_interval[k] > 0]
+
+    late.sort(key=lambda item: item[:3])
+    late = pd.concat([column for *_, column in late], axis=1) if late else pd.DataFrame(index=intervals)
+    return cat_stats, late
+
+
+def _categorical_statistics(cat_df, keys):
+    """Mode and per-category counts of every column for each interval, see ``category_statistics``."""
+    intervals = np.unique(keys)
+    rows = np.arange(len(keys))
+    counts, first_rows = {}, {}
+    for col in cat_df.columns:
+        values = cat_df[col].to_numpy()
+        counts[col] = pd.crosstab(keys, values).reindex(index=intervals, fill_value=0)
+        first_rows[col] = pd.Series(rows).groupby([keys, values]).min().unstack().reindex(
+            index=intervals, columns=counts[col].columns)
+    return category_statistics(counts, first_rows, intervals)
+
+
+def interval_statistics(df, ids):
+    """Summarise every ``time_interval`` bucket of one session in a single pass.
+
+    Parameters:
+    - df: Engineered features of one session, with ``time`` and ``time_interval`` columns.
+    - ids: Identifier of the session, stored in the ``ID`` column.
+
+    Returns:
+    - A DataFrame with one row per non-empty bucket and the same columns as
+      ``interval_statistics_loop``.
+    """
+    if df.empty:
+        return pd.DataFrame()
+
+    keys = df['time_interval'].to_numpy()
+    features = df.drop(columns=['time', 'time_interval'])
+    num_cols = features.select_dtypes(include=['number']).columns
+    cat_cols = features.select_dtypes(exclude=['number']).columns
+
+    parts, late = [], None
+    if not num_cols.empty:
+        parts.append(_numeric_statistics(features[num_cols], keys))
+    if not cat_cols.empty:
+        cat_stats, late = _categorical_statistics(features[cat_cols], keys)
+        parts.append(cat_stats)
+    if not parts:
+        return pd.DataFrame()
+    stats = pd.concat(parts, axis=1)
+
+    stats['time_interval'] = stats.index // 6 + 1
+    stats['ID'] = ids
+    if late is not None and not late.empty:
+        stats = pd.concat([stats, late], axis=1)
+    return stats.reset_index(drop=True)
+
+
+def interval_statistics_loop(df, ids):
+    """Summarise every ``time_interval`` bucket of one session, one bucket at a time."""
+    interval_stats = pd.DataFrame()
+
+    for interval in np.unique(df['time_interval']):
+        interval_df = df[df['time_interval'] == interval].drop(columns=['time', 'time_interval'])
+        if interval_df.empty:
+            continue
+
+        num_cols = interval_df.select_dtypes(include=['number']).columns
+        cat_cols = interval_df.select_dtypes(exclude=['number']).columns
+
+        stats = pd.DataFrame()
+
+        if not num_cols.empty:
+            num_stats = interval_df[num_cols].describe().transpose()
+            num_stats['skew'] = interval_df[num_cols].skew()
+            num_stats['kurtosis'] = interval_df[num_cols].kurtosis()
+            stats = pd.concat([stats, num_stats.drop(columns=['count']).stack().to_frame().T], axis=1)
+
+        if not cat_cols.empty:
+            cat_stats = pd.DataFrame(index=[0])  # Ensure a single-row DataFrame for concatenation
+            for col in cat_cols:
+                # Calculate mode and handle if the mode series is empty
+                mode_series = interval_df[col].mode()
+                if mode_series.empty:
+                    mode_val = np.nan
+                else:
+                    mode_val = mode_series[0]
+
+                # Add calculated statistics to the cat_stats DataFrame
+                cat_stats[col + '_mode'] = [mode_val]  # Mode value
+
+                # Count each category and add as separate columns
+                category_counts = interval_df[col].value_counts()
+                for category, count in category_counts.items():
+                    cat_stats[category_column_name(col, category)] = count
+
+            stats = pd.concat([stats, cat_stats], axis=1)
+
+        if stats.empty:
+            continue
+
+        stats['time_interval'] = int(interval / 6) + 1
+        stats['ID'] = ids
+
+        interval_stats = pd.concat([interval_stats, stats], ignore_index=True)
+
+    return interval_stats
+
+
+ENGINES = {
+    'groupby': interval_statistics,
+    'loop': interval_statistics_loop,
+}
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""Vectorised movement kinematics of the tracked segments.
+
+All segments are processed together as ``(rows, segments, 3)`` float arrays,
+so velocities, accelerations, orientation derivatives and pairwise distances
+cost a handful of NumPy operations per file instead of a Python call per row.
+"""
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+SEGMENTS = ['Head', 'LeftTouch', 'RightTouch']
+PAIRS = [('LeftTouch', 'Head'), ('RightTouch', 'Head'), ('LeftTouch', 'RightTouch')]
+AXES = ['X', 'Y', 'Z']
+
+
+def time_deltas(time):
+    """Forward time difference of each sample, repeating the last one at the end."""
+    time = np.asarray(time, dtype=np.float64)
+    dt = np.full(len(time), np.nan)
+    dt[:-1] = np.diff(time)
+    if len(time) > 1:
+        dt[-1] = dt[-2]
+    return dt
+
+
+def block_columns(segments, channel):
+    """Names of the X/Y/Z columns of a channel, segment by segment."""
+    return [f'{segment}{channel}{axis}' for segment in segments for axis in AXES]
+
+
+def _segment_block(df, segments, channel):
+    """Stack the X/Y/Z columns of a channel into a ``(rows, segments, 3)`` array."""
+    columns = block_columns(segments, channel)
+    return np.ascontiguousarray(df[columns].to_numpy(dtype=np.float64)).reshape(len(df), len(segments), 3)
+
+
+def resolve_pairs(segments=None, pairs=None):
+    """Default segments and pairs, see ``movement_kinematics``."""
+    if segments is None:
+        return SEGMENTS, PAIRS if pairs is None else pairs
+    if pairs is None:
+        return segments, list(combinations(segments, 2))
+    return segments, pairs
+
+
+def _derivative(values, dt):
+    """Backward difference along the rows divided by the (forward) time delta."""
+    out = np.full_like(values, np.nan)
+    # Repeated timestamps give infinite velocities, whose differences are NaN as with ``diff()``
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out[1:] = values[1:] - values[:-1]
+        out /= dt[:, None, None]
+    return out
+
+
+def _norm(vectors):
+    """Euclidean norm over the last axis."""
+    return np.sqrt(vectors[..., 0] ** 2 + vectors[..., 1] ** 2 + vectors[..., 2] ** 2)
+
+
+def movement_kinematics(df, segments=None, pairs=None):
+    """Compute the derived movement features of one session.
+
+    Parameters:
+    - df: Raw movement samples with ``time`` and ``<segment>Pos*``/``<segment>Orientation*`` columns.
+    - segments: Tracked segments, defaults to Head/LeftTouch/RightTouch.
+    - pairs: Segment pairs to measure distances between. Defaults to ``PAIRS``
+      for the default segments and to every combination of ``segments`` otherwise.
+
+    Returns:
+    - A DataFrame aligned with ``df`` holding the new feature columns, in the
+      same order ``feature_engineering`` has always produced them.
+    """
+    segments, pairs = resolve_pairs(segments, pairs)
+    position = _segment_block(df, segments, 'Pos')
+    orientation = _segment_block(df, segments, 'Orientation')
+    features = kinematic_features(df['time'], position, orientation, segments, pairs)
+    return pd.DataFrame(features, index=df.index)
+
+
+def kinematic_features(time, position, orientation, segments, pairs):
+    """Array core of ``movement_kinematics``.
+
+    Parameters:
+    - time: Sample times.
+    - position, orientation: ``(rows, segments, 3)`` arrays of the tracked segments.
+
+    Returns:
+    - A dictionary with the feature names as keys and one array per feature as values.
+    """
+    dt = time_deltas(time)
+    velocity = _derivative(position, dt)
+    speed = _norm(velocity)
+    acceleration = _derivative(velocity, dt)
+    orientation_velocity = _derivative(orientation, dt)
+    orientation_accel = _derivative(orientation_velocity, dt)
+
+    features = {}
+    for i, segment in enumerate(segments):
+        for j, axis in enumerate(AXES):
+            features[f'Velocity_{segment}Pos{axis}'] = velocity[:, i, j]
+        features[f'{segment}_Velocity'] = speed[:, i]
+        for j, axis in enumerate(AXES):
+            features[f'Accel_{segment}Pos{axis}'] = acceleration[:, i, j]
+        for j, axis in enumerate(AXES):
+            features[f'{segment}_OrientationVelocity{axis}'] = orientation_velocity[:, i, j]
+        for j, axis in enumerate(AXES):
+            features[f'{segment}_OrientationAccel{axis}'] = orientation_accel[:, i, j]
+
+    index = {segment: i for i, segment in enumerate(segments)}
+    for segment1, segment2 in pairs:
+        offset = position[:, index[segment1]] - position[:, index[segment2]]
+        features[f'distance_{segment1}_to_{segment2}'] = _norm(offset)
+    return features
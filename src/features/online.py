@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+"""Incremental features and interval statistics of live telemetry.
+
+``OnlineSession`` consumes one raw movement/traffic sample at a time, derives
+the features ``build_features.feature_engineering`` computes and folds them
+into the statistics of the current 10 second interval. Mean, std, skewness and
+kurtosis come from running central moments and quantiles from a fixed-size
+reservoir sample, so the work and memory per sample are bounded however long
+an interval is. Quantiles are exact while an interval holds at most
+``reservoir`` samples.
+
+The statistics of a closed interval use the same flattened column names as the
+``*_stat`` datasets, so they can be cleaned with a fitted ``Preprocessor``.
+Columns are numeric or categorical as ``read_csv`` would type them: the rows of
+the first interval are held until it closes, and a column holding text in any
+of them, or listed in ``CATEGORICAL_COLUMNS``, is categorical.
+"""
+import math
+import random
+import warnings
+from collections import Counter, deque
+
+import numpy as np
+
+from src.features.interval_stats import NUM_STATS, QUANTILES, _zero_out_fperr, category_column_name, moments_to_stats
+from src.features.kinematics import block_columns, kinematic_features, resolve_pairs
+from src.features.streaming import MOVEMENT_CONTEXT
+from src.features.traffic import TrafficEngine
+
+DEFAULT_RESERVOIR = 1024
+
+# Raw columns of each data type that are categorical even when their values are missing
+CATEGORICAL_COLUMNS = {
+    'traffic': ['direction'],
+}
+
+
+def parse_value(text):
+    """Parse a CSV field the way ``read_csv`` infers it: a float if possible, otherwise text."""
+    if text == '':
+        return math.nan
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+class MovementFeatures:
+    """Movement derivatives of one sample at a time.
+
+    A sample is emitted once the next one arrives, since its time delta looks one sample ahead.
+    """
+
+    def __init__(self, columns, segments=None):
+        self.columns = list(columns)
+        self.segments, self.pairs = resolve_pairs(segments)
+        index = {col: i for i, col in enumerate(self.columns)}
+        self._time = index['time']
+        self._position = [index[col] for col in block_columns(self.segments, 'Pos')]
+        self._orientation = [index[col] for col in block_columns(self.segments, 'Orientation')]
+        # Two samples back for the acceleration, the emitted sample and the next one
+        self._buffer = deque(maxlen=MOVEMENT_CONTEXT + 2)
+
+    def _features(self, position):
+        window = np.array(self._buffer, dtype=np.float64)
+        shape = (len(window), len(self.segments), 3)
+        features = kinematic_features(window[:, self._time], window[:, self._position].reshape(shape),
+                                      window[:, self._orientation].reshape(shape), self.segments, self.pairs)
+        row = dict(zip(self.columns, self._buffer[position]))
+        row.update((name, float(values[position])) for name, values in features.items())
+        return row
+
+    def push(self, values):
+        self._buffer.append(values)
+        if len(self._buffer) < 2:
+            return []
+        return [self._features(len(self._buffer) - 2)]
+
+    def flush(self):
+        if not self._buffer:
+            return []
+        rows = [self._features(len(self._buffer) - 1)]
+        self._buffer.clear()
+        return rows
+
+
+class TrafficFeatures:
+    """Traffic flow features of one packet at a time, see ``traffic.TrafficEngine``."""
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self._engine = TrafficEngine()
+
+    def push(self, values):
+        row = dict(zip(self.columns, values))
+        row.update(self._engine.push(row['time'], row['direction'], row['size']))
+        return [row]
+
+    def flush(self):
+        return []
+
+
+class RawFeatures:
+    """Samples of other data types are summarised as they are."""
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+
+    def push(self, values):
+        return [dict(zip(self.columns, values))]
+
+    def flush(self):
+        return []
+
+
+def column_kinds(rows, categorical=()):
+    """
+    Numeric and categorical feature columns of feature rows, as ``select_dtypes`` splits a table read whole.
+
+    Parameters:
+    - rows: Feature rows as dictionaries, every one with the same columns.
+    - categorical: Columns that are categorical whatever their values.
+
+    Returns:
+    - The numeric and the categorical columns other than ``time``, in row order. A column is
+      categorical when it is listed in ``categorical`` or holds text in any row.
+    """
+    features = [col for col in rows[0] if col != 'time']
+    text = {col for col in features if col in categorical or any(isinstance(row[col], str) for row in rows)}
+    return [col for col in features if col not in text], [col for col in features if col in text]
+
+
+class IntervalAccumulator:
+    """Running statistics of the feature rows of one interval."""
+
+    def __init__(self, numeric_columns, categorical_columns, reservoir=DEFAULT_RESERVOIR, rng=None):
+        size = len(numeric_columns)
+        self.numeric_columns = numeric_columns
+        self.categorical_columns = categorical_columns
+        self.count = np.zeros(size)
+        self.total = np.zeros(size)
+        self.mean = np.zeros(size)
+        self.m2 = np.zeros(size)
+        self.m3 = np.zeros(size)
+        self.m4 = np.zeros(size)
+        self.minimum = np.full(size, np.nan)
+        self.maximum = np.full(size, np.nan)
+        self.max_abs = np.zeros(size)
+        self.samples = np.empty((reservoir, size))
+        self.seen = 0
+        self.categories = {col: Counter() for col in categorical_columns}
+        self._rng = rng or random.Random(0)
+
+    def add(self, numeric, categorical):
+        """Fold one row in: an array of numeric values and a list of categorical ones."""
+        mask = ~np.isnan(numeric)
+        n1 = self.count
+        n = n1 + mask
+
+        # Pébay's one-pass update of the central moment sums, skipping missing values
+        with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+            delta = numeric - self.mean
+            delta_n = delta / n
+            delta_n2 = delta_n * delta_n
+            term1 = delta * delta_n * n1
+            m4 = self.m4 + term1 * delta_n2 * (n * n - 3 * n + 3) + 6 * delta_n2 * self.m2 - 4 * delta_n * self.m3
+            m3 = self.m3 + term1 * delta_n * (n - 2) - 3 * delta_n * self.m2
+            m2 = self.m2 + term1
+            mean = self.mean + delta_n
+        self.m4 = np.where(mask, m4, self.m4)
+        self.m3 = np.where(mask, m3, self.m3)
+        self.m2 = np.where(mask, m2, self.m2)
+        self.mean = np.where(mask, mean, self.mean)
+        self.count = n
+        self.total = self.total + np.where(mask, numeric, 0)
+
+        self.minimum = np.fmin(self.minimum, numeric)
+        self.maximum = np.fmax(self.maximum, numeric)
+        self.max_abs = np.fmax(self.max_abs, np.abs(numeric))
+
+        # Reservoir sampling keeps a uniform sample of the interval for the quantiles
+        capacity = len(self.samples)
+        if self.seen < capacity:
+            self.samples[self.seen] = numeric
+        else:
+            slot = self._rng.randrange(self.seen + 1)
+            if slot < capacity:
+                self.samples[slot] = numeric
+        self.seen += 1
+
+        for col, value in zip(self.categorical_columns, categorical):
+            if not (isinstance(value, float) and math.isnan(value)):
+                self.categories[col][value] += 1
+
+    def statistics(self):
+        """The interval's statistics as a dictionary of flattened ``*_stat`` columns."""
+        count = self.count
+        eps = np.finfo(np.float64).eps
+        m2 = _zero_out_fperr(self.m2, ((eps * self.max_abs) ** 2) * count)
+        m3 = _zero_out_fperr(self.m3, ((eps * self.max_abs) ** 3) * count)
+        m4 = _zero_out_fperr(self.m4, ((eps * self.max_abs) ** 4) * count)
+        std, skew, kurtosis = moments_to_stats(count, self.mean, m2, m3, m4)
+        # The plain sum keeps infinite values in the mean, like the offline statistics
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = self.total / count
+
+        with warnings.catch_warnings():
+            # All-missing columns have missing quantiles
+            warnings.simplefilter('ignore', RuntimeWarning)
+            q25, q50, q75 = np.nanquantile(self.samples[:min(self.seen, len(self.samples))], QUANTILES, axis=0)
+
+        stats = {}
+        values = [mean, std, self.minimum, q25, q50, q75, self.maximum, skew, kurtosis]
+        for i, col in enumerate(self.numeric_columns):
+            for stat, value in zip(NUM_STATS, values):
+                stats[f'{col}_{stat}'] = float(value[i])
+
+        for col, counts in self.categories.items():
+            if not counts:
+                stats[col + '_mode'] = np.nan
+                continue
+            # Ties go to the smallest category, as with ``Series.mode()[0]``
+            top = max(counts.values())
+            stats[col + '_mode'] = min(category for category, n in counts.items() if n == top)
+            for category, n in counts.items():
+                stats[category_column_name(col, category)] = n
+        return stats
+
+
+class OnlineSession:
+    """
+    Live features and interval statistics of one session.
+
+    Parameters:
+    - columns: Columns of the raw samples, e.g. the header of a raw table.
+    - data_type: ``movement`` or ``traffic``, selecting the engineered features.
+    - ids: Identifier stored in the ``ID`` column of the statistics, unknown (None) by default.
+    - reservoir: Number of samples per interval kept for the quantiles.
+    - categorical: Columns that are categorical whatever their values, ``CATEGORICAL_COLUMNS`` of the
+      data type by default.
+    """
+
+    def __init__(self, columns, data_type, ids=None, segments=None, reservoir=DEFAULT_RESERVOIR, seed=0,
+                 categorical=None):
+        if data_type == 'movement':
+            self.features = MovementFeatures(columns, segments)
+        elif data_type == 'traffic':
+            self.features = TrafficFeatures(columns)
+        else:
+            self.features = RawFeatures(columns)
+        self.ids = ids
+        self.reservoir = reservoir
+        self.interval = None
+        self._rng = random.Random(seed)
+        self.categorical = CATEGORICAL_COLUMNS.get(data_type, []) if categorical is None else list(categorical)
+        self._numeric = None
+        self._categorical = None
+        # Rows of the first interval, held until it closes and the column kinds are known
+        self._pending = []
+        self._accumulator = None
+
+    def push(self, values):
+        """Add one raw sample, ordered as ``columns``; returns the ``(interval, statistics)`` it closes."""
+        closed = []
+        for row in self.features.push(values):
+            closed.extend(self._add(row))
+        return closed
+
+    def flush(self):
+        """Close the session, returning the ``(interval, statistics)`` still open."""
+        closed = []
+        for row in self.features.flush():
+            closed.extend(self._add(row))
+        if self._accumulator is not None or self._pending:
+            closed.append(self._close())
+        return closed
+
+    def _add(self, row):
+        interval = int(row['time'] / 10)
+        if interval < 0:
+            return []
+
+        closed = []
+        if self.interval is not None and interval != self.interval:
+            if interval < self.interval:
+                raise ValueError('Live samples must be ordered by time')
+            closed.append(self._close())
+        self.interval = interval
+        if self._numeric is None:
+            self._pending.append(row)
+            return closed
+        if self._accumulator is None:
+            self._accumulator = IntervalAccumulator(self._numeric, self._categorical, self.reservoir, self._rng)
+        self._fold(row)
+        return closed
+
+    def _fold(self, row):
+        try:
+            numeric = np.array([row[col] for col in self._numeric], dtype=np.float64)
+        except ValueError:
+            text = [col for col in self._numeric if isinstance(row[col], str)]
+            raise ValueError(f'Text in columns {text}, numeric in the first interval') from None
+        self._accumulator.add(numeric, [row[col] for col in self._categorical])
+
+    def _close(self):
+        if self._numeric is None:
+            # The first interval settles the column kinds, then its rows are folded in
+            self._numeric, self._categorical = column_kinds(self._pending, self.categorical)
+            self._accumulator = IntervalAccumulator(self._numeric, self._categorical, self.reservoir, self._rng)
+            for row in self._pending:
+                self._fold(row)
+            self._pending = []
+        stats = self._accumulator.statistics()
+        # Without categorical statistics the flattened offline columns keep a trailing underscore
+        suffix = '' if self._categorical else '_'
+        stats['time_interval' + suffix] = self.interval // 6 + 1
+        stats['ID' + suffix] = self.ids
+        self._accumulator = None
+        return self.interval, stats
@@ -0,0 +1,553 @@
+# -*- coding: utf-8 -*-
+"""Mergeable per-second aggregates of the engineered features.
+
+``build_features`` summarises fixed 10 second buckets, so trying another
+window length means engineering the features of every raw file again.
+``IntervalPartials`` instead keeps, for every ``base`` second bucket of a
+session, aggregates that can be merged without the samples:
+
+- the row count, and per numeric column the count, mean and central moment
+  sums (merged exactly with the multi-group update of Pébay), minimum and
+  maximum;
+- a quantile sketch per numeric column: the sorted values of the bucket, or
+  ``sketch_size`` weighted order statistics when it holds more values;
+- the counts of every category of the non-numeric columns, and the row each
+  category first appears at, which orders the count columns.
+
+``IntervalPartials.statistics`` merges the buckets of any window that is a
+multiple of ``base`` into the columns ``interval_stats.interval_statistics``
+produces. Everything but the quartiles is exact. The quartiles are exact as
+long as no bucket holds more than ``sketch_size`` values of a column, and
+interpolated between weighted order statistics otherwise. A sketched quartile
+then lies between the values whose ranks are ``ceil(n / sketch_size)``, summed
+over the window's buckets of ``n`` values, away from its exact rank.
+
+Spectral features need the samples of a whole window and are not available
+from the partials.
+
+Building the partials of the raw datasets once and deriving several windows::
+
+    python -m src.features.partials build data/raw/ data/partials/
+    python -m src.features.partials derive data/partials/ data/processed/ --window 10 --window 30 --window 60
+"""
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+import numpy as np
+import pandas as pd
+
+from src import profiling
+from src.data.manifest import DEFAULT_THREADS
+from src.data.storage import FORMATS, read_table, table_path, write_table
+from src.features.build_features import combine_stats, extract_ids, feature_engineering, raw_datasets
+from src.features.interval_stats import (NUM_STATS, QUANTILES, _grouped_moments, _zero_out_fperr,
+                                         category_statistics, moments_to_stats)
+from src.features.streaming import iter_feature_chunks
+
+# Length of the finest bucket, in seconds
+BASE_SECONDS = 1
+
+# Weighted order statistics kept per bucket and column beyond which quantiles are approximate
+SKETCH_SIZE = 256
+
+PARTIALS_SUFFIX = '_partials.pkl'
+
+
+def _group_starts(keys):
+    """First row of every run of equal sorted ``keys``."""
+    if not len(keys):
+        return np.zeros(0, dtype=np.int64)
+    return np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+
+
+def _merge_moments(count, mean, m2, m3, m4, starts):
+    """
+    Count, mean and central moment sums of groups of consecutive partial rows.
+
+    Parameters:
+    - count, mean, m2, m3, m4: Per row and column aggregates, rows ordered by group.
+    - starts: First row of every group.
+
+    Returns:
+    - The merged ``count, mean, m2, m3, m4`` of every group.
+    """
+    sizes = np.diff(np.r_[starts, len(count)])
+    filled = np.where(count > 0, mean, 0.0)
+    total = np.add.reduceat(count, starts, axis=0)
+    # Infinite values make the moments NaN, as they do in ``_grouped_moments``
+    with np.errstate(invalid='ignore', divide='ignore'):
+        merged_mean = np.add.reduceat(count * filled, starts, axis=0) / total
+        delta = np.where(count > 0, filled - np.repeat(merged_mean, sizes, axis=0), 0.0)
+        merged_m2 = np.add.reduceat(m2 + count * delta ** 2, starts, axis=0)
+        merged_m3 = np.add.reduceat(m3 + 3 * delta * m2 + count * delta ** 3, starts, axis=0)
+        merged_m4 = np.add.reduceat(m4 + 4 * delta * m3 + 6 * delta ** 2 * m2 + count * delta ** 4, starts,
+                                    axis=0)
+    return total, merged_mean, merged_m2, merged_m3, merged_m4
+
+
+def _weighted_quantiles(values, weights, quantiles):
+    """
+    Linearly interpolated quantiles of sets of weighted points.
+
+    A point of weight ``w`` stands for ``w`` copies of its value, so the quantiles of
+    points of distinct values all of weight 1 are those of ``Series.quantile``.
+
+    Parameters:
+    - values, weights: Arrays of shape (..., points), values sorted along the last axis with
+      NaN padding of weight 0 at the end.
+    - quantiles: Quantiles to compute.
+
+    Returns:
+    - An array of shape (..., quantiles), NaN for the sets without points.
+    """
+    total = weights.sum(axis=-1)
+    # The point of index i holds the ranks ``ends[i] - weights[i]`` to ``ends[i] - 1``
+    ends = np.cumsum(weights, axis=-1)
+    result = np.full(total.shape + (len(quantiles),), np.nan)
+    if not values.shape[-1]:
+        return result
+    for k, quantile in enumerate(quantiles):
+        position = (total - 1) * quantile
+        lower = np.floor(position)
+        upper = np.minimum(lower + 1, total - 1)
+        lower_values = np.take_along_axis(values, (ends <= lower[..., None]).sum(axis=-1)[..., None], axis=-1)[..., 0]
+        upper_values = np.take_along_axis(values, (ends <= upper[..., None]).sum(axis=-1)[..., None], axis=-1)[..., 0]
+        result[..., k] = lower_values + (position - lower) * (upper_values - lower_values)
+    result[total == 0] = np.nan
+    return result
+
+
+def _sketch(values, starts, sizes, sketch_size):
+    """
+    Weighted points summarising the values of every group of rows of one column.
+
+    Equal values are merged into one point. Groups with more than ``sketch_size`` distinct
+    values are cut into ``sketch_size`` runs of consecutive ranks, each run becoming one
+    point at the value of its centre rank.
+
+    Returns:
+    - The values and weights of the points as arrays of shape (groups, points), sorted by
+      value with NaN padding of weight 0.
+    """
+    groups = np.repeat(np.arange(len(starts)), sizes)
+    keep = ~np.isnan(values)
+    values, groups = values[keep], groups[keep]
+    order = np.lexsort((values, groups))
+    values, groups = values[order], groups[order]
+    n = np.bincount(groups, minlength=len(starts))
+
+    first = np.r_[True, groups[1:] != groups[:-1]][:len(values)]
+    changed = first | np.r_[True, values[1:] != values[:-1]][:len(values)]
+    distinct = np.bincount(groups[changed], minlength=len(starts))
+    rank = np.arange(len(values)) - np.repeat(np.cumsum(n) - n, n)
+    slot = rank * sketch_size // np.maximum(n[groups], 1)
+    new_slot = first | np.r_[True, slot[1:] != slot[:-1]][:len(values)]
+    point_starts = np.flatnonzero(np.where(distinct[groups] > sketch_size, new_slot, changed))
+
+    weights = np.diff(np.r_[point_starts, len(values)])
+    point_values = (values[point_starts + (weights - 1) // 2] + values[point_starts + weights // 2]) / 2
+    point_groups = groups[point_starts]
+    points = np.bincount(point_groups, minlength=len(starts))
+    position = np.arange(len(point_starts)) - np.repeat(np.cumsum(points) - points, points)
+
+    sketch_values = np.full((len(starts), points.max(initial=0)), np.nan)
+    sketch_weights = np.zeros(sketch_values.shape)
+    sketch_values[point_groups, position] = point_values
+    sketch_weights[point_groups, position] = weights
+    return sketch_values, sketch_weights
+
+
+def _pad_points(array, points, fill_value):
+    """Pad the last axis of ``array`` to ``points``."""
+    padding = [(0, 0)] * (array.ndim - 1) + [(0, points - array.shape[-1])]
+    return np.pad(array, padding, constant_values=fill_value)
+
+
+class IntervalPartials:
+    """
+    Mergeable aggregates of every ``base`` second bucket of one session.
+
+    Attributes:
+    - ids: Identifier of the session, stored in the ``ID`` column of the statistics.
+    - base: Length of the buckets in seconds.
+    - sketch_size: Weighted order statistics kept per bucket and column.
+    - buckets: Sorted indexes of the non-empty buckets, ``int(time / base)``.
+    - rows: Number of rows of every bucket.
+    - columns: Numeric columns, aggregated into ``count``, ``mean``, ``m2``, ``m3``, ``m4``,
+      ``minimum`` and ``maximum`` arrays of shape (buckets, columns).
+    - sketch_values, sketch_weights: Points of the quantile sketches, arrays of shape
+      (buckets, columns, points) sorted by value with NaN padding of weight 0.
+    - categories: Per non-numeric column, a DataFrame of category counts with one row per bucket.
+    - first_rows: Per non-numeric column, the row of the session each category first appears at in
+      every bucket, NaN where it is absent, in the layout of ``categories``.
+    """
+
+    def __init__(self, ids, base, sketch_size, buckets, rows, columns, moments, minimum, maximum,
+                 sketch_values, sketch_weights, categories, first_rows):
+        self.ids = ids
+        self.base = base
+        self.sketch_size = sketch_size
+        self.buckets = buckets
+        self.rows = rows
+        self.columns = list(columns)
+        self.count, self.mean, self.m2, self.m3, self.m4 = moments
+        self.minimum = minimum
+        self.maximum = maximum
+        self.sketch_values = sketch_values
+        self.sketch_weights = sketch_weights
+        self.categories = categories
+        self.first_rows = first_rows
+
+    def __repr__(self):
+        return (f'IntervalPartials(ids={self.ids!r}, base={self.base!r}, buckets={len(self.buckets)}, '
+                f'columns={len(self.columns)}, categories={list(self.categories)})')
+
+    @property
+    def nbytes(self):
+        arrays = [self.buckets, self.rows, self.count, self.mean, self.m2, self.m3, self.m4, self.minimum,
+                  self.maximum, self.sketch_values, self.sketch_weights]
+        return (sum(array.nbytes for array in arrays)
+                + sum(int(counts.memory_usage(index=False).sum())
+                      for frames in (self.categories, self.first_rows) for counts in frames.values()))
+
+    @classmethod
+    def from_frame(cls, df, ids, base=BASE_SECONDS, sketch_size=SKETCH_SIZE):
+        """
+        Aggregate the engineered features of one session.
+
+        Parameters:
+        - df: Engineered features with a ``time`` column, as ``build_features.feature_engineering`` returns them.
+        - ids: Identifier of the session.
+        - base: Length of the buckets in seconds.
+        - sketch_size: Weighted order statistics kept per bucket and column.
+
+        Returns:
+        - The ``IntervalPartials`` of the rows at non-negative bucket indexes.
+        """
+        keys = (df['time'] / base).astype(int).to_numpy()
+        features = df.drop(columns=[col for col in ['time', 'time_interval'] if col in df.columns])
+        keep = keys >= 0
+        order = np.argsort(keys[keep], kind='stable')
+        keys = keys[keep][order]
+        features = features[keep].iloc[order]
+        starts = _group_starts(keys)
+        sizes = np.diff(np.r_[starts, len(keys)])
+
+        num_cols = features.select_dtypes(include=['number']).columns
+        cat_cols = features.select_dtypes(exclude=['number']).columns
+        values = features[num_cols].to_numpy(dtype=np.float64)
+        if len(starts):
+            moments = _grouped_moments(values, starts, sizes)
+            minimum = np.fmin.reduceat(values, starts, axis=0)
+            maximum = np.fmax.reduceat(values, starts, axis=0)
+        else:
+            moments = tuple(np.zeros((0, len(num_cols))) for _ in range(5))
+            minimum = maximum = np.zeros((0, len(num_cols)))
+
+        sketches = [_sketch(values[:, j], starts, sizes, sketch_size) for j in range(len(num_cols))]
+        points = max((sketch_values.shape[1] for sketch_values, _ in sketches), default=0)
+        sketch_values = np.full((len(starts), len(num_cols), points), np.nan)
+        sketch_weights = np.zeros(sketch_values.shape)
+        for j, (column_values, column_weights) in enumerate(sketches):
+            sketch_values[:, j, :column_values.shape[1]] = column_values
+            sketch_weights[:, j, :column_weights.shape[1]] = column_weights
+
+        bucket_index = keys[starts]
+        rows = np.arange(len(keys))
+        categories, first_rows = {}, {}
+        for col in cat_cols:
+            values = features[col].to_numpy()
+            counts = pd.crosstab(keys, values)
+            categories[col] = counts.reindex(index=bucket_index, columns=sorted(counts.columns), fill_value=0)
+            first_rows[col] = pd.Series(rows).groupby([keys, values]).min().unstack().reindex(
+                index=bucket_index, columns=categories[col].columns).astype(np.float64)
+
+        return cls(ids, base, sketch_size, bucket_index, sizes, num_cols, moments, minimum, maximum,
+                   sketch_values, sketch_weights, categories, first_rows)
+
+    def _merged(self, groups):
+        """
+        Aggregates of groups of buckets.
+
+        Parameters:
+        - groups: Non-decreasing group of every bucket.
+
+        Returns:
+        - The first bucket of every group, the merged moments, minimums and maximums, and the
+          sketch values and weights of every group and column, sorted by value.
+        """
+        starts = _group_starts(groups)
+        moments = _merge_moments(self.count, self.mean, self.m2, self.m3, self.m4, starts)
+        minimum = np.fmin.reduceat(self.minimum, starts, axis=0)
+        maximum = np.fmax.reduceat(self.maximum, starts, axis=0)
+
+        # (groups, buckets of the group, columns, points) -> (groups, columns, all the points of the group)
+        group = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(groups)]))
+        slot = np.arange(len(groups)) - starts[group]
+        shape = (len(starts), slot.max(initial=-1) + 1) + self.sketch_values.shape[1:]
+        values = np.full(shape, np.nan)
+        weights = np.zeros(shape)
+        values[group, slot] = self.sketch_values
+        weights[group, slot] = self.sketch_weights
+        values = values.transpose(0, 2, 1, 3).reshape(len(starts), len(self.columns), -1)
+        weights = weights.transpose(0, 2, 1, 3).reshape(values.shape)
+
+        order = np.argsort(values, axis=-1, kind='stable')
+        values = np.take_along_axis(values, order, axis=-1)
+        weights = np.take_along_axis(weights, order, axis=-1)
+        points = int((weights > 0).sum(axis=-1).max(initial=0))
+        return starts, moments, minimum, maximum, values[..., :points], weights[..., :points]
+
+    def statistics(self, window=10, time_window=None):
+        """
+        Summarise every ``window`` second interval of the session.
+
+        Parameters:
+        - window: Interval length in seconds, a multiple of ``base``.
+        - time_window: Number of minutes kept from the start of the session, all of them by default.
+
+        Returns:
+        - A DataFrame with one row per non-empty interval and the columns of
+          ``interval_stats.interval_statistics``, ``time_interval`` being the minute the interval starts in.
+        """
+        ratio = window / self.base
+        if ratio < 1 or ratio != int(ratio):
+            raise ValueError(f'The window ({window:g}s) must be a multiple of the partials\' {self.base:g}s buckets')
+        partials = self if time_window is None else self._subset(self.buckets * self.base < time_window * 60)
+        if not len(partials.buckets):
+            return pd.DataFrame()
+
+        windows = partials.buckets // int(ratio)
+        starts, (count, mean, m2, m3, m4), minimum, maximum, values, weights = partials._merged(windows)
+        intervals = windows[starts]
+
+        parts, late = [], None
+        if self.columns:
+            eps = np.finfo(np.float64).eps
+            max_abs = np.fmax(np.abs(minimum), np.abs(maximum))
+            m2 = _zero_out_fperr(m2, ((eps * max_abs) ** 2) * count)
+            m3 = _zero_out_fperr(m3, ((eps * max_abs) ** 3) * count)
+            m4 = _zero_out_fperr(m4, ((eps * max_abs) ** 4) * count)
+            std, skew, kurtosis = moments_to_stats(count, mean, m2, m3, m4)
+            q25, q50, q75 = np.moveaxis(_weighted_quantiles(values, weights, QUANTILES), -1, 0)
+
+            # Stat-major (groups, stats, columns) -> column-major (groups, columns * stats)
+            stats = np.stack([mean, std, minimum, q25, q50, q75, maximum, skew, kurtosis], axis=2)
+            columns = pd.MultiIndex.from_product([self.columns, NUM_STATS])
+            parts.append(pd.DataFrame(stats.reshape(len(starts), -1), index=intervals, columns=columns))
+
+        if self.categories:
+            cat_stats, late = category_statistics(
+                {col: counts.groupby(windows).sum() for col, counts in partials.categories.items()},
+                {col: first.groupby(windows).min() for col, first in partials.first_rows.items()}, intervals)
+            parts.append(cat_stats)
+        stats = pd.concat(parts, axis=1)
+
+        stats['time_interval'] = (stats.index * window // 60 + 1).astype(int)
+        stats['ID'] = self.ids
+        if late is not None and not late.empty:
+            stats = pd.concat([stats, late], axis=1)
+        return stats.reset_index(drop=True)
+
+    def _subset(self, keep):
+        """The partials of the selected buckets."""
+        return IntervalPartials(
+            self.ids, self.base, self.sketch_size, self.buckets[keep], self.rows[keep], self.columns,
+            tuple(moment[keep] for moment in (self.count, self.mean, self.m2, self.m3, self.m4)),
+            self.minimum[keep], self.maximum[keep], self.sketch_values[keep], self.sketch_weights[keep],
+            {col: counts[keep] for col, counts in self.categories.items()},
+            {col: first[keep] for col, first in self.first_rows.items()})
+
+    @classmethod
+    def concat(cls, parts):
+        """
+        Merge the partials of consecutive pieces of one session, e.g. the chunks of a streamed file.
+
+        Buckets present in several pieces are merged; their sketch points are kept side by side.
+        """
+        parts = [part for part in parts if len(part.buckets)]
+        if not parts:
+            raise ValueError('No partials to concatenate')
+        first = parts[0]
+        if len(parts) == 1:
+            return first
+        points = max(part.sketch_values.shape[-1] for part in parts)
+        # Rows of a piece are counted from the start of the session
+        offsets = np.cumsum([0] + [int(part.rows.sum()) for part in parts[:-1]])
+        joined = cls(
+            first.ids, first.base, first.sketch_size, np.concatenate([part.buckets for part in parts]),
+            np.concatenate([part.rows for part in parts]), first.columns,
+            tuple(np.concatenate([getattr(part, name) for part in parts])
+                  for name in ['count', 'mean', 'm2', 'm3', 'm4']),
+            np.concatenate([part.minimum for part in parts]), np.concatenate([part.maximum for part in parts]),
+            np.concatenate([_pad_points(part.sketch_values, points, np.nan) for part in parts]),
+            np.concatenate([_pad_points(part.sketch_weights, points, 0) for part in parts]),
+            {col: pd.concat([part.categories[col] for part in parts]).fillna(0) for col in first.categories},
+            {col: pd.concat([part.first_rows[col] + offset for part, offset in zip(parts, offsets)])
+             for col in first.first_rows})
+        if not (np.diff(joined.buckets) >= 0).all():
+            raise ValueError('Partials must be concatenated in time order')
+
+        starts, moments, minimum, maximum, values, weights = joined._merged(joined.buckets)
+        categories = {col: counts.groupby(joined.buckets).sum().astype(np.int64)
+                      for col, counts in joined.categories.items()}
+        categories = {col: counts[sorted(counts.columns)] for col, counts in categories.items()}
+        first_rows = {col: first_row.groupby(joined.buckets).min()[categories[col].columns]
+                      for col, first_row in joined.first_rows.items()}
+        return cls(first.ids, first.base, first.sketch_size, joined.buckets[starts],
+                   np.add.reduceat(joined.rows, starts), first.columns, moments, minimum, maximum,
+                   values, weights, categories, first_rows)
+
+
+def file_partials(filepath, data_type, base=BASE_SECONDS, sketch_size=SKETCH_SIZE, chunksize=None):
+    """
+    Engineer the features of one raw session file and aggregate them into partials.
+
+    With ``chunksize`` the file is streamed ``chunksize`` rows at a time, see
+    ``streaming.iter_feature_chunks``, and the partials of the chunks are concatenated.
+    """
+    ids = extract_ids(filepath)
+    if chunksize:
+        with profiling.stage('stream', file=filepath) as span:
+            parts = []
+            for features in iter_feature_chunks(filepath, data_type, chunksize):
+                parts.append(IntervalPartials.from_frame(features, ids, base, sketch_size))
+                span.count(len(features))
+            return IntervalPartials.concat(parts)
+
+    with profiling.stage('read', file=filepath) as span:
+        df = read_table(filepath)
+        span.count(len(df))
+    with profiling.stage('kinematics' if data_type == "movement" else 'traffic_features', file=filepath) as span:
+        df = feature_engineering(df, data_type)
+        span.count(len(df))
+    with profiling.stage('partials', file=filepath) as span:
+        partials = IntervalPartials.from_frame(df, ids, base, sketch_size)
+        span.count(len(df))
+    return partials
+
+
+def _partials_task(task):
+    name, filepath, data_type, base, sketch_size, chunksize = task
+    return name, file_partials(filepath, data_type, base, sketch_size, chunksize)
+
+
+def build_partials(datasets, base=BASE_SECONDS, sketch_size=SKETCH_SIZE, workers=1, chunksize=None):
+    """
+    Aggregate the raw files of several datasets into partials.
+
+    Parameters:
+    - datasets: A dictionary with dataset names as keys and ``(filepaths, data_type)`` as values.
+    - base: Length of the buckets in seconds.
+    - sketch_size: Weighted order statistics kept per bucket and column.
+    - workers: Number of processes; every file is a separate task.
+    - chunksize: Stream raw files this many rows at a time instead of loading them whole.
+
+    Returns:
+    - A dictionary with dataset names as keys and lists of ``IntervalPartials`` as values, in file order.
+    """
+    tasks = [(name, filepath, data_type, base, sketch_size, chunksize)
+             for name, (filepaths, data_type) in datasets.items()
+             for filepath in filepaths]
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_partials_task, tasks))
+    else:
+        results = [_partials_task(task) for task in tasks]
+
+    partials = {name: [] for name in datasets}
+    for name, file_partial in results:
+        partials[name].append(file_partial)
+    return partials
+
+
+def derive_datasets(partials, window=10, time_window=None):
+    """
+    Interval statistics datasets of any window, from the partials of ``build_partials``.
+
+    Returns:
+    - A dictionary with dataset names as keys and statistics DataFrames as values, with the
+      flat columns of ``build_features.combine_stats``.
+    """
+    datasets = {}
+    for name, file_partials in partials.items():
+        with profiling.stage('derive', dataset=name, window=window) as span:
+            datasets[name] = combine_stats([part.statistics(window, time_window) for part in file_partials])
+            span.count(len(datasets[name]))
+    return datasets
+
+
+def save_partials(partials, directory):
+    """Store the partials of every dataset as ``<name>_partials.pkl`` in ``directory``."""
+    os.makedirs(directory, exist_ok=True)
+    for name, file_partials in partials.items():
+        pd.to_pickle(file_partials, os.path.join(directory, name + PARTIALS_SUFFIX))
+
+
+def load_partials(directory):
+    """Partials of every dataset stored in ``directory`` by ``save_partials``."""
+    return {filename[:-len(PARTIALS_SUFFIX)]: pd.read_pickle(os.path.join(directory, filename))
+            for filename in sorted(os.listdir(directory)) if filename.endswith(PARTIALS_SUFFIX)}
+
+
+@click.group()
+def main():
+    """Builds mergeable per-second aggregates once and derives interval statistics of any window from them."""
+
+
+@main.command()
+@click.argument('input_filepath', type=click.Path(exists=True))
+@click.argument('partials_filepath', type=click.Path(file_okay=False))
+@click.option('--base', type=click.FloatRange(min=0, min_open=True), default=BASE_SECONDS, show_default=True,
+              help='Length of the finest buckets in seconds.')
+@click.option('--sketch-size', type=click.IntRange(min=1), default=SKETCH_SIZE, show_default=True,
+              help='Weighted order statistics kept per bucket and column for the quartiles.')
+@click.option('--workers', type=click.IntRange(min=1), default=1, show_default=True,
+              help='Number of processes aggregating files in parallel.')
+@click.option('--chunksize', type=click.IntRange(min=1), default=None,
+              help='Stream raw files this many rows at a time instead of loading them whole.')
+@click.option('--manifest', 'manifest_path', type=click.Path(dir_okay=False), default=None,
+              help='Index of the raw files, refreshed instead of listing the whole raw tree.')
+@click.option('--threads', type=click.IntRange(min=1), default=DEFAULT_THREADS, show_default=True,
+              help='Number of threads listing the raw directories, e.g. on network-mounted trees.')
+def build(input_filepath, partials_filepath, base=BASE_SECONDS, sketch_size=SKETCH_SIZE, workers=1, chunksize=None,
+          manifest_path=None, threads=DEFAULT_THREADS):
+    """Aggregates the raw movement and traffic files into partials."""
+    logger = logging.getLogger(__name__)
+    datasets = raw_datasets(input_filepath, manifest_path, threads)
+    logger.info('Aggregating %d files into %gs buckets',
+                sum(len(filepaths) for filepaths, _ in datasets.values()), base)
+    partials = build_partials(datasets, base, sketch_size, workers, chunksize)
+    save_partials(partials, partials_filepath)
+    logger.info('Saved the partials of %d datasets, %.1f MB in memory', len(partials),
+                sum(part.nbytes for parts in partials.values() for part in parts) / 1024 ** 2)
+
+
+@main.command()
+@click.argument('partials_filepath', type=click.Path(exists=True, file_okay=False))
+@click.argument('output_filepath', type=click.Path())
+@click.option('--window', 'windows', type=click.FloatRange(min=0, min_open=True), multiple=True, default=[10],
+              show_default=True, help='Interval length in seconds, repeat for several windows.')
+@click.option('--time-window', type=click.IntRange(min=1), default=None,
+              help='Number of minutes kept from the start of each session, all of them by default.')
+@click.option('--format', type=click.Choice(sorted(FORMATS)), default='parquet', show_default=True,
+              help='Storage format of the statistics datasets.')
+def derive(partials_filepath, output_filepath, windows=(10,), time_window=None, format='parquet'):
+    """Writes the statistics datasets of every window to OUTPUT_FILEPATH/<window>s/."""
+    logger = logging.getLogger(__name__)
+    partials = load_partials(partials_filepath)
+    for window in windows:
+        directory = os.path.join(output_filepath, f'{window:g}s')
+        os.makedirs(directory, exist_ok=True)
+        for name, result_stat in derive_datasets(partials, window, time_window).items():
+            write_table(result_stat, table_path(directory, name, format))
+        logger.info('Saved the %gs interval statistics to %s', window, directory)
+
+
+if __name__ == '__main__':
+    log_fmt = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    logging.basicConfig(level=logging.INFO, format=log_fmt)
+
+    main()
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""Frequency-domain movement features of every time interval.
+
+For the position and orientation channels of the tracked segments, the power
+spectral density of each interval is estimated with Welch's method (Hann
+window, 50% overlap, constant detrending). Each channel is then summarised by
+its power in a few frequency bands, its dominant frequency and its normalised
+spectral entropy.
+
+The Welch segments of every interval and channel of a file are gathered from a
+single strided view of the samples and transformed with one batched ``rfft``.
+The window, scaling and frequency bins only depend on the sample rate, and
+``spectral_plan`` caches them across files recorded at the same rate. Samples
+are assumed to be evenly spaced at the file's median rate.
+"""
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from src.features.kinematics import SEGMENTS, block_columns
+
+CHANNELS = block_columns(SEGMENTS, 'Pos') + block_columns(SEGMENTS, 'Orientation')
+
+# Frequency bands in Hz, bands above the Nyquist frequency are skipped
+BANDS = ((0, 1), (1, 3), (3, 6), (6, 12))
+
+# Length of the Welch segments in seconds
+SEGMENT_SECONDS = 2
+
+
+class SpectralPlan:
+    """Welch window, scaling and frequency bins at one sample rate."""
+
+    def __init__(self, sample_rate, segment_seconds=SEGMENT_SECONDS, bands=BANDS):
+        self.sample_rate = sample_rate
+        self.nperseg = max(2, int(round(sample_rate * segment_seconds)))
+        self.step = max(1, self.nperseg // 2)
+
+        # Periodic Hann window, as ``scipy.signal.welch`` uses
+        self.window = 0.5 - 0.5 * np.cos(2 * np.pi * np.arange(self.nperseg) / self.nperseg)
+        self.frequencies = np.fft.rfftfreq(self.nperseg, 1 / sample_rate)
+        self.resolution = self.frequencies[1]
+
+        # One-sided power spectral density: every bin but DC (and Nyquist) counts twice
+        self.scale = np.full(len(self.frequencies), 2 / (sample_rate * (self.window ** 2).sum()))
+        self.scale[0] /= 2
+        if self.nperseg % 2 == 0:
+            self.scale[-1] /= 2
+
+        self.bands = [(low, high) for low, high in bands if low < sample_rate / 2]
+        self.band_masks = np.array([(self.frequencies >= low) & (self.frequencies < high)
+                                    for low, high in self.bands], dtype=np.float64).reshape(-1, len(self.frequencies))
+
+    @property
+    def feature_names(self):
+        return [f'band_{low:g}-{high:g}Hz' for low, high in self.bands] + ['dominant_freq', 'spectral_entropy']
+
+
+@lru_cache(maxsize=16)
+def spectral_plan(sample_rate, segment_seconds=SEGMENT_SECONDS, bands=BANDS):
+    """Shared ``SpectralPlan`` of a sample rate."""
+    return SpectralPlan(sample_rate, segment_seconds, bands)
+
+
+def estimate_sample_rate(time):
+    """Median sample rate of a session, rounded to 0.1 Hz so that similar files share a plan."""
+    dt = np.diff(np.asarray(time, dtype=np.float64))
+    dt = dt[dt > 0]
+    if not len(dt):
+        return None
+    return round(1 / float(np.median(dt)), 1)
+
+
+def _welch(values, starts, sizes, plan):
+    """Welch PSD of every interval and channel, NaN for intervals shorter than a segment.
+
+    Returns:
+    - A ``(intervals, channels, frequencies)`` array.
+    """
+    counts = np.maximum(0, (sizes - plan.nperseg) // plan.step + 1)
+    psd = np.full((len(starts), values.shape[1], len(plan.frequencies)), np.nan)
+    total = counts.sum()
+    if not total:
+        return psd
+
+    # Segments never straddle two intervals
+    first_segment = np.cumsum(counts) - counts
+    offsets = np.arange(total) - np.repeat(first_segment, counts)
+    segment_starts = np.repeat(starts, counts) + offsets * plan.step
+
+    windows = sliding_window_view(values, plan.nperseg, axis=0)[segment_starts]
+    windows = windows - windows.mean(axis=-1, keepdims=True)
+    spectra = np.abs(np.fft.rfft(windows * plan.window, axis=-1)) ** 2 * plan.scale
+
+    has_segments = counts > 0
+    sums = np.add.reduceat(spectra, first_segment[has_segments], axis=0)
+    psd[has_segments] = sums / counts[has_segments, None, None]
+    return psd
+
+
+def spectral_statistics(df, plan=None, channels=None):
+    """
+    Spectral features of every ``time_interval`` bucket of one movement session.
+
+    Parameters:
+    - df: Movement samples with ``time``, ``time_interval`` and channel columns.
+    - plan: ``SpectralPlan`` to use, by default the shared plan of the session's sample rate.
+    - channels: Channels to analyse, by default the position/orientation channels present.
+
+    Returns:
+    - A DataFrame indexed by the sorted non-empty buckets, with ``(channel, feature)`` columns.
+    """
+    channels = [col for col in CHANNELS if col in df.columns] if channels is None else list(channels)
+    keys = df['time_interval'].to_numpy()
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    intervals, starts = np.unique(keys, return_index=True)
+    sizes = np.diff(np.r_[starts, len(keys)])
+
+    if plan is None:
+        sample_rate = estimate_sample_rate(df['time'])
+        plan = spectral_plan(sample_rate) if sample_rate else None
+    names = plan.feature_names if plan is not None else ['dominant_freq', 'spectral_entropy']
+    columns = pd.MultiIndex.from_product([channels, names])
+    if plan is None or not channels:
+        return pd.DataFrame(np.nan, index=intervals, columns=columns)
+
+    values = np.ascontiguousarray(df[channels].to_numpy(dtype=np.float64)[order])
+    psd = _welch(values, starts, sizes, plan)
+
+    band_power = psd @ plan.band_masks.T * plan.resolution
+    # DC is removed by the detrending and ignored below
+    spectrum = psd[..., 1:]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        dominant = plan.frequencies[1:][np.argmax(np.nan_to_num(spectrum, nan=-np.inf), axis=-1)]
+        dominant = np.where(np.isnan(spectrum).all(axis=-1), np.nan, dominant)
+
+        p = spectrum / spectrum.sum(axis=-1, keepdims=True)
+        entropy = -np.where(p > 0, p * np.log2(np.where(p > 0, p, 1)), 0).sum(axis=-1)
+        entropy = entropy / np.log2(max(2, spectrum.shape[-1]))
+        entropy = np.where(np.isfinite(p).all(axis=-1), entropy, np.nan)
+
+    features = np.concatenate([band_power, dominant[..., None], entropy[..., None]], axis=-1)
+    return pd.DataFrame(features.reshape(len(intervals), -1), index=intervals, columns=columns)
+
+
+def add_spectral_statistics(stats, df, plan=None):
+    """Append the spectral features of ``df`` to its interval statistics.
+
+    ``stats`` must hold one row per sorted non-empty bucket of ``df``, as the
+    ``interval_stats`` engines return.
+    """
+    if stats.empty:
+        return stats
+    spectral = spectral_statistics(df, plan).reset_index(drop=True)
+    if not isinstance(stats.columns, pd.MultiIndex):
+        spectral.columns = ['_'.join(col) for col in spectral.columns]
+    return pd.concat([stats, spectral], axis=1)
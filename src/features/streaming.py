@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""Chunked ingestion of raw session logs.
+
+Raw ``_movement``/``_traffic`` tables are read ``chunksize`` rows at a
+time. The state the derived features depend on (neighbouring samples for the
+movement derivatives, the ``TrafficEngine`` state for traffic) is carried across chunk boundaries, so the features match the ones
+``build_features.feature_engineering`` computes on the whole file. Time
+intervals are summarised as soon as they close, which bounds peak memory by
+one chunk plus one interval instead of one session.
+
+Samples must be ordered by time.
+"""
+import pandas as pd
+
+from src.data.storage import iter_table_chunks, read_table
+from src.features.interval_stats import ENGINES
+from src.features.kinematics import movement_kinematics
+from src.features.spectral import add_spectral_statistics, estimate_sample_rate, spectral_plan
+from src.features.traffic import TrafficEngine, traffic_features
+
+# Movement derivatives of a row look two samples back (acceleration) and one ahead (Δt)
+MOVEMENT_CONTEXT = 2
+
+
+def _movement_chunks(reader, segments=None):
+    """Yield movement features chunk by chunk, holding back the rows whose neighbours are pending."""
+    carry = None
+    skip = 0
+    for chunk in reader:
+        buffer = chunk if carry is None else pd.concat([carry, chunk], ignore_index=True)
+
+        # The last row needs the next sample's time, so it is emitted with the next chunk
+        emitted_end = max(skip, len(buffer) - 1)
+        if emitted_end > skip:
+            features = pd.concat([buffer, movement_kinematics(buffer, segments)], axis=1)
+            yield features.iloc[skip:emitted_end]
+
+        context_start = max(0, emitted_end - MOVEMENT_CONTEXT)
+        carry = buffer.iloc[context_start:].reset_index(drop=True)
+        skip = emitted_end - context_start
+
+    if carry is not None and len(carry) > skip:
+        features = pd.concat([carry, movement_kinematics(carry, segments)], axis=1)
+        yield features.iloc[skip:]
+
+
+def _traffic_chunks(reader):
+    """Yield traffic features chunk by chunk, one ``TrafficEngine`` carrying the per-direction state."""
+    engine = TrafficEngine()
+    for chunk in reader:
+        yield pd.concat([chunk, traffic_features(chunk, engine)], axis=1)
+
+
+def iter_feature_chunks(filepath, data_type, chunksize=100_000, segments=None):
+    """Read a raw session file in chunks and yield its engineered features."""
+    reader = iter_table_chunks(filepath, chunksize)
+    if data_type == "movement":
+        yield from _movement_chunks(reader, segments)
+    elif data_type == "traffic":
+        yield from _traffic_chunks(reader)
+    else:
+        yield from reader
+
+
+def iter_interval_stats(filepath, ids, time_window, data_type, engine='groupby', chunksize=100_000, spectral=False):
+    """
+    Stream the interval statistics of a raw session file.
+
+    Parameters:
+    - filepath: Raw ``_movement``/``_traffic`` table, ordered by time.
+    - ids: Identifier of the session, stored in the ``ID`` column.
+    - time_window: Number of minutes kept from the start of the session.
+    - engine: Interval statistics implementation, see ``interval_stats.ENGINES``.
+    - chunksize: Number of raw rows read at a time.
+    - spectral: Add frequency-domain features to movement intervals. The sample rate is estimated from
+      the file's ``time`` column within the time window, as on the whole file.
+
+    Yields:
+    - Statistics of the intervals closed by each chunk. Reading stops once the
+      time window is exhausted.
+    """
+    max_interval = time_window * 6
+    spectral = spectral and data_type == "movement"
+    plan = None
+    if spectral:
+        # A first pass over the time column gives the sample rate of the whole window, not of the first chunk
+        time = read_table(filepath, ['time'])['time']
+        time_interval = (time / 10).astype(int)
+        sample_rate = estimate_sample_rate(time[(time_interval >= 0) & (time_interval < max_interval)])
+        plan = spectral_plan(sample_rate) if sample_rate else None
+
+    def interval_statistics(rows, ids):
+        stats = ENGINES[engine](rows, ids)
+        return add_spectral_statistics(stats, rows, plan) if spectral else stats
+
+    open_rows = None
+    last_closed = None
+
+    for features in iter_feature_chunks(filepath, data_type, chunksize):
+        features = features.assign(time_interval=(features['time'] / 10).astype(int))
+        data = features if open_rows is None else pd.concat([open_rows, features], ignore_index=True)
+        if data.empty:
+            continue
+        reopened = last_closed is not None and data['time_interval'].iloc[0] <= last_closed
+        if reopened or not data['time_interval'].is_monotonic_increasing:
+            raise ValueError(f'{filepath} is not ordered by time, it cannot be streamed')
+
+        current = data['time_interval'].iloc[-1]
+        closed = data[data['time_interval'] < current]
+        open_rows = data[data['time_interval'] == current]
+
+        if not closed.empty:
+            last_closed = closed['time_interval'].iloc[-1]
+            closed = closed[(closed['time_interval'] >= 0) & (closed['time_interval'] < max_interval)]
+            if not closed.empty:
+                yield interval_statistics(closed, ids)
+
+        if current >= max_interval:
+            return
+
+    if open_rows is not None:
+        open_rows = open_rows[(open_rows['time_interval'] >= 0) & (open_rows['time_interval'] < max_interval)]
+        if not open_rows.empty:
+            yield interval_statistics(open_rows, ids)
@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""Traffic flow features computed in one ordered pass with running state per direction.
+
+``TrafficEngine`` turns packets (time, direction, size) into per-packet flow
+features. The state it keeps between batches is a handful of numbers per
+direction, so a capture gives the same features whether it is processed whole,
+in chunks or one packet at a time:
+
+- ``size_cumsum``, ``size_rate`` and ``packet_count``: the original features of
+  ``build_features.feature_engineering``;
+- ``iat``: time since the previous packet of the same direction;
+- ``burst_packets``/``burst_bytes``: packets and bytes so far in the current
+  burst of the direction. A burst is a run of packets less than ``burst_gap``
+  seconds apart;
+- ``byte_rate_<w>s``/``packet_rate_<w>s``: the direction's bytes and packets
+  per second over the last ``w`` seconds, as exponentially decayed sums with
+  time constant ``w``. Packets sharing a timestamp add up instead of giving a
+  zero time delta;
+- ``up_down_ratio_<w>s``: uplink over downlink byte rate at the packet's time.
+
+Within a batch, every quantity is computed with NumPy over the packets of each
+direction. The decayed sums use cumulative sums rescaled by the elapsed time,
+split wherever the rescaling would overflow. Single live packets go through
+``push``, a scalar version of the same updates.
+"""
+import math
+
+import numpy as np
+import pandas as pd
+
+# Time constants of the byte/packet rates, in seconds
+WINDOWS = (1, 10)
+
+# Largest gap in seconds between two packets of the same burst
+BURST_GAP = 0.01
+
+UPLINK = 'UL'
+DOWNLINK = 'DL'
+
+# Largest exponent of the rescaling of a decayed sum, exp(600) is still a finite float64
+_MAX_EXPONENT = 600
+
+
+def window_name(window):
+    return f'{window:g}s'
+
+
+def feature_names(windows=WINDOWS):
+    """Columns produced by ``TrafficEngine``, in order."""
+    names = ['size_cumsum', 'size_rate', 'packet_count', 'iat', 'burst_packets', 'burst_bytes']
+    for window in windows:
+        names += [f'byte_rate_{window_name(window)}', f'packet_rate_{window_name(window)}',
+                  f'up_down_ratio_{window_name(window)}']
+    return names
+
+
+def decayed_sums(time, values, tau, carry=0.0, carry_time=np.nan):
+    """
+    Exponentially decayed running sums ``sum_j values_j * exp(-(time_i - time_j) / tau)`` over ``j <= i``.
+
+    Parameters:
+    - time: Non-decreasing times of the values.
+    - values: Values added at those times.
+    - tau: Time constant.
+    - carry, carry_time: Decayed sum of the earlier values and its time.
+
+    Returns:
+    - The sums at every time, and the last sum and time to carry to the next batch.
+    """
+    out = np.empty(len(time))
+    start = 0
+    while start < len(time):
+        origin = time[start]
+        stop = max(start + 1, np.searchsorted(time, origin + _MAX_EXPONENT * tau, side='right'))
+        growth = np.exp((time[start:stop] - origin) / tau)
+        out[start:stop] = np.cumsum(values[start:stop] * growth) / growth
+        if carry:
+            out[start:stop] += carry * np.exp(-(time[start:stop] - carry_time) / tau)
+        carry, carry_time = out[stop - 1], time[stop - 1]
+        start = stop
+    return out, carry, carry_time
+
+
+class _DirectionState:
+    """Running state of the packets of one direction."""
+
+    __slots__ = ('last_time', 'size_total', 'packets', 'burst_packets', 'burst_bytes', 'rates')
+
+    def __init__(self, windows):
+        self.last_time = np.nan
+        self.size_total = 0.0
+        self.packets = 0
+        self.burst_packets = 0
+        self.burst_bytes = 0.0
+        # Per window: decayed bytes, decayed packets and the time they were last updated
+        self.rates = {window: [0.0, 0.0, np.nan] for window in windows}
+
+
+class TrafficEngine:
+    """
+    Flow features of the packets of one capture, batch after batch.
+
+    Parameters:
+    - windows: Time constants of the byte/packet rates, in seconds.
+    - burst_gap: Largest gap in seconds between two packets of the same burst.
+    """
+
+    def __init__(self, windows=WINDOWS, burst_gap=BURST_GAP):
+        self.windows = tuple(windows)
+        self.burst_gap = burst_gap
+        self._last_time = None
+        self._max_time = -np.inf
+        self._directions = {}
+
+    def _direction(self, direction):
+        if direction not in self._directions:
+            self._directions[direction] = _DirectionState(self.windows)
+        return self._directions[direction]
+
+    def process(self, time, direction, size):
+        """
+        Features of the next packets of the capture.
+
+        Parameters:
+        - time, direction, size: Arrays of the packets, in capture order.
+
+        Returns:
+        - A dictionary with the ``feature_names`` as keys and float arrays as values.
+        """
+        time = np.asarray(time, dtype=np.float64)
+        direction = np.asarray(direction, dtype=object)
+        size = np.asarray(size, dtype=np.float64)
+        n = len(time)
+        out = {name: np.full(n, np.nan) for name in feature_names(self.windows)}
+        if not n:
+            return out
+
+        # Original Δt over all the packets, in row order
+        dt = np.empty(n)
+        dt[0] = 0 if self._last_time is None else time[0] - self._last_time
+        dt[1:] = np.diff(time)
+        self._last_time = time[-1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            out['size_rate'] = np.where(dt != 0, size / np.where(dt != 0, dt, 1), np.nan)
+
+        # Late packets count as arriving with the latest one, so the running state only moves forward
+        clock = np.maximum.accumulate(np.r_[self._max_time, time])[1:]
+        self._max_time = clock[-1]
+
+        direction_rows = {}
+        rates = {}
+        for value in pd.unique(direction):
+            rows = np.flatnonzero(direction == value)
+            if not len(rows):
+                continue
+            state = self._direction(value)
+            self._process_direction(state, rows, clock, size, out)
+            direction_rows[value] = rows
+            rates[value] = self._direction_rates(state, rows, clock, size)
+
+        for window in self.windows:
+            name = window_name(window)
+            for value, rows in direction_rows.items():
+                out[f'byte_rate_{name}'][rows] = rates[value][window][0][rows]
+                out[f'packet_rate_{name}'][rows] = rates[value][window][1][rows]
+            uplink = self._rates_at(UPLINK, rates, window, clock)
+            downlink = self._rates_at(DOWNLINK, rates, window, clock)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                out[f'up_down_ratio_{name}'] = np.where(downlink > 0, uplink / np.where(downlink > 0, downlink, 1),
+                                                        np.nan)
+        return out
+
+    def push(self, time, direction, size):
+        """
+        Features of the next single packet, as ``process`` computes them without the array overhead.
+
+        Returns:
+        - A dictionary with the ``feature_names`` as keys and floats as values.
+        """
+        out = dict.fromkeys(feature_names(self.windows), math.nan)
+        dt = 0 if self._last_time is None else time - self._last_time
+        self._last_time = time
+        out['size_rate'] = size / dt if dt != 0 else math.nan
+        clock = max(self._max_time, time)
+        self._max_time = clock
+        if direction != direction:
+            return out
+
+        state = self._direction(direction)
+        state.size_total += size
+        state.packets += 1
+        out['size_cumsum'] = state.size_total
+        out['packet_count'] = state.packets
+
+        iat = clock - state.last_time
+        if iat <= self.burst_gap:
+            state.burst_packets += 1
+            state.burst_bytes += size
+        else:
+            state.burst_packets = 1
+            state.burst_bytes = size
+        state.last_time = clock
+        out['iat'] = iat
+        out['burst_packets'] = state.burst_packets
+        out['burst_bytes'] = state.burst_bytes
+
+        for window in self.windows:
+            name = window_name(window)
+            decayed_bytes, decayed_packets, updated = state.rates[window]
+            decay = math.exp(-(clock - updated) / window) if decayed_bytes or decayed_packets else 0.0
+            state.rates[window] = [decayed_bytes * decay + size, decayed_packets * decay + 1, clock]
+            out[f'byte_rate_{name}'] = state.rates[window][0] / window
+            out[f'packet_rate_{name}'] = state.rates[window][1] / window
+
+            uplink, downlink = self._rate_now(UPLINK, window, clock), self._rate_now(DOWNLINK, window, clock)
+            out[f'up_down_ratio_{name}'] = uplink / downlink if downlink > 0 else math.nan
+        return out
+
+    def _rate_now(self, direction, window, clock):
+        state = self._directions.get(direction)
+        if state is None or not state.rates[window][0]:
+            return 0.0
+        decayed_bytes, _, updated = state.rates[window]
+        return decayed_bytes * math.exp(-(clock - updated) / window) / window
+
+    def _process_direction(self, state, rows, clock, size, out):
+        """Running totals, inter-arrival times and bursts of one direction's packets."""
+        times = clock[rows]
+        sizes = size[rows]
+        cumsum = np.cumsum(sizes)
+        count = np.arange(1, len(rows) + 1)
+        out['size_cumsum'][rows] = state.size_total + cumsum
+        out['packet_count'][rows] = state.packets + count
+
+        previous = np.r_[state.last_time, times[:-1]]
+        iat = times - previous
+        out['iat'][rows] = iat
+
+        # A packet opens a burst unless it closely follows the previous one of its direction
+        opens = ~(iat <= self.burst_gap)
+        positions = np.arange(len(rows))
+        start = np.maximum.accumulate(np.where(opens, positions, -1))
+        carried = start < 0
+        before = np.where(start > 0, cumsum[np.maximum(start, 1) - 1], 0)
+        out['burst_packets'][rows] = np.where(carried, state.burst_packets + count, positions - start + 1)
+        out['burst_bytes'][rows] = np.where(carried, state.burst_bytes + cumsum, cumsum - before)
+
+        state.last_time = times[-1]
+        state.size_total += cumsum[-1]
+        state.packets += len(rows)
+        state.burst_packets = int(out['burst_packets'][rows[-1]])
+        state.burst_bytes = float(out['burst_bytes'][rows[-1]])
+
+    def _direction_rates(self, state, rows, clock, size):
+        """Byte and packet rates of one direction at every packet of the batch, for every window."""
+        bytes_added = np.zeros(len(clock))
+        bytes_added[rows] = size[rows]
+        packets_added = np.zeros(len(clock))
+        packets_added[rows] = 1
+        rates = {}
+        for window in self.windows:
+            decayed_bytes, decayed_packets, updated = state.rates[window]
+            byte_sums, decayed_bytes, last = decayed_sums(clock, bytes_added, window, decayed_bytes, updated)
+            packet_sums, decayed_packets, _ = decayed_sums(clock, packets_added, window, decayed_packets, updated)
+            state.rates[window] = [decayed_bytes, decayed_packets, last]
+            rates[window] = (byte_sums / window, packet_sums / window)
+        return rates
+
+    def _rates_at(self, direction, rates, window, clock):
+        """Byte rate of a direction at every packet of the batch, decayed from its state if it sent none."""
+        if direction in rates:
+            return rates[direction][window][0]
+        state = self._directions.get(direction)
+        if state is None or not state.rates[window][0]:
+            return np.zeros(len(clock))
+        decayed_bytes, _, updated = state.rates[window]
+        return decayed_bytes * np.exp(-(clock - updated) / window) / window
+
+
+def traffic_features(df, engine=None):
+    """
+    Flow features of the packets of a capture, see ``TrafficEngine``.
+
+    Parameters:
+    - df: Packets with ``time``, ``direction`` and ``size`` columns, in capture order.
+    - engine: ``TrafficEngine`` carrying the state of the previous packets, a new one by default.
+
+    Returns:
+    - A DataFrame with the ``feature_names`` as columns and ``df``'s index.
+    """
+    engine = engine or TrafficEngine()
+    features = engine.process(df['time'].to_numpy(), df['direction'].to_numpy(), df['size'].to_numpy())
+    return pd.DataFrame(features, index=df.index)
@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+"""Open-set user matching with an approximate nearest-neighbour fingerprint index.
+
+Instead of a classifier over a closed set of IDs, every user is enrolled as a
+few prototype embeddings of their interval statistics. ``Embedder`` projects
+cleaned feature rows onto their principal components and normalises them to
+unit length. ``FingerprintIndex`` is an inverted file (IVF) index of the
+prototypes: a k-means coarse quantizer splits the space into lists, and a query
+only scans the ``nprobe`` lists closest to it. Users are added and removed
+without retraining anything. A query whose best match is farther than
+``threshold`` is reported as an unknown user.
+"""
+import logging
+import time
+
+import click
+import joblib
+import numpy as np
+import pandas as pd
+
+from src.data.storage import read_table
+from src.models.train_model import INTERVAL_COLUMNS, SEED, features_and_labels
+
+UNKNOWN = None
+
+
+def normalize(vectors):
+    """Scale rows to unit length."""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def kmeans(vectors, k, iterations=20, seed=SEED):
+    """
+    Lloyd's k-means with k-means++ seeding.
+
+    Returns:
+    - The ``(k, dim)`` centroids, fewer if there are fewer distinct vectors.
+    """
+    rng = np.random.default_rng(seed)
+    k = min(k, len(vectors))
+    centroids = [vectors[rng.integers(len(vectors))]]
+    distances = ((vectors - centroids[0]) ** 2).sum(axis=1)
+    for _ in range(1, k):
+        if distances.sum() == 0:
+            break
+        centroids.append(vectors[rng.choice(len(vectors), p=distances / distances.sum())])
+        distances = np.minimum(distances, ((vectors - centroids[-1]) ** 2).sum(axis=1))
+    centroids = np.array(centroids)
+
+    for _ in range(iterations):
+        assignment = _nearest(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        counts = np.bincount(assignment, minlength=len(centroids))[:, None]
+        updated = np.where(counts > 0, sums / np.maximum(counts, 1), centroids)
+        if np.allclose(updated, centroids):
+            break
+        centroids = updated
+    return centroids
+
+
+def _nearest(vectors, centroids):
+    """Index of the nearest centroid of every vector."""
+    distances = (centroids ** 2).sum(axis=1) - 2 * vectors @ centroids.T
+    return np.argmin(distances, axis=1)
+
+
+class Embedder:
+    """Principal component projection of cleaned feature rows onto the unit sphere."""
+
+    def __init__(self, dim=32):
+        self.dim = dim
+        self.columns = []
+        self.mean = None
+        self.scale = None
+        self.components = None
+
+    def fit(self, X):
+        """Learn the projection from a DataFrame of cleaned feature rows."""
+        self.columns = list(X.columns)
+        values = np.nan_to_num(X.to_numpy(dtype=np.float64))
+        self.mean = values.mean(axis=0)
+        self.scale = values.std(axis=0)
+        self.scale[self.scale == 0] = 1
+        _, _, vt = np.linalg.svd((values - self.mean) / self.scale, full_matrices=False)
+        self.components = vt[:self.dim].T
+        return self
+
+    def transform(self, X):
+        """Unit-length embeddings of the rows of ``X``."""
+        values = np.nan_to_num(X[self.columns].to_numpy(dtype=np.float64))
+        return normalize(((values - self.mean) / self.scale) @ self.components)
+
+
+class _InvertedList:
+    """Row numbers of the prototypes of one IVF list, in a growable array."""
+
+    def __init__(self):
+        self.rows = np.empty(16, dtype=np.intp)
+        self.size = 0
+
+    def append(self, row):
+        if self.size == len(self.rows):
+            self.rows = np.resize(self.rows, 2 * len(self.rows))
+        self.rows[self.size] = row
+        self.size += 1
+
+    def remove(self, row):
+        position = np.flatnonzero(self.rows[:self.size] == row)[0]
+        self.size -= 1
+        self.rows[position] = self.rows[self.size]
+
+
+class FingerprintIndex:
+    """
+    IVF index of user prototype embeddings.
+
+    Parameters:
+    - dim: Dimension of the embeddings.
+    - nprobe: Number of lists scanned per query.
+    - threshold: Squared distance above which the best match is an unknown user, None to always match.
+    """
+
+    def __init__(self, dim, nprobe=8, threshold=None):
+        self.dim = dim
+        self.nprobe = nprobe
+        self.threshold = threshold
+        self.centroids = np.zeros((1, dim))
+        self._lists = [_InvertedList()]
+        self._vectors = np.empty((1024, dim))
+        self._users = []
+        self._list_of_row = []
+        self._free = []
+        self._rows_of_user = {}
+
+    def __len__(self):
+        return len(self._rows_of_user)
+
+    @property
+    def users(self):
+        return list(self._rows_of_user)
+
+    def train(self, vectors, nlist=None):
+        """Fit the coarse quantizer on sample embeddings and reassign the enrolled prototypes.
+
+        ``nlist`` defaults to about 4 √n lists for n sample vectors.
+        """
+        nlist = nlist or max(1, int(4 * np.sqrt(len(vectors))))
+        self.centroids = kmeans(np.asarray(vectors, dtype=np.float64), nlist)
+        self._lists = [_InvertedList() for _ in range(len(self.centroids))]
+        for row, user in enumerate(self._users):
+            if user is not UNKNOWN:
+                self._assign(row)
+        return self
+
+    def _assign(self, row):
+        list_id = int(_nearest(self._vectors[row:row + 1], self.centroids)[0])
+        self._lists[list_id].append(row)
+        self._list_of_row[row] = list_id
+
+    def add(self, user, embeddings, prototypes=1):
+        """
+        Enroll a user, or add prototypes to an enrolled one.
+
+        Parameters:
+        - user: Identifier of the user.
+        - embeddings: Embeddings of the user's intervals.
+        - prototypes: Number of k-means prototypes kept, 1 keeps the mean embedding.
+        """
+        embeddings = np.atleast_2d(np.asarray(embeddings, dtype=np.float64))
+        if prototypes == 1:
+            vectors = normalize(embeddings.mean(axis=0, keepdims=True))
+        else:
+            vectors = normalize(kmeans(embeddings, prototypes))
+
+        for vector in vectors:
+            if self._free:
+                row = self._free.pop()
+            else:
+                row = len(self._users)
+                if row == len(self._vectors):
+                    self._vectors = np.resize(self._vectors, (2 * len(self._vectors), self.dim))
+                self._users.append(UNKNOWN)
+                self._list_of_row.append(-1)
+            self._vectors[row] = vector
+            self._users[row] = user
+            self._rows_of_user.setdefault(user, []).append(row)
+            self._assign(row)
+
+    def remove(self, user):
+        """Forget a user."""
+        for row in self._rows_of_user.pop(user):
+            self._lists[self._list_of_row[row]].remove(row)
+            self._users[row] = UNKNOWN
+            self._list_of_row[row] = -1
+            self._free.append(row)
+
+    def search(self, embedding, k=5, nprobe=None):
+        """
+        Closest enrolled users of one embedding.
+
+        Returns:
+        - Up to ``k`` ``(user, squared distance)`` pairs, closest first.
+        """
+        query = normalize(np.asarray(embedding, dtype=np.float64))
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        centroid_distances = ((self.centroids - query) ** 2).sum(axis=1)
+        probe = np.argpartition(centroid_distances, nprobe - 1)[:nprobe]
+
+        rows = np.concatenate([self._lists[list_id].rows[:self._lists[list_id].size] for list_id in probe])
+        if not len(rows):
+            return []
+        # Squared Euclidean distance of unit vectors
+        distances = 2 - 2 * (self._vectors[rows] @ query)
+
+        # Enough candidates for k distinct users even when they have several prototypes
+        order = np.argsort(distances)
+        matches = []
+        seen = set()
+        for position in order:
+            user = self._users[rows[position]]
+            if user not in seen:
+                seen.add(user)
+                matches.append((user, float(max(distances[position], 0))))
+                if len(matches) == k:
+                    break
+        return matches
+
+    def identify(self, embeddings, k=5, nprobe=None):
+        """
+        Identify the user of one or more interval embeddings of a session.
+
+        Returns:
+        - The best matching user, or ``UNKNOWN`` beyond ``threshold``, and the top-k matches.
+        """
+        embeddings = np.atleast_2d(embeddings)
+        matches = self.search(embeddings.mean(axis=0), k, nprobe)
+        if not matches or (self.threshold is not None and matches[0][1] > self.threshold):
+            return UNKNOWN, matches
+        return matches[0][0], matches
+
+    def save(self, path):
+        joblib.dump(self, path)
+
+    @classmethod
+    def load(cls, path):
+        return joblib.load(path)
+
+
+def _synthetic_users(n_users, dim, samples, noise, rng):
+    centers = normalize(rng.normal(size=(n_users, dim)))
+    embeddings = normalize(centers[:, None, :] + noise * rng.normal(size=(n_users, samples, dim)) / np.sqrt(dim))
+    return embeddings
+
+
+def benchmark_index(user_counts=(100, 1000, 10000), dim=32, nprobes=(1, 4, 16), queries=500, samples=6, noise=0.5,
+                    seed=SEED):
+    """
+    Recall and latency of the index as the number of enrolled users grows.
+
+    Users are synthetic clusters of interval embeddings. Every user is enrolled
+    with the mean of ``samples`` embeddings and queried with a fresh one.
+
+    Returns:
+    - A DataFrame with, per number of users and ``nprobe``: the recall@1 against
+      the true user and against an exact search, and the mean/p99 query latency.
+    """
+    rng = np.random.default_rng(seed)
+    rows = []
+    for n_users in user_counts:
+        enrolled = _synthetic_users(n_users, dim, samples + 1, noise, rng)
+        index = FingerprintIndex(dim)
+        means = normalize(enrolled[:, :samples].mean(axis=1))
+        index.train(means)
+        for user in range(n_users):
+            index.add(user, enrolled[user, :samples])
+
+        queried = rng.choice(n_users, size=min(queries, n_users), replace=False)
+        query_vectors = enrolled[queried, samples]
+        exact = np.argmax(query_vectors @ means.T, axis=1)
+
+        for nprobe in nprobes:
+            latencies = []
+            found = []
+            for vector in query_vectors:
+                start = time.perf_counter()
+                matches = index.search(vector, k=1, nprobe=nprobe)
+                latencies.append(time.perf_counter() - start)
+                found.append(matches[0][0] if matches else -1)
+            found = np.array(found)
+            rows.append({
+                'users': n_users,
+                'lists': len(index.centroids),
+                'nprobe': nprobe,
+                'recall@1': float(np.mean(found == queried)),
+                'recall@1 (vs exact)': float(np.mean(found == exact)),
+                'latency mean (ms)': 1000 * float(np.mean(latencies)),
+                'latency p99 (ms)': 1000 * float(np.percentile(latencies, 99)),
+            })
+    return pd.DataFrame(rows)
+
+
+def session_embeddings(embedder, df):
+    """Embeddings of a cleaned dataset grouped by ID, as a dictionary."""
+    X, y = features_and_labels(df)
+    X = X.drop(columns=[col for col in INTERVAL_COLUMNS if col in X.columns])
+    embeddings = embedder.transform(X)
+    return {user: embeddings[(y == user).to_numpy()] for user in pd.unique(y)}
+
+
+@click.group()
+def main():
+    """Enrolls and identifies users with the fingerprint index."""
+
+
+@main.command()
+@click.argument('input_filepath', type=click.Path(exists=True))
+@click.argument('index_filepath', type=click.Path(dir_okay=False))
+@click.option('--dim', type=click.IntRange(min=1), default=32, show_default=True, help='Embedding dimension.')
+@click.option('--prototypes', type=click.IntRange(min=1), default=1, show_default=True,
+              help='Prototype embeddings stored per user.')
+@click.option('--threshold', type=float, default=None, help='Squared distance beyond which a user is unknown.')
+def enroll(input_filepath, index_filepath, dim=32, prototypes=1, threshold=None):
+    """Enrolls every ID of a cleaned dataset into a new index."""
+    df = read_table(input_filepath)
+    X, _ = features_and_labels(df)
+    embedder = Embedder(dim).fit(X.drop(columns=[col for col in INTERVAL_COLUMNS if col in X.columns]))
+    sessions = session_embeddings(embedder, df)
+
+    index = FingerprintIndex(embedder.components.shape[1], threshold=threshold)
+    # About 4 √n lists for the n prototypes the index will hold
+    nlist = max(1, int(4 * np.sqrt(len(sessions) * prototypes)))
+    index.train(np.concatenate(list(sessions.values())), nlist)
+    for user, embeddings in sessions.items():
+        index.add(user, embeddings, prototypes)
+    joblib.dump({'embedder': embedder, 'index': index}, index_filepath)
+    logging.getLogger(__name__).info('Enrolled %d users', len(index))
+
+
+@main.command()
+@click.argument('index_filepath', type=click.Path(exists=True, dir_okay=False))
+@click.argument('input_filepath', type=click.Path(exists=True))
+@click.option('-k', type=click.IntRange(min=1), default=5, show_default=True, help='Number of matches listed.')
+def identify(index_filepath, input_filepath, k=5):
+    """Identifies the user of every ID of a cleaned dataset."""
+    saved = joblib.load(index_filepath)
+    matches = []
+    for user, embeddings in session_embeddings(saved['embedder'], read_table(input_filepath)).items():
+        best, top = saved['index'].identify(embeddings, k)
+        matches.append({'ID': user, 'match': best, 'top': top})
+    matches = pd.DataFrame(matches)
+    print(matches.to_string(index=False))
+    logging.getLogger(__name__).info('Top-1 accuracy: %.4f', (matches['ID'] == matches['match']).mean())
+
+
+@main.command()
+@click.option('--users', 'user_counts', type=click.IntRange(min=1), multiple=True, default=(100, 1000, 10000),
+              show_default=True, help='Numbers of enrolled users, repeatable.')
+@click.option('--dim', type=click.IntRange(min=1), default=32, show_default=True, help='Embedding dimension.')
+def benchmark(user_counts, dim=32):
+    """Measures recall and latency as the number of enrolled users grows."""
+    print(benchmark_index(user_counts, dim).to_string(index=False))
+
+
+if __name__ == '__main__':
+    log_fmt = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    logging.basicConfig(level=logging.INFO, format=log_fmt)
+
+    main()
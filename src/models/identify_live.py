@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""Identify the user wearing the headset from live telemetry.
+
+Raw movement/traffic samples are read as CSV lines, header first, from stdin
+or from TCP connections (one session per connection). Each sample updates the
+running statistics of its 10 second interval (see ``features.online``). When an
+interval closes, its statistics are cleaned with the fitted ``Preprocessor``
+of the training dataset and classified off the event loop. The predicted ID and
+its confidence, averaged over a sliding window of the last intervals, are
+written as a JSON line.
+"""
+import asyncio
+import csv
+import json
+import logging
+import sys
+import time
+from collections import Counter, deque
+
+import click
+import joblib
+import numpy as np
+import pandas as pd
+
+from src.features.online import DEFAULT_RESERVOIR, OnlineSession, parse_value
+from src.models.train_model import INTERVAL_COLUMNS, LABEL_COLUMNS
+from src.process.preprocessor import Preprocessor
+
+
+class LiveIdentifier:
+    """
+    Classify closed intervals with a trained model.
+
+    Parameters:
+    - model: Classifier fitted on a cleaned ``*_stat`` dataset without its ID and time_interval columns.
+    - preprocessor: ``Preprocessor`` fitted on that dataset.
+    - window: Number of consecutive intervals the prediction is averaged over.
+    """
+
+    def __init__(self, model, preprocessor, window=6):
+        self.model = model
+        self.preprocessor = preprocessor
+        self.window = window
+
+        features = getattr(model, 'feature_names_in_', None)
+        # Models trained on compact arrays take the features in the cleaned dataset's order
+        self._named = features is not None
+        if features is None:
+            features = [col for col in preprocessor.output_columns if col not in LABEL_COLUMNS + INTERVAL_COLUMNS]
+        self.features = list(features)
+        output_index = {col: j for j, col in enumerate(preprocessor.output_columns)}
+        self._feature_index = np.array([output_index[col] for col in self.features], dtype=np.intp)
+        self._label = next((col for col in LABEL_COLUMNS if col in preprocessor.vocabularies), None)
+
+    def new_history(self):
+        """Sliding window of the predictions of one session."""
+        return deque(maxlen=self.window)
+
+    def decode(self, label):
+        """Original ID of an encoded label."""
+        if self._label is None or not isinstance(label, (int, np.integer)):
+            return label
+        vocabulary = self.preprocessor.vocabularies[self._label]
+        return vocabulary[label] if 0 <= label < len(vocabulary) else int(label)
+
+    def predict(self, stats, history):
+        """Predict the user of one interval's statistics, updating the session's ``history``.
+
+        Returns:
+        - The ID predicted over the window and its mean probability, or its share of the
+          votes for models without ``predict_proba``.
+        """
+        values = [stats.get(col, np.nan) for col in self.preprocessor.columns]
+        row = self.preprocessor.transform_values(values)[self._feature_index]
+        if self._named:
+            X = pd.DataFrame([row], columns=self.features)
+        else:
+            X = row[None, :].astype(np.float32)
+
+        if hasattr(self.model, 'predict_proba'):
+            history.append(self.model.predict_proba(X)[0])
+            probabilities = np.mean(history, axis=0)
+            best = int(np.argmax(probabilities))
+            label, confidence = self.model.classes_[best], probabilities[best]
+        else:
+            history.append(self.model.predict(X)[0])
+            label, votes = Counter(history).most_common(1)[0]
+            confidence = votes / len(history)
+        label = self.decode(label.item() if hasattr(label, 'item') else label)
+        return label, float(confidence)
+
+
+async def _predict_intervals(queue, identifier, emit, session_name):
+    """Classify the closed intervals of one session in order, in a worker thread."""
+    loop = asyncio.get_running_loop()
+    history = identifier.new_history()
+    while True:
+        item = await queue.get()
+        if item is None:
+            break
+        interval, stats, latencies = item
+        label, confidence = await loop.run_in_executor(None, identifier.predict, stats, history)
+        emit({
+            'session': session_name,
+            'interval_start': interval * 10,
+            'time_interval': interval // 6 + 1,
+            'ID': label,
+            'confidence': round(confidence, 4),
+            'samples': len(latencies),
+            'latency_ms_mean': round(1000 * float(np.mean(latencies)), 4) if latencies else None,
+            'latency_ms_max': round(1000 * max(latencies), 4) if latencies else None,
+        })
+
+
+async def identify_session(reader, identifier, data_type, emit, reservoir=DEFAULT_RESERVOIR, session_name='stdin'):
+    """
+    Identify the user of one live session.
+
+    Parameters:
+    - reader: ``asyncio.StreamReader`` of CSV lines, starting with the raw table's header.
+    - identifier: ``LiveIdentifier`` of the session's data type.
+    - data_type: ``movement`` or ``traffic``.
+    - emit: Called with the prediction of every closed interval.
+    """
+    header = await reader.readline()
+    if not header:
+        return
+    columns = [col.strip() for col in next(csv.reader([header.decode()]))]
+    session = OnlineSession(columns, data_type, reservoir=reservoir)
+
+    # Predictions run concurrently with ingestion, so a slow model does not delay the samples
+    queue = asyncio.Queue()
+    predictor = asyncio.create_task(_predict_intervals(queue, identifier, emit, session_name))
+
+    latencies = []
+    try:
+        async for line in reader:
+            start = time.perf_counter()
+            fields = next(csv.reader([line.decode()]), None)
+            if not fields:
+                continue
+            closed = session.push([parse_value(field) for field in fields])
+            latencies.append(time.perf_counter() - start)
+            for interval, stats in closed:
+                queue.put_nowait((interval, stats, latencies))
+                latencies = []
+
+        for interval, stats in session.flush():
+            queue.put_nowait((interval, stats, latencies))
+            latencies = []
+    finally:
+        queue.put_nowait(None)
+        await predictor
+
+
+async def _stdin_reader():
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    return reader
+
+
+def _print_json(event):
+    print(json.dumps(event), flush=True)
+
+
+async def identify_stdin(identifier, data_type, reservoir=DEFAULT_RESERVOIR):
+    """Identify the user of the session piped to stdin, printing JSON lines."""
+    await identify_session(await _stdin_reader(), identifier, data_type, _print_json, reservoir)
+
+
+async def serve(identifier, data_type, host, port, reservoir=DEFAULT_RESERVOIR):
+    """Identify the users of every session connecting to ``host:port``.
+
+    Predictions are printed as JSON lines and also sent back on the session's connection.
+    """
+    logger = logging.getLogger(__name__)
+
+    async def handle(reader, writer):
+        peer = writer.get_extra_info('peername')
+        session_name = f'{peer[0]}:{peer[1]}' if peer else 'socket'
+
+        def emit(event):
+            _print_json(event)
+            writer.write((json.dumps(event) + '\n').encode())
+
+        logger.info('Session %s connected', session_name)
+        try:
+            await identify_session(reader, identifier, data_type, emit, reservoir, session_name)
+            await writer.drain()
+        except (ValueError, KeyError, ConnectionError) as error:
+            logger.error('Session %s failed: %r', session_name, error)
+        finally:
+            writer.close()
+            logger.info('Session %s closed', session_name)
+
+    server = await asyncio.start_server(handle, host, port)
+    logger.info('Listening on %s', ', '.join(str(sock.getsockname()) for sock in server.sockets))
+    async with server:
+        await server.serve_forever()
+
+
+@click.command()
+@click.argument('model_filepath', type=click.Path(exists=True, dir_okay=False))
+@click.argument('preprocessor_filepath', type=click.Path(exists=True, dir_okay=False))
+@click.argument('data_type', type=click.Choice(['movement', 'traffic']))
+@click.option('--window', type=click.IntRange(min=1), default=6, show_default=True,
+              help='Number of 10 second intervals the prediction is averaged over.')
+@click.option('--port', type=int, default=None, help='Serve sessions on this TCP port instead of reading stdin.')
+@click.option('--host', default='127.0.0.1', show_default=True, help='Address to listen on with --port.')
+@click.option('--reservoir', type=click.IntRange(min=1), default=DEFAULT_RESERVOIR, show_default=True,
+              help='Samples per interval kept for the quantiles.')
+def main(model_filepath, preprocessor_filepath, data_type, window=6, port=None, host='127.0.0.1',
+         reservoir=DEFAULT_RESERVOIR):
+    """Identifies users from live movement or traffic samples."""
+    identifier = LiveIdentifier(joblib.load(model_filepath), Preprocessor.load(preprocessor_filepath), window)
+    if port is None:
+        asyncio.run(identify_stdin(identifier, data_type, reservoir))
+    else:
+        asyncio.run(serve(identifier, data_type, host, port, reservoir))
+
+
+if __name__ == '__main__':
+    log_fmt = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    logging.basicConfig(level=logging.INFO, format=log_fmt, stream=sys.stderr)
+
+    main()
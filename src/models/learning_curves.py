@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""Learning curves over the number of training minutes and of training IDs.
+
+These are the curves of the model training notebook (``train_with_increasing_minutes``
+and ``train_with_increasing_ids``), built without redoing shared work at every
+step. The feature matrices are converted to arrays once and shipped once to
+each worker process. Every row's minute and ID rank is also computed once, so a
+step's training set is an index slice instead of an ``isin`` filter. The
+independent steps are fitted in parallel.
+
+``warm_start=True`` further makes the minutes curve grow a single
+``ExtraTreesClassifier``: each step adds ``trees_per_step`` trees fitted on the
+longer prefix instead of refitting a whole forest. Total cost then grows
+linearly with the number of steps rather than quadratically, at the price of an
+approximate curve.
+"""
+import logging
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import ExtraTreesClassifier
+from sklearn.metrics import accuracy_score
+
+from src.data.matrix import FeatureMatrix
+from src.data.dataset import FeatureDataset
+from src.data.storage import write_table
+from src.models.train_model import INTERVAL_COLUMNS, SEED, features_and_labels, find_column, load_split
+
+# Number of IDs added at every step of the IDs curve
+ID_STEP = 5
+
+# Trees of a forest fitted from scratch, also the final size of a warm-started forest
+N_ESTIMATORS = 100
+
+# Arrays shared by the steps, set once per worker process
+_DATA = {}
+
+
+def _init_worker(data, threads):
+    _DATA.clear()
+    _DATA.update(data, threads=threads)
+
+
+def _score_step(task):
+    """Fit a fresh forest on the selected training rows and score it on the selected test rows."""
+    train_index, test_index, fast_index = task
+    model = ExtraTreesClassifier(random_state=SEED, n_jobs=_DATA['threads'])
+    model.fit(_DATA['X'][train_index], _DATA['y'][train_index])
+
+    y_pred = model.predict(_DATA['X_test'][test_index])
+    y_pred_fast = model.predict(_DATA['fast_X'][fast_index])
+    return (accuracy_score(_DATA['y_test'][test_index], y_pred),
+            accuracy_score(_DATA['fast_y'][fast_index], y_pred_fast))
+
+
+def _run_steps(data, tasks, workers):
+    """Score every step, in a process pool when there are several workers."""
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(data, threads)) as executor:
+            return list(executor.map(_score_step, tasks))
+    _init_worker(data, threads)
+    try:
+        return [_score_step(task) for task in tasks]
+    finally:
+        _DATA.clear()
+
+
+def _as_arrays(X, y, X_test, y_test, fast_X, fast_y):
+    # Forests split on float32 features anyway, so this halves what is shipped to the workers for free
+    return {
+        'X': FeatureMatrix.from_frame(X).model_input(), 'y': y.to_numpy(),
+        'X_test': FeatureMatrix.from_frame(X_test).model_input(), 'y_test': y_test.to_numpy(),
+        'fast_X': FeatureMatrix.from_frame(fast_X[X.columns]).model_input(), 'fast_y': fast_y.to_numpy(),
+    }
+
+
+def _curve(steps, scores, step_name):
+    return pd.DataFrame({
+        step_name: list(steps),
+        'accuracy_slow': [slow for slow, _ in scores],
+        'accuracy_fast': [fast for _, fast in scores],
+    })
+
+
+def minutes_curve(X, y, X_test, y_test, fast_X, fast_y, workers=1, warm_start=False, trees_per_step=None):
+    """
+    Test accuracies of forests trained on the first 1, 2, ... minutes of the slow game.
+
+    Parameters:
+    - X, y: Slow game features, with the time interval column, and labels.
+    - X_test, y_test, fast_X, fast_y: Test sets without the time interval column.
+    - workers: Number of processes fitting the steps.
+    - warm_start: Grow one forest across the steps instead of refitting one per step.
+    - trees_per_step: Trees added per step with ``warm_start``, by default enough to end with ``N_ESTIMATORS``.
+
+    Returns:
+    - A DataFrame with the number of training seconds and the slow/fast test accuracies of every step.
+    """
+    interval = find_column(X, INTERVAL_COLUMNS)
+    unique_minutes = X[interval].unique()
+    # Position of every row's minute in order of appearance, so a prefix of minutes is ``rank < k``
+    rank = pd.Index(unique_minutes).get_indexer(X[interval])
+    data = _as_arrays(X.drop(columns=[interval]), y, X_test, y_test, fast_X, fast_y)
+    steps = range(1, len(unique_minutes))
+
+    if warm_start:
+        scores = _warm_minutes_scores(data, rank, steps, trees_per_step, workers)
+    else:
+        everything = slice(None)
+        tasks = [(np.flatnonzero(rank < k), everything, everything) for k in steps]
+        scores = _run_steps(data, tasks, workers)
+    return _curve(np.array(steps) * 60, scores, 'seconds')
+
+
+def _warm_minutes_scores(data, rank, steps, trees_per_step, workers):
+    """Minutes curve of a single forest growing ``trees_per_step`` trees per step."""
+    trees_per_step = trees_per_step or math.ceil(N_ESTIMATORS / max(1, len(steps)))
+    model = ExtraTreesClassifier(random_state=SEED, warm_start=True, n_jobs=workers)
+    classes = None
+    scores = []
+    for k in steps:
+        train_index = np.flatnonzero(rank < k)
+        model.set_params(n_estimators=trees_per_step * k)
+        model.fit(data['X'][train_index], data['y'][train_index])
+        if classes is not None and not np.array_equal(classes, model.classes_):
+            raise ValueError('Warm starting needs every ID in the first minute, use warm_start=False')
+        classes = model.classes_
+        scores.append((accuracy_score(data['y_test'], model.predict(data['X_test'])),
+                       accuracy_score(data['fast_y'], model.predict(data['fast_X']))))
+    return scores
+
+
+def ids_curve(X_train, y_train, X_test, y_test, fast_X, fast_y, workers=1, id_step=ID_STEP):
+    """
+    Test accuracies of forests trained on the first 1, 1 + ``id_step``, ... IDs, in sorted order.
+
+    Every step is tested on the rows of the IDs it was trained on.
+
+    Returns:
+    - A DataFrame with the number of training IDs and the slow/fast test accuracies of every step.
+    """
+    unique_ids = np.sort(y_train.unique())
+    index = pd.Index(unique_ids)
+    ranks = {}
+    for name, labels in [('train', y_train), ('test', y_test), ('fast', fast_y)]:
+        # Position of every row's ID among the sorted IDs; IDs never trained on are never selected
+        rank = index.get_indexer(labels)
+        rank[rank < 0] = len(unique_ids)
+        ranks[name] = rank
+    data = _as_arrays(X_train, y_train, X_test, y_test, fast_X, fast_y)
+
+    steps = range(1, len(unique_ids), id_step)
+    tasks = [tuple(np.flatnonzero(ranks[name] < num_ids) for name in ['train', 'test', 'fast'])
+             for num_ids in steps]
+    return _curve(steps, _run_steps(data, tasks, workers), 'ids')
+
+
+def plot_curve(curve, filepath, title):
+    """Save a learning curve as an image."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    step = curve.columns[0]
+    plt.figure(figsize=(30, 15))
+    plt.plot(curve[step], curve['accuracy_slow'], marker='o', linestyle='-', label="Slow Game")
+    plt.plot(curve[step], curve['accuracy_fast'], marker='o', linestyle='-', label="Fast Game")
+    plt.title(title)
+    plt.xlabel('Number of Seconds in Training Set' if step == 'seconds' else 'Number of IDs in Training Set')
+    plt.ylabel('Accuracy on Testing Set')
+    plt.legend()
+    plt.savefig(filepath)
+    plt.close()
+
+
+@click.command()
+@click.argument('slow_filepath', type=click.Path(exists=True))
+@click.argument('fast_filepath', type=click.Path(exists=True))
+@click.argument('output_dir', type=click.Path(file_okay=False), default='reports')
+@click.option('--curve', 'curves', type=click.Choice(['minutes', 'ids']), multiple=True,
+              help='Curve to compute, repeatable; both by default.')
+@click.option('--workers', type=click.IntRange(min=1), default=os.cpu_count() or 1, show_default=True,
+              help='Number of processes fitting the steps.')
+@click.option('--warm-start', is_flag=True, help='Grow one forest across the minutes curve (approximate).')
+@click.option('--trees-per-step', type=click.IntRange(min=1), default=None,
+              help='Trees added per step with --warm-start.')
+@click.option('--plot', is_flag=True, help='Also save the curves as PNG images.')
+def main(slow_filepath, fast_filepath, output_dir='reports', curves=(), workers=1, warm_start=False,
+         trees_per_step=None, plot=False):
+    """Computes the training minutes and training IDs learning curves."""
+    logger = logging.getLogger(__name__)
+    # The split is answered from the cached whole slow table
+    slow, fast = FeatureDataset(slow_filepath), FeatureDataset(fast_filepath)
+    slow_df = slow.select()
+    X_train, y_train, X_test, y_test, fast_X, fast_y = load_split(slow, fast)
+    os.makedirs(output_dir, exist_ok=True)
+
+    results = {}
+    if not curves or 'minutes' in curves:
+        X, y = features_and_labels(slow_df)
+        results['minutes'] = minutes_curve(X, y, X_test, y_test, fast_X, fast_y, workers, warm_start, trees_per_step)
+    if not curves or 'ids' in curves:
+        results['ids'] = ids_curve(X_train, y_train, X_test, y_test, fast_X, fast_y, workers)
+
+    for name, curve in results.items():
+        write_table(curve, os.path.join(output_dir, f'learning_curve_{name}.csv'))
+        if plot:
+            plot_curve(curve, os.path.join(output_dir, f'learning_curve_{name}.png'),
+                       f'Testing Set Accuracy vs. Number of Training {name.capitalize()}')
+        logger.info('%s curve:\n%s', name, curve.to_string(index=False))
+
+
+if __name__ == '__main__':
+    log_fmt = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    logging.basicConfig(level=logging.INFO, format=log_fmt)
+
+    main()
@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+"""Predict the users of statistics rows with a saved model.
+
+``BatchPredictor`` loads a model, and optionally the ``Preprocessor`` of its
+training dataset, once and predicts the top-k users of batches of feature
+rows with a single vectorised ``predict_proba`` call per batch.
+``MicroBatcher`` groups rows submitted one at a time, e.g. by concurrent
+requests, into batches of at most ``max_batch_size`` rows, waiting at most
+``max_wait`` seconds for a batch to fill. It records the latency of every
+request, so deployments can be sized from its p50/p99 latency and throughput.
+
+The command line predicts either a whole cleaned dataset, or JSON lines read
+from stdin (``-``), each holding the statistics of one interval.
+"""
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future
+
+import click
+import joblib
+import numpy as np
+import pandas as pd
+
+from src.data.storage import FORMATS, read_table, table_format, write_table
+from src.data.dataset import INTERVAL_COLUMNS, LABEL_COLUMNS, features_and_labels, find_column
+from src.process.preprocessor import Preprocessor
+
+DEFAULT_TOP_K = 3
+DEFAULT_BATCH_SIZE = 64
+# Longest a request waits for its batch to fill, in seconds
+DEFAULT_MAX_WAIT = 0.005
+
+_STOP = object()
+
+
+class BatchPredictor:
+    """
+    A saved model with the feature layout it was trained on.
+
+    Parameters:
+    - model: Classifier saved by ``train_model``.
+    - preprocessor: ``Preprocessor`` of the model's training dataset. Rows are then raw
+      ``*_stat`` statistics, cleaned before prediction, and predicted IDs are decoded.
+      Without it, rows are cleaned statistics and IDs are returned encoded.
+    - top_k: Number of most likely users returned per row.
+    - clean: False for rows that are already cleaned, the preprocessor then only decodes the IDs.
+    - features: Input columns of a model trained on arrays, the preprocessor's output columns by default.
+    """
+
+    def __init__(self, model, preprocessor=None, top_k=DEFAULT_TOP_K, clean=True, features=None):
+        self.model = model
+        self.preprocessor = preprocessor
+        self.top_k = top_k
+        self.clean = clean and preprocessor is not None
+
+        features = getattr(model, 'feature_names_in_', features)
+        # Models trained on compact arrays take the features in the cleaned dataset's order
+        self._named = hasattr(model, 'feature_names_in_')
+        if features is None:
+            if preprocessor is None:
+                raise ValueError('A model trained on arrays needs its feature columns or its preprocessor')
+            features = [col for col in preprocessor.output_columns if col not in LABEL_COLUMNS + INTERVAL_COLUMNS]
+        self.features = list(features)
+        self._vocabulary = None
+        if preprocessor is not None:
+            output_index = {col: j for j, col in enumerate(preprocessor.output_columns)}
+            self._feature_index = np.array([output_index[col] for col in self.features], dtype=np.intp)
+            label = next((col for col in LABEL_COLUMNS if col in preprocessor.vocabularies), None)
+            if label is not None:
+                self._vocabulary = np.asarray(preprocessor.vocabularies[label], dtype=object)
+
+    @classmethod
+    def load(cls, model_filepath, preprocessor_filepath=None, top_k=DEFAULT_TOP_K):
+        preprocessor = Preprocessor.load(preprocessor_filepath) if preprocessor_filepath else None
+        return cls(joblib.load(model_filepath), preprocessor, top_k)
+
+    @property
+    def input_columns(self):
+        """Columns of the rows to predict, in the order sequences must follow."""
+        return self.preprocessor.columns if self.clean else self.features
+
+    def rows_array(self, rows):
+        """
+        Stack rows into a 2D array ordered as ``input_columns``.
+
+        Parameters:
+        - rows: A DataFrame, or a list of mappings from column to value, or of sequences
+          ordered as ``input_columns``. Missing columns are NaN.
+        """
+        columns = self.input_columns
+        # Raw statistics may hold categories, cleaned ones are all numbers
+        dtype = object if self.clean else np.float64
+        if isinstance(rows, pd.DataFrame):
+            return rows.reindex(columns=columns).to_numpy(dtype=dtype)
+        if len(rows) and isinstance(rows[0], dict):
+            return np.array([[row.get(col, np.nan) for col in columns] for row in rows], dtype=dtype)
+        return np.asarray(rows, dtype=dtype).reshape(len(rows), len(columns))
+
+    def model_input(self, values):
+        """The model's input for rows ordered as ``input_columns``."""
+        if self.clean:
+            values = self.preprocessor.transform_values(values)[:, self._feature_index]
+        if self._named:
+            return pd.DataFrame(values, columns=self.features)
+        return np.asarray(values, dtype=np.float32)
+
+    def decode(self, labels):
+        """Original IDs of encoded labels, when the preprocessor holds their vocabulary."""
+        if self._vocabulary is None or labels.dtype.kind not in 'iu':
+            return labels
+        known = (labels >= 0) & (labels < len(self._vocabulary))
+        return np.where(known, self._vocabulary[np.where(known, labels, 0)], labels)
+
+    def predict(self, rows):
+        """
+        Top-k users of a batch of rows.
+
+        Returns:
+        - The predicted IDs and their probabilities, two arrays of shape (rows, k), most likely
+          first. Models without ``predict_proba`` give their single prediction probability 1.
+        """
+        X = self.model_input(self.rows_array(rows))
+        if not hasattr(self.model, 'predict_proba'):
+            labels = np.asarray(self.model.predict(X))[:, None]
+            return self.decode(labels), np.ones(labels.shape)
+
+        probabilities = self.model.predict_proba(X)
+        k = min(self.top_k, probabilities.shape[1])
+        best = np.argsort(-probabilities, axis=1, kind='stable')[:, :k]
+        labels = np.asarray(self.model.classes_)[best]
+        return self.decode(labels), np.take_along_axis(probabilities, best, axis=1)
+
+
+def latency_report(latencies, rows, seconds):
+    """p50/p99 latency in milliseconds and throughput of ``rows`` predicted in ``seconds``."""
+    latencies = np.asarray(latencies, dtype=np.float64)
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000 if len(latencies) else (np.nan, np.nan)
+    return {
+        'rows': int(rows),
+        'p50_ms': float(p50),
+        'p99_ms': float(p99),
+        'rows_per_s': rows / seconds if seconds > 0 else np.nan,
+    }
+
+
+class MicroBatcher:
+    """
+    Predict rows submitted one at a time in batches, on a background thread.
+
+    A batch is predicted as soon as it holds ``max_batch_size`` rows, or ``max_wait``
+    seconds after its first row arrived.
+
+    Parameters:
+    - predictor: ``BatchPredictor`` of the batches.
+    - max_batch_size: Most rows predicted at once.
+    - max_wait: Longest a row waits for its batch to fill, in seconds.
+    """
+
+    def __init__(self, predictor, max_batch_size=DEFAULT_BATCH_SIZE, max_wait=DEFAULT_MAX_WAIT):
+        self.predictor = predictor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.latencies = []
+        self.batch_sizes = []
+        self._first_submit = None
+        self._last_done = None
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, row):
+        """Queue one row, a mapping or a sequence as ``BatchPredictor.rows_array`` takes them.
+
+        Returns:
+        - A ``Future`` of the row's ``(labels, probabilities)``, most likely first.
+        """
+        future = Future()
+        now = time.perf_counter()
+        if self._first_submit is None:
+            self._first_submit = now
+        self._queue.put((row, future, now))
+        return future
+
+    def predict(self, row):
+        """Predict one row, blocking until its batch is done."""
+        return self.submit(row).result()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.perf_counter()))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._predict_batch(batch)
+
+    def _predict_batch(self, batch):
+        try:
+            labels, probabilities = self.predictor.predict([row for row, _, _ in batch])
+        except Exception as error:
+            for _, future, _ in batch:
+                future.set_exception(error)
+            return
+        done = time.perf_counter()
+        for i, (_, future, submitted) in enumerate(batch):
+            self.latencies.append(done - submitted)
+            future.set_result((labels[i], probabilities[i]))
+        self.batch_sizes.append(len(batch))
+        self._last_done = done
+
+    def close(self):
+        """Predict the queued rows and stop the background thread."""
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+        return False
+
+    def report(self):
+        """Latency percentiles and throughput of the rows predicted so far, and the mean batch size."""
+        seconds = (self._last_done - self._first_submit) if self._last_done is not None else 0
+        report = latency_report(self.latencies, len(self.latencies), seconds)
+        report['batches'] = len(self.batch_sizes)
+        report['mean_batch_size'] = float(np.mean(self.batch_sizes)) if self.batch_sizes else np.nan
+        return report
+
+
+def predict_dataset(model, df, top_k=1, batch_size=None, preprocessor=None):
+    """
+    Predict every row of a cleaned dataset.
+
+    Parameters:
+    - model: Classifier saved by ``train_model``.
+    - df: Cleaned dataset, with or without its ID column.
+    - top_k: Number of most likely users returned per row.
+    - batch_size: Rows predicted at once, all of them by default.
+    - preprocessor: ``Preprocessor`` of the dataset, only used to decode the true and predicted IDs.
+
+    Returns:
+    - A DataFrame with the time interval, the true ID when known, the predicted ID and its
+      probability, then ``predicted_<r>``/``probability_<r>`` for the next ``top_k - 1`` users.
+    - The per-batch latency report, see ``latency_report``.
+    """
+    if any(col in df.columns for col in LABEL_COLUMNS):
+        X, y = features_and_labels(df)
+    else:
+        X, y = df, None
+    interval = find_column(X, INTERVAL_COLUMNS)
+    predictor = BatchPredictor(model, preprocessor, top_k, clean=False, features=list(X.columns.drop(interval)))
+
+    batch_size = batch_size or max(len(X), 1)
+    labels, probabilities, latencies = [], [], []
+    start = time.perf_counter()
+    for begin in range(0, len(X), batch_size):
+        batch_start = time.perf_counter()
+        batch_labels, batch_probabilities = predictor.predict(X.iloc[begin:begin + batch_size])
+        latencies.append(time.perf_counter() - batch_start)
+        labels.append(batch_labels)
+        probabilities.append(batch_probabilities)
+    report = latency_report(latencies, len(X), time.perf_counter() - start)
+
+    predictions = pd.DataFrame({'time_interval': X[interval].to_numpy()})
+    if y is not None:
+        predictions['ID'] = predictor.decode(y.to_numpy())
+    if labels:
+        labels, probabilities = np.concatenate(labels), np.concatenate(probabilities)
+        for rank in range(labels.shape[1]):
+            suffix = '' if rank == 0 else f'_{rank + 1}'
+            predictions['predicted' + suffix] = labels[:, rank]
+            predictions['probability' + suffix] = probabilities[:, rank]
+    return predictions, report
+
+
+def predict_stream(predictor, lines, emit, max_batch_size=DEFAULT_BATCH_SIZE, max_wait=DEFAULT_MAX_WAIT):
+    """
+    Predict JSON lines of statistics rows with micro-batching.
+
+    Parameters:
+    - predictor: ``BatchPredictor`` of the rows.
+    - lines: Iterable of JSON objects, one row of statistics each.
+    - emit: Called with the prediction of every row, in input order.
+
+    Returns:
+    - The ``MicroBatcher.report`` of the stream.
+    """
+    pending = []
+    with MicroBatcher(predictor, max_batch_size, max_wait) as batcher:
+        for line in lines:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            pending.append((row, batcher.submit(row)))
+            # Emit the finished predictions in order without waiting for the rest
+            while pending and pending[0][1].done():
+                _emit_prediction(emit, *pending.pop(0))
+        for row, future in pending:
+            _emit_prediction(emit, row, future)
+    return batcher.report()
+
+
+def _emit_prediction(emit, row, future):
+    labels, probabilities = future.result()
+    labels = [label.item() if hasattr(label, 'item') else label for label in labels]
+    event = {col: row[col] for col in INTERVAL_COLUMNS if col in row}
+    event.update({
+        'ID': labels[0],
+        'probability': round(float(probabilities[0]), 4),
+        'top_k': [[label, round(float(probability), 4)] for label, probability in zip(labels, probabilities)],
+    })
+    emit(event)
+
+
+@click.command()
+@click.argument('model_filepath', type=click.Path(exists=True, dir_okay=False))
+@click.argument('input_filepath', type=click.Path(exists=True, allow_dash=True))
+@click.argument('output_filepath', type=click.Path(allow_dash=True))
+@click.option('--preprocessor', 'preprocessor_filepath', type=click.Path(exists=True, dir_okay=False), default=None,
+              help='Preprocessing state of the training dataset: rows read from stdin are then raw statistics, '
+                   'and predicted IDs are decoded.')
+@click.option('--top-k', type=click.IntRange(min=1), default=1, show_default=True,
+              help='Number of most likely users returned per row.')
+@click.option('--batch-size', type=click.IntRange(min=1), default=DEFAULT_BATCH_SIZE, show_default=True,
+              help='Most rows predicted at once.')
+@click.option('--max-wait-ms', type=click.FloatRange(min=0), default=DEFAULT_MAX_WAIT * 1000, show_default=True,
+              help='Longest a row read from stdin waits for its batch to fill.')
+def main(model_filepath, input_filepath, output_filepath, preprocessor_filepath=None, top_k=1,
+         batch_size=DEFAULT_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT * 1000):
+    """Predicts the users of a cleaned dataset, or of JSON lines read from stdin (INPUT_FILEPATH -).
+
+    OUTPUT_FILEPATH - writes the predictions to stdout, as JSON lines or, for a dataset, as CSV.
+    """
+    logger = logging.getLogger(__name__)
+    model = joblib.load(model_filepath)
+    preprocessor = Preprocessor.load(preprocessor_filepath) if preprocessor_filepath else None
+
+    if input_filepath == '-':
+        predictor = BatchPredictor(model, preprocessor, top_k)
+        output = sys.stdout if output_filepath == '-' else open(output_filepath, 'w')
+        try:
+            report = predict_stream(predictor, sys.stdin, lambda event: print(json.dumps(event), file=output,
+                                                                               flush=True),
+                                    batch_size, max_wait_ms / 1000)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        logger.info('Predicted %d rows in %d batches (mean size %.1f): p50 %.3f ms, p99 %.3f ms, %.0f rows/s',
+                    report['rows'], report['batches'], report['mean_batch_size'], report['p50_ms'],
+                    report['p99_ms'], report['rows_per_s'])
+        return
+
+    if output_filepath != '-' and table_format(output_filepath) is None:
+        raise click.BadParameter(f'expected -, or a file with one of the extensions of {sorted(FORMATS)}',
+                                 param_hint='OUTPUT_FILEPATH')
+    predictions, report = predict_dataset(model, read_table(input_filepath), top_k, batch_size, preprocessor)
+    if 'ID' in predictions.columns:
+        from sklearn.metrics import accuracy_score
+
+        logger.info('Accuracy: %.4f', accuracy_score(predictions['ID'], predictions['predicted']))
+    logger.info('Predicted %d rows: p50 %.3f ms, p99 %.3f ms per batch of %d, %.0f rows/s',
+                report['rows'], report['p50_ms'], report['p99_ms'], batch_size, report['rows_per_s'])
+    if output_filepath == '-':
+        predictions.to_csv(sys.stdout, index=False)
+    else:
+        write_table(predictions, output_filepath)
+
+
+if __name__ == '__main__':
+    log_fmt = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    logging.basicConfig(level=logging.INFO, format=log_fmt, stream=sys.stderr)
+
+    main()
@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+"""Train and compare the classifier zoo on a cleaned statistics dataset.
+
+Every classifier is fitted in its own worker process. Models that can use
+several threads get an ``n_jobs`` share of the cores and BLAS/OpenMP pools
+are capped to the same share, so the pool never oversubscribes the machine.
+Models are trained on the first minutes of the slow game, tested on the next
+ones and on the whole fast game, and timed. The model with the best test
+accuracy is saved to the model directory.
+"""
+import logging
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import click
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.metrics import accuracy_score, f1_score, log_loss, precision_score, recall_score
+from scipy import sparse
+from threadpoolctl import threadpool_limits
+
+from src.data.dataset import INTERVAL_COLUMNS, LABEL_COLUMNS, FeatureDataset, features_and_labels, find_column
+from src.data.matrix import FeatureMatrix, compact_labels
+from src.data.storage import table_path, write_table
+
+SEED = 42
+
+# Rows whose single-row prediction latency is measured
+LATENCY_SAMPLES = 20
+
+
+def classifier_zoo(seed=SEED):
+    """The classifiers compared in the model training notebook, by name."""
+    from sklearn.discriminant_analysis import LinearDiscriminantAnalysis, QuadraticDiscriminantAnalysis
+    from sklearn.ensemble import AdaBoostClassifier, ExtraTreesClassifier, RandomForestClassifier
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.naive_bayes import BernoulliNB, GaussianNB
+    from sklearn.neighbors import KNeighborsClassifier
+    from sklearn.neural_network import MLPClassifier
+    from sklearn.svm import SVC
+    from sklearn.tree import DecisionTreeClassifier
+
+    classifiers = {
+        'SVC': SVC(kernel="rbf", C=0.025, probability=True, random_state=seed),
+        'ExtraTreesClassifier': ExtraTreesClassifier(random_state=seed),
+        'LinearDiscriminantAnalysis': LinearDiscriminantAnalysis(),
+        'DecisionTreeClassifier': DecisionTreeClassifier(random_state=seed),
+        'KNeighborsClassifier': KNeighborsClassifier(),
+        'RandomForestClassifier': RandomForestClassifier(random_state=seed),
+        'MLPClassifier': MLPClassifier(random_state=seed),
+        'AdaBoostClassifier': AdaBoostClassifier(random_state=seed),
+        'GaussianNB': GaussianNB(),
+        'QuadraticDiscriminantAnalysis': QuadraticDiscriminantAnalysis(store_covariance=True),
+        'LogisticRegression': LogisticRegression(random_state=seed),
+        'BernoulliNB': BernoulliNB(),
+    }
+    try:
+        from xgboost import XGBClassifier
+    except ImportError:
+        pass
+    else:
+        classifiers['XGBClassifier'] = XGBClassifier(random_state=seed)
+    return classifiers
+
+
+def minute_split(df, fast_df, train_minutes=8, test_minutes=2):
+    """
+    Split the slow game by minute and take the whole fast game as a transfer set.
+
+    Parameters:
+    - df: Cleaned slow game dataset.
+    - fast_df: Cleaned fast game dataset, with the same columns.
+    - train_minutes: Number of first ``time_interval`` values used for training.
+    - test_minutes: Number of following ``time_interval`` values used for testing.
+
+    Returns:
+    - X_train, y_train, X_test, y_test, fast_X, fast_y without the time interval column.
+    """
+    X, y = features_and_labels(df)
+    fast_X, fast_y = features_and_labels(fast_df)
+    interval = find_column(X, INTERVAL_COLUMNS)
+    unique_minutes = X[interval].unique()
+
+    train = X[interval].isin(unique_minutes[:train_minutes])
+    test = X[interval].isin(unique_minutes[train_minutes:train_minutes + test_minutes])
+    X = X.drop(columns=[interval])
+    fast_X = fast_X.drop(columns=[find_column(fast_X, INTERVAL_COLUMNS)])[X.columns]
+    return X[train], y[train], X[test], y[test], fast_X, fast_y
+
+
+def load_split(slow, fast, train_minutes=8, test_minutes=2, columns=None):
+    """
+    ``minute_split`` reading only the rows and columns it needs.
+
+    Parameters:
+    - slow, fast: ``FeatureDataset`` of the cleaned slow and fast games.
+    - columns: Feature columns to keep, e.g. the top-k important ones; all by default.
+    """
+    minutes = slow.minutes()[:train_minutes + test_minutes]
+    return minute_split(slow.select(columns, intervals=minutes), fast.select(columns), train_minutes, test_minutes)
+
+
+def compact_split(data):
+    """Convert a ``minute_split`` to compact model inputs.
+
+    Features become float32 arrays, or CSR matrices in the rare case that is
+    smaller (see ``FeatureMatrix``), and IDs become categoricals.
+
+    Returns:
+    - The compacted split and the number of bytes its features hold.
+    """
+    compacted = []
+    nbytes = 0
+    for i, part in enumerate(data):
+        if i % 2:
+            compacted.append(compact_labels(part))
+            continue
+        X = FeatureMatrix.from_frame(part).model_input()
+        nbytes += X.data.nbytes + X.indices.nbytes + X.indptr.nbytes if sparse.issparse(X) else X.nbytes
+        compacted.append(X)
+    return tuple(compacted), nbytes
+
+
+def _densify(data):
+    """The split with sparse feature matrices made dense, for models that do not take them."""
+    return tuple(part.toarray() if sparse.issparse(part) else part for part in data)
+
+
+def budget_jobs(classifiers, workers, cores=None):
+    """Give every classifier that accepts ``n_jobs`` an equal share of the cores between the workers.
+
+    Returns:
+    - The number of threads each worker may use.
+    """
+    threads = max(1, (cores or os.cpu_count() or 1) // workers)
+    for model in classifiers.values():
+        if 'n_jobs' in model.get_params():
+            model.set_params(n_jobs=threads)
+    return threads
+
+
+def _log_loss(model, X, y):
+    if not hasattr(model, 'predict_proba'):
+        return np.nan
+    return log_loss(y, model.predict_proba(X), labels=model.classes_)
+
+
+def evaluate_classifier(name, model, data, threads=1):
+    """
+    Fit one classifier and measure its accuracy and cost.
+
+    Parameters:
+    - data: ``(X_train, y_train, X_test, y_test, fast_X, fast_y)`` as returned by ``minute_split``
+      or ``compact_split``.
+    - threads: Cap of the BLAS/OpenMP thread pools while fitting and predicting.
+
+    Returns:
+    - A dictionary of metrics and the fitted model.
+    """
+    with threadpool_limits(limits=threads):
+        try:
+            start = time.perf_counter()
+            model.fit(data[0], data[1])
+        except TypeError:
+            if not sparse.issparse(data[0]):
+                raise
+            # Discriminant analysis and Gaussian naive Bayes only take dense features
+            data = _densify(data)
+            start = time.perf_counter()
+            model.fit(data[0], data[1])
+        fit_time = time.perf_counter() - start
+        X_train, y_train, X_test, y_test, fast_X, fast_y = data
+
+        y_train_predicted = model.predict(X_train)
+        start = time.perf_counter()
+        y_test_predicted = model.predict(X_test)
+        predict_time = time.perf_counter() - start
+        fast_predicted = model.predict(fast_X)
+
+        latencies = []
+        for i in range(min(LATENCY_SAMPLES, X_test.shape[0])):
+            start = time.perf_counter()
+            model.predict(X_test[i:i + 1])
+            latencies.append(time.perf_counter() - start)
+
+        metrics = {
+            'Model': name,
+            'Accuracy(Train)': accuracy_score(y_train, y_train_predicted),
+            'Accuracy(Test)': accuracy_score(y_test, y_test_predicted),
+            'Accuracy(Fast)': accuracy_score(fast_y, fast_predicted),
+            'F1(Train)': f1_score(y_train, y_train_predicted, average='micro'),
+            'F1(Test)': f1_score(y_test, y_test_predicted, average='micro'),
+            'Precision(Train)': precision_score(y_train, y_train_predicted, average='micro'),
+            'Precision(Test)': precision_score(y_test, y_test_predicted, average='micro'),
+            'Recall(Train)': recall_score(y_train, y_train_predicted, average='micro'),
+            'Recall(Test)': recall_score(y_test, y_test_predicted, average='micro'),
+            'Log_loss(Train)': _log_loss(model, X_train, y_train),
+            'Log_loss(Test)': _log_loss(model, X_test, y_test),
+            'Fit time (s)': fit_time,
+            'Predict latency (ms)': 1000 * float(np.median(latencies)) if latencies else np.nan,
+            'Throughput (rows/s)': X_test.shape[0] / predict_time if predict_time > 0 else np.nan,
+            'Model size (bytes)': len(pickle.dumps(model)),
+        }
+    return metrics, model
+
+
+def _evaluate_task(task):
+    """Run ``evaluate_classifier`` for a pool task, returning the error instead of raising."""
+    name, model, data, threads = task
+    try:
+        metrics, model = evaluate_classifier(name, model, data, threads)
+        return metrics, model, None
+    except Exception as error:
+        return {'Model': name}, None, repr(error)
+
+
+def evaluate_classifiers(classifiers, data, workers=None):
+    """
+    Fit and evaluate every classifier, concurrently.
+
+    Parameters:
+    - classifiers: A dictionary with model names as keys and unfitted estimators as values.
+    - data: ``(X_train, y_train, X_test, y_test, fast_X, fast_y)`` as returned by ``minute_split``.
+    - workers: Number of processes, one per classifier and at most one per core by default.
+
+    Returns:
+    - The metrics of every model as a DataFrame, sorted by test accuracy.
+    - A dictionary with model names as keys and fitted models as values.
+    """
+    logger = logging.getLogger(__name__)
+    workers = workers or min(len(classifiers), os.cpu_count() or 1)
+    threads = budget_jobs(classifiers, workers)
+    tasks = [(name, model, data, threads) for name, model in classifiers.items()]
+
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_evaluate_task, tasks))
+    else:
+        results = [_evaluate_task(task) for task in tasks]
+
+    rows = []
+    models = {}
+    for metrics, model, error in results:
+        if error is not None:
+            logger.error('Failed to train %s: %s', metrics['Model'], error)
+            continue
+        logger.info('%s: test accuracy %.4f, fit %.2fs', metrics['Model'], metrics['Accuracy(Test)'],
+                    metrics['Fit time (s)'])
+        rows.append(metrics)
+        models[metrics['Model']] = model
+
+    accuracy_set = pd.DataFrame(rows)
+    if not accuracy_set.empty:
+        accuracy_set = accuracy_set.sort_values(by='Accuracy(Test)', ascending=False, kind='stable')
+    return accuracy_set.reset_index(drop=True), models
+
+
+def dataset_name(filepath):
+    """Name of a cleaned dataset file, e.g. ``traffic_slow`` for ``traffic_slow_cleaned.parquet``."""
+    name = Path(filepath).name.split('.')[0]
+    return name[:-len('_cleaned')] if name.endswith('_cleaned') else name
+
+
+@click.command()
+@click.argument('slow_filepath', type=click.Path(exists=True))
+@click.argument('fast_filepath', type=click.Path(exists=True))
+@click.argument('model_dir', type=click.Path(file_okay=False), default='models')
+@click.option('--model', 'model_names', multiple=True, help='Classifier to train, repeatable; all by default.')
+@click.option('--workers', type=click.IntRange(min=1), default=None,
+              help='Number of processes, one per classifier up to the number of cores by default.')
+@click.option('--train-minutes', type=click.IntRange(min=1), default=8, show_default=True,
+              help='Number of first minutes of the slow game used for training.')
+@click.option('--test-minutes', type=click.IntRange(min=1), default=2, show_default=True,
+              help='Number of following minutes used for testing.')
+@click.option('--features', 'features_filepath', type=click.Path(exists=True, dir_okay=False), default=None,
+              help='Text file listing the feature columns to train on, one per line; all by default.')
+@click.option('--compact', is_flag=True,
+              help='Train on float32 features and categorical IDs instead of DataFrames.')
+def main(slow_filepath, fast_filepath, model_dir='models', model_names=(), workers=None, train_minutes=8,
+         test_minutes=2, features_filepath=None, compact=False):
+    """Trains the classifier zoo on a cleaned dataset and saves the best model."""
+    logger = logging.getLogger(__name__)
+    classifiers = classifier_zoo()
+    if model_names:
+        unknown = set(model_names) - set(classifiers)
+        if unknown:
+            raise click.BadParameter(f'Unknown classifiers {sorted(unknown)}, expected some of {sorted(classifiers)}')
+        classifiers = {name: classifiers[name] for name in model_names}
+
+    columns = None
+    if features_filepath:
+        with open(features_filepath) as f:
+            columns = [line.strip() for line in f if line.strip()]
+    data = load_split(FeatureDataset(slow_filepath), FeatureDataset(fast_filepath), train_minutes, test_minutes,
+                      columns)
+    if compact:
+        frames_nbytes = sum(part.memory_usage(index=False).sum() for part in data[::2])
+        data, nbytes = compact_split(data)
+        logger.info('Compact features: %.1f MB instead of %.1f MB', nbytes / 1e6, frames_nbytes / 1e6)
+    logger.info('Training %d classifiers on %d rows, testing on %d slow and %d fast rows',
+                len(classifiers), data[0].shape[0], data[2].shape[0], data[4].shape[0])
+    accuracy_set, models = evaluate_classifiers(classifiers, data, workers)
+    if accuracy_set.empty:
+        raise click.ClickException('No classifier could be trained')
+
+    name = dataset_name(slow_filepath)
+    os.makedirs(model_dir, exist_ok=True)
+    write_table(accuracy_set, table_path(model_dir, f'{name}_zoo', 'csv'))
+    best = accuracy_set['Model'].iloc[0]
+    joblib.dump(models[best], os.path.join(model_dir, f'{name}_best.joblib'))
+    logger.info('Best model %s saved to %s', best, os.path.join(model_dir, f'{name}_best.joblib'))
+
+    with pd.option_context('display.max_columns', None, 'display.width', 200):
+        print(accuracy_set.to_string(index=False))
+
+
+if __name__ == '__main__':
+    log_fmt = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    logging.basicConfig(level=logging.INFO, format=log_fmt)
+
+    main()
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""Fitted, persistable cleaning of a statistics dataset.
+
+``Preprocessor`` learns the steps of ``process_data.preprocess`` from a
+dataset (column name stripping, constant-column drop, min-max scaling,
+per-column label encoding and ``match_columns`` alignment) and replays them on
+new rows. Fitting compiles the steps into fixed NumPy index, scale and offset
+arrays, so transforming a single feature row is a couple of vectorised
+operations rather than a DataFrame rebuild.
+"""
+import json
+
+import numpy as np
+import pandas as pd
+
+from src import profiling
+from src.process.schema import align_columns
+
+STATE_VERSION = 1
+
+
+def strip_columns(df):
+    """Remove the empty spaces before and after the feature names."""
+    df = df.copy()
+    df.columns = df.columns.str.strip()
+    return df
+
+
+class Preprocessor:
+    """
+    Cleaning steps fitted on one statistics dataset.
+
+    Attributes:
+    - columns: Input columns kept after dropping the constant ones.
+    - dropped: Dropped constant columns and their value.
+    - scale: ``[min, max]`` range of every min-max scaled column.
+    - vocabularies: Sorted categories of every label encoded column.
+    - output_columns: Columns of the transformed dataset, missing ones are filled with 0.
+    - revision: Number of times the state has been fitted from scratch.
+    - rows: Number of rows the state has been applied to.
+    """
+
+    def __init__(self):
+        self.columns = []
+        self.dropped = {}
+        self.scale = {}
+        self.vocabularies = {}
+        self.output_columns = []
+        self.revision = 1
+        self.rows = 0
+        self._compile()
+
+    def fit(self, df):
+        """Learn the cleaning of ``df``; its output columns are the kept columns, sorted."""
+        # Imported here, as replaying a saved state does not need scikit-learn
+        from sklearn.preprocessing import LabelEncoder, MinMaxScaler
+
+        from src.process.process_data import find_non_varying_variables
+
+        df = strip_columns(df)
+        non_varying = list(find_non_varying_variables(df)['Variable'])
+        dropped = {col: df[col].dropna().iloc[0] for col in non_varying}
+        df = df.drop(columns=non_varying)
+
+        numeric_cols = df.select_dtypes(include=['number']).columns.difference(["time_interval"])
+        scaler = MinMaxScaler(feature_range=(0, 1)).fit(df[numeric_cols])
+        categorical_cols = df.select_dtypes(include=['object', 'category']).columns
+
+        self.columns = list(df.columns)
+        self.dropped = {col: value.item() if hasattr(value, 'item') else value for col, value in dropped.items()}
+        self.scale = {col: [float(lo), float(hi)]
+                      for col, lo, hi in zip(numeric_cols, scaler.data_min_, scaler.data_max_)}
+        self.vocabularies = {col: LabelEncoder().fit(df[col].astype(str)).classes_.tolist()
+                             for col in categorical_cols}
+        self.output_columns = sorted(self.columns)
+        self.rows = len(df)
+        self._compile()
+        return self
+
+    def align(self, columns):
+        """Output ``columns`` instead, filling the ones not fitted with 0 and dropping the others."""
+        self.output_columns = list(columns)
+        self._compile()
+        return self
+
+    def extend_vocabulary(self, col, categories):
+        """Encode unseen ``categories`` of ``col`` after the known ones, keeping existing codes."""
+        known = set(self.vocabularies[col])
+        self.vocabularies[col].extend(category for category in pd.unique(pd.Series(categories).astype(str))
+                                      if category not in known)
+        self._compile()
+
+    def _compile(self):
+        """Precompute the input to output column mapping used by the transforms."""
+        input_index = {col: i for i, col in enumerate(self.columns)}
+        output_index = {col: j for j, col in enumerate(self.output_columns)}
+        kept = [col for col in self.columns if col in output_index]
+
+        self._scaled = [col for col in kept if col in self.scale]
+        self._passthrough = [col for col in kept if col not in self.scale and col not in self.vocabularies]
+        self._encoded = [col for col in kept if col in self.vocabularies]
+
+        ranges = np.array([self.scale[col] for col in self._scaled], dtype=np.float64).reshape(-1, 2)
+        span = ranges[:, 1] - ranges[:, 0]
+        scale = 1 / np.where(span == 0, 1, span)
+        offset = -ranges[:, 0] * scale
+
+        # Scaled and passed through columns share one multiply-add, the latter with scale 1 and offset 0
+        numeric = self._scaled + self._passthrough
+        self._numeric_src = np.array([input_index[col] for col in numeric], dtype=np.intp)
+        self._numeric_dst = np.array([output_index[col] for col in numeric], dtype=np.intp)
+        self._numeric_scale = np.concatenate([scale, np.ones(len(self._passthrough))])
+        self._numeric_offset = np.concatenate([offset, np.zeros(len(self._passthrough))])
+        self._lookups = [(input_index[col], output_index[col],
+                          {category: code for code, category in enumerate(self.vocabularies[col])})
+                         for col in self._encoded]
+
+    def transform_values(self, values):
+        """
+        Transform raw feature values with the precomputed mapping.
+
+        Parameters:
+        - values: One row, or a 2D array of rows, of values ordered as ``columns``.
+
+        Returns:
+        - A float64 array with one value per output column (per row for 2D input).
+        """
+        values = np.asarray(values, dtype=object if self._lookups else np.float64)
+        single = values.ndim == 1
+        values = np.atleast_2d(values)
+
+        out = np.zeros((len(values), len(self.output_columns)))
+        out[:, self._numeric_dst] = (values[:, self._numeric_src].astype(np.float64) * self._numeric_scale
+                                     + self._numeric_offset)
+        for src, dst, lookup in self._lookups:
+            out[:, dst] = [lookup.get(str(value), -1) for value in values[:, src]]
+        return out[0] if single else out
+
+    def transform(self, df):
+        """Transform a dataset, keeping integer dtypes for encoded and passed through columns."""
+        df = strip_columns(df).reindex(columns=self.columns)
+
+        scaled = (df[self._scaled].to_numpy(dtype=np.float64) * self._numeric_scale[:len(self._scaled)]
+                  + self._numeric_offset[:len(self._scaled)])
+        data = {col: scaled[:, k] for k, col in enumerate(self._scaled)}
+        for col in self._passthrough:
+            data[col] = df[col].to_numpy()
+        with profiling.stage('encoding') as span:
+            for col in self._encoded:
+                codes = pd.Categorical(df[col].astype(str), categories=self.vocabularies[col]).codes
+                data[col] = codes.astype(np.int64)
+            span.count(len(df) * len(self._encoded))
+
+        return align_columns(pd.DataFrame(data, index=pd.RangeIndex(len(df))), self.output_columns, fill_value=0)
+
+    def fit_transform(self, df):
+        return self.fit(df).transform(df)
+
+    def inverse_transform(self, df):
+        """Recover the rows a transform was applied to, including the dropped constant columns.
+
+        Input columns the output was not aligned to cannot be recovered and are left missing.
+        """
+        restored = df.reindex(columns=self.columns)
+        scaled = list(self.scale)
+        ranges = np.array([self.scale[col] for col in scaled], dtype=np.float64).reshape(-1, 2)
+        span = ranges[:, 1] - ranges[:, 0]
+        restored[scaled] = restored[scaled].to_numpy(dtype=np.float64) * np.where(span == 0, 1, span) + ranges[:, 0]
+
+        for col, vocabulary in self.vocabularies.items():
+            restored[col] = np.asarray(vocabulary, dtype=object)[restored[col].astype(np.int64)]
+        # The constant columns are added at once, as inserting them one by one fragments the frame
+        return pd.concat([restored, pd.DataFrame(self.dropped, index=restored.index)], axis=1)
+
+    def accepts(self, df):
+        """Whether new rows fit the state: no new columns, categories or out-of-range values."""
+        df = strip_columns(df)
+        if set(df.columns) - set(self.columns) - set(self.dropped):
+            return False
+        for col, value in self.dropped.items():
+            if col in df.columns and not (df[col].dropna() == value).all():
+                return False
+        for col, (lo, hi) in self.scale.items():
+            if col in df.columns and (df[col].min() < lo or df[col].max() > hi):
+                return False
+        for col, vocabulary in self.vocabularies.items():
+            if col in df.columns and not set(df[col].astype(str)) <= set(vocabulary):
+                return False
+        return True
+
+    def to_dict(self):
+        return {
+            'version': STATE_VERSION,
+            'revision': self.revision,
+            'rows': self.rows,
+            'columns': self.columns,
+            'dropped': self.dropped,
+            'scale': self.scale,
+            'vocabularies': self.vocabularies,
+            'output_columns': self.output_columns,
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        if state.get('version') != STATE_VERSION:
+            raise ValueError(f"Unsupported preprocessing state version {state.get('version')}")
+        preprocessor = cls()
+        for key in ['revision', 'rows', 'columns', 'dropped', 'scale', 'vocabularies', 'output_columns']:
+            setattr(preprocessor, key, state[key])
+        preprocessor._compile()
+        return preprocessor
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=1)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
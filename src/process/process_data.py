@@ -1,6 +1,16 @@
+import logging
+import os
+
+import click
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import MinMaxScaler, LabelEncoder
+
+from src import profiling
+from src.data.dataset import INTERVAL_COLUMNS, LABEL_COLUMNS, find_column
+from src.data.storage import (FORMATS, append_table, read_table, table_columns, table_format, table_path,
+                              write_table)
+from src.process.preprocessor import Preprocessor
+from src.process.schema import align_columns, dataset_pairs, partner_names
 
 def find_non_varying_variables(df):
     non_varying_columns = []
@@ -42,6 +52,8 @@ def missing_columns(dataframe):
     return concat_values[concat_values.iloc[:,1]!=0]
 
 def scaling(df):
+    from sklearn.preprocessing import MinMaxScaler
+
     # Select numeric columns only
     numeric_cols = df.select_dtypes(include=['number']).columns.difference(["time_interval"])
     
@@ -52,87 +64,263 @@ def scaling(df):
     # Create a DataFrame from the scaled data
     scaled_df = pd.DataFrame(scaled_data, columns=numeric_cols)
     
-    # Re-include the string columns back into the DataFrame
-    for col in df.columns:
-        if col not in numeric_cols:
-            scaled_df[col] = df[col].values
-            
-    return scaled_df
+    # Re-include the string columns back into the DataFrame, all at once
+    others = df[df.columns.difference(numeric_cols, sort=False)].reset_index(drop=True)
+    return pd.concat([scaled_df, others], axis=1)
 
 
 def encoding(df):
+    from sklearn.preprocessing import LabelEncoder
+
     le = LabelEncoder()
 
     # iterate through all the categorical columns
-    for col in df.select_dtypes('object').columns:
+    for col in df.select_dtypes(include=['object', 'category']).columns:
         df[col] = le.fit_transform(df[col].astype(str))
 
     print("Label encoded {col}")
     return df
 
 def match_columns(training_set,testing_set):
-    """Matches the count of columns from training set to testing set by adding extra cols and setting them to 0."""
-    
-    for column in training_set.columns:
-        if column not in testing_set.columns:
-            testing_set[column]=0
-    for column in testing_set.columns:
-        if column not in training_set.columns:
-            testing_set = testing_set.drop(column)
-    return testing_set 
-
-def preprocess(filepaths):
+    """Matches the columns of the testing set to the training set, adding missing ones as 0 and dropping extra ones."""
+    return align_columns(testing_set, training_set.columns, fill_value=0)
+
+# Every new session brings a new ID, so its vocabulary grows instead of forcing a refit
+LABEL_COLUMN = 'ID'
+
+
+def state_path(output_dir, name):
+    """Path of the fitted preprocessing state saved next to a cleaned dataset."""
+    return os.path.join(output_dir, f'{name}_preprocess.json')
+
+
+def source_path(output_dir, name, format='parquet'):
+    """Path of the statistics rows a cleaned dataset was fitted on, kept for incremental refits."""
+    return table_path(output_dir, f'{name}_source', format)
+
+
+def load_state(path):
+    """Load a saved ``Preprocessor``, or None if it is missing or has an older layout."""
+    if not os.path.exists(path):
+        return None
+    try:
+        return Preprocessor.load(path)
+    except ValueError:
+        return None
+
+
+def clean_datasets(datasets, pairs=None):
+    """
+    Clean in-memory datasets.
+
+    Parameters:
+    - datasets: A dictionary with dataset names as keys and raw statistics DataFrames as values.
+    - pairs: ``(training, testing)`` name pairs whose columns are matched, by default every
+      ``<name>_slow``/``<name>_fast`` pair (see ``schema.dataset_pairs``).
+
+    Returns:
+    - A dictionary with dataset names as keys and processed DataFrames as values.
+    - A dictionary with dataset names as keys and their fitted ``Preprocessor`` as values.
+    """
+    # 2.1.-2.5. Fix Features Naming, Columns Variability, Feature Scaling and Label Encoding
+    preprocessors = {}
+    for name, df in datasets.items():
+        with profiling.stage('fit', dataset=name) as span:
+            preprocessors[name] = Preprocessor().fit(df)
+            span.count(len(df))
+
+    # 2.6. Matching Columns - every testing set is reindexed once to its training set's columns
+    for training, testing in dataset_pairs(datasets) if pairs is None else pairs:
+        if training in preprocessors and testing in preprocessors:
+            preprocessors[testing].align(preprocessors[training].output_columns)
+
+    # Columns are sorted for consistency
+    processed_datasets = {}
+    for name, df in datasets.items():
+        with profiling.stage('transform', dataset=name) as span:
+            processed_datasets[name] = preprocessors[name].transform(df)
+            span.count(len(df))
+    return processed_datasets, preprocessors
+
+
+def preprocess(filepaths, output_dir='../data/processed/', format=None):
     """
     Process and clean datasets from given filepaths.
     
     Parameters:
     - filepaths: A dictionary with dataset names as keys and filepaths as values.
+    - output_dir: Directory the cleaned datasets are saved to.
+    - format: Storage format of the cleaned datasets, defaults to the format of each input.
     
     Returns:
     - A dictionary with dataset names as keys and processed DataFrames as values.
     """
-    processed_datasets = {}
-
+    # Load the datasets
+    datasets = {}
     for name, filepath in filepaths.items():
-        # Load the dataset
-        df = pd.read_csv(filepath)
+        with profiling.stage('read', file=filepath) as span:
+            datasets[name] = read_table(filepath)
+            span.count(len(datasets[name]))
+    processed_datasets, preprocessors = clean_datasets(datasets)
 
-        # 2.1. Fix Features Naming
-        df.columns = df.columns.str.strip()
+    # Optionally save processed datasets, with the fitted state for incremental updates
+    for name, df in processed_datasets.items():
+        with profiling.stage('write', dataset=name) as span:
+            write_table(df, table_path(output_dir, f'{name}_cleaned', format or table_format(filepaths[name])))
+            # The rows as read, not compacted, so that a refit sees the values a full run would
+            write_table(datasets[name], source_path(output_dir, name, format or table_format(filepaths[name])),
+                        compact=False)
+            preprocessors[name].save(state_path(output_dir, name))
+            span.count(len(df))
+
+    return processed_datasets
 
-        # 2.2. Columns Variability 
-        non_varying = find_non_varying_variables(df)
-        df.drop(columns=non_varying['Variable'], inplace=True)
 
-        # 2.3. Missing Values (Assuming handling missing values is desired but not altering original data)
-        # missing_df = missing_columns(df)  # If you want to inspect missing values
+def _cleaned_path(output_dir, name, format=None):
+    """Path of a cleaned dataset, looking for an existing one when the format is not given."""
+    if format:
+        return table_path(output_dir, f'{name}_cleaned', format)
+    for existing_format in FORMATS:
+        path = table_path(output_dir, f'{name}_cleaned', existing_format)
+        if os.path.exists(path):
+            return path
+    return None
 
-        # 2.4. Feature Scaling
-        df = scaling(df)
 
-        # 2.5. Label Encoding
-        df = encoding(df)
+def session_minutes(df):
+    """The ``(ID, time_interval)`` pairs of statistics rows."""
+    label, interval = find_column(df, LABEL_COLUMNS), find_column(df, INTERVAL_COLUMNS)
+    return pd.MultiIndex.from_arrays([df[label].astype(str), df[interval].astype(np.int64)])
 
-        processed_datasets[name] = df
 
-    # 2.6. Matching Columns - Assuming mov_fast/mov_slow and traffic_fast/traffic_slow pairing
-    movement_datasets = ['mov_fast', 'mov_slow']
-    traffic_datasets = ['traffic_fast', 'traffic_slow']
+def preprocess_incremental(filepaths, output_dir='../data/processed/', format=None):
+    """
+    Add new sessions to datasets cleaned by ``preprocess`` without refitting on the full corpus.
 
-    if all(dataset in processed_datasets for dataset in movement_datasets):
-        processed_datasets['mov_fast'] = match_columns(processed_datasets['mov_slow'], processed_datasets['mov_fast'])
+    The new rows are transformed with the saved preprocessing states and appended to the
+    cleaned datasets. If they add columns or categories, fall outside the stored scaling
+    ranges or vary a dropped column, every affected dataset is refitted instead: the source
+    rows saved next to the cleaned datasets are merged with the new ones and cleaned from
+    scratch, as ``preprocess`` would clean their union. New rows of a session minute
+    (``ID`` and ``time_interval``) already in a dataset are skipped, so rerunning an input
+    does not add its rows twice.
 
-    if all(dataset in processed_datasets for dataset in traffic_datasets):
-        processed_datasets['traffic_fast'] = match_columns(processed_datasets['traffic_slow'], processed_datasets['traffic_fast'])
+    Parameters:
+    - filepaths: A dictionary with dataset names as keys and filepaths holding only the new rows as values.
+    - output_dir: Directory holding the cleaned datasets and their states.
+    - format: Storage format of the cleaned datasets, defaults to the format of each input.
+
+    Returns:
+    - A dictionary with dataset names as keys and the newly processed rows (appended) or
+      whole datasets (refitted) as values.
+    """
+    logger = logging.getLogger(__name__)
+    new_datasets = {}
+    for name, filepath in filepaths.items():
+        df = read_table(filepath)
+        df.columns = df.columns.str.strip()
+        new_datasets[name] = df
 
-    # Sort columns for consistency
-    for name in processed_datasets:
-        processed_datasets[name] = processed_datasets[name].reindex(sorted(processed_datasets[name].columns), axis=1)
+    # Testing sets are aligned to their training set, so pairs are refitted together
+    partners = partner_names(filepaths)
+    cleaned_paths = {}
+    source_paths = {}
+    states = {}
+    for name in set(filepaths) | partners:
+        cleaned_paths[name] = _cleaned_path(output_dir, name, format or table_format(filepaths.get(name, '')))
+        state = load_state(state_path(output_dir, name))
+        if state is None or cleaned_paths[name] is None or not os.path.exists(cleaned_paths[name]):
+            continue
+        source_paths[name] = source_path(output_dir, name, table_format(cleaned_paths[name]))
+        if not os.path.exists(source_paths[name]):
+            raise ValueError(f'{name} was cleaned without its source rows, preprocess the full datasets again')
+        states[name] = state
 
-    # Optionally save processed datasets
+    for name in list(new_datasets):
+        if name not in states:
+            continue
+        df = new_datasets[name]
+        stored = session_minutes(read_table(source_paths[name], [find_column(df, LABEL_COLUMNS),
+                                                                 find_column(df, INTERVAL_COLUMNS)]))
+        known = session_minutes(df).isin(stored)
+        if known.any():
+            logger.warning('Skipping %d rows of %s already in the dataset', known.sum(), name)
+            new_datasets[name] = df[~known].reset_index(drop=True)
+    new_datasets = {name: df for name, df in new_datasets.items() if len(df)}
+    if not new_datasets:
+        logger.info('No new rows to add')
+        return {}
+
+    for name, df in new_datasets.items():
+        if name in states and LABEL_COLUMN in states[name].vocabularies and LABEL_COLUMN in df.columns:
+            states[name].extend_vocabulary(LABEL_COLUMN, df[LABEL_COLUMN])
+
+    if all(name in states and states[name].accepts(df) for name, df in new_datasets.items()):
+        appended = {}
+        for name, df in new_datasets.items():
+            appended[name] = states[name].transform(df)
+            append_table(appended[name], cleaned_paths[name])
+            append_table(df.reindex(columns=table_columns(source_paths[name])), source_paths[name], compact=False)
+            states[name].rows += len(df)
+            states[name].save(state_path(output_dir, name))
+        logger.info('Appended %d new rows', sum(len(df) for df in appended.values()))
+        return appended
+
+    logger.info('New data does not fit the saved preprocessing states, refitting')
+    corpus = {}
+    for name in sorted(set(new_datasets) | set(states)):
+        parts = []
+        if name in states:
+            parts.append(read_table(source_paths[name]))
+        if name in new_datasets:
+            parts.append(new_datasets[name])
+        corpus[name] = pd.concat(parts, ignore_index=True)
+
+    processed_datasets, preprocessors = clean_datasets(corpus)
     for name, df in processed_datasets.items():
-        df.to_csv(f'../data/processed/{name}_cleaned.csv', index=False)
+        if name in states:
+            preprocessors[name].revision = states[name].revision + 1
+        write_table(df, cleaned_paths[name])
+        write_table(corpus[name], source_path(output_dir, name, table_format(cleaned_paths[name])), compact=False)
+        preprocessors[name].save(state_path(output_dir, name))
 
     return processed_datasets
 
-# Assuming the defined functions find_non_varying_variables, missing_columns, scaling, encoding, and match_columns exist
+
+def dataset_name(filepath):
+    """Name of a statistics dataset file, e.g. ``traffic_slow`` for ``traffic_slow_stat.parquet``."""
+    name = os.path.basename(filepath).split('.')[0]
+    return name[:-len('_stat')] if name.endswith('_stat') else name
+
+
+@click.command()
+@click.argument('input_filepaths', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.argument('output_dir', type=click.Path(file_okay=False))
+@click.option('--format', type=click.Choice(sorted(FORMATS)), default=None,
+              help='Storage format of the cleaned datasets, that of each input by default.')
+@click.option('--incremental', is_flag=True,
+              help='Inputs hold only new sessions, added to the datasets already cleaned in OUTPUT_DIR.')
+@click.option('--profile', is_flag=True, help='Time every stage and log a summary.')
+def main(input_filepaths, output_dir, format=None, incremental=False, profile=False):
+    """Cleans statistics datasets, e.g. data/processed/traffic_slow_stat.parquet, into OUTPUT_DIR."""
+    logger = logging.getLogger(__name__)
+    profiler = profiling.enable() if profile else None
+    filepaths = {dataset_name(filepath): filepath for filepath in input_filepaths}
+    os.makedirs(output_dir, exist_ok=True)
+    if incremental:
+        processed_datasets = preprocess_incremental(filepaths, output_dir, format)
+    else:
+        processed_datasets = preprocess(filepaths, output_dir, format)
+    for name, df in processed_datasets.items():
+        logger.info('Cleaned %s: %d rows, %d columns', name, *df.shape)
+
+    if profiler is not None:
+        profiling.disable()
+        logger.info('Stage profile:\n%s', profiler.summary().to_string(index=False, float_format='%.3f'))
+
+
+if __name__ == '__main__':
+    log_fmt = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    logging.basicConfig(level=logging.INFO, format=log_fmt)
+
+    main()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""Alignment of datasets to a common column schema.
+
+The testing set of a pair (e.g. ``mov_fast``) must hold exactly the columns its
+training set (``mov_slow``) was cleaned to: category count columns it never
+saw are added as zeros and columns the training set lacks are dropped. The
+target columns are computed once and every dataset is reindexed to them in a
+single allocation, so aligning costs linear time in the number of columns.
+"""
+import pandas as pd
+
+# Suffixes pairing a training set with its testing set, e.g. ``traffic_slow``/``traffic_fast``
+TRAINING_SUFFIX = '_slow'
+TESTING_SUFFIX = '_fast'
+
+
+def dataset_pairs(names, training_suffix=TRAINING_SUFFIX, testing_suffix=TESTING_SUFFIX):
+    """
+    Pair every training dataset with its testing dataset by name.
+
+    Parameters:
+    - names: Dataset names, e.g. ``['mov_slow', 'mov_fast', 'traffic_slow']``.
+    - training_suffix, testing_suffix: Name suffixes of the two sides of a pair.
+
+    Returns:
+    - A sorted list of ``(training, testing)`` name pairs, both present in ``names``.
+    """
+    names = set(names)
+    pairs = []
+    for name in names:
+        if name.endswith(training_suffix):
+            testing = name[:-len(training_suffix)] + testing_suffix
+            if testing in names:
+                pairs.append((name, testing))
+    return sorted(pairs)
+
+
+def partner_names(names, training_suffix=TRAINING_SUFFIX, testing_suffix=TESTING_SUFFIX):
+    """``names`` together with the name of the other side of every pair they may belong to."""
+    partners = set(names)
+    for name in names:
+        if name.endswith(training_suffix):
+            partners.add(name[:-len(training_suffix)] + testing_suffix)
+        elif name.endswith(testing_suffix):
+            partners.add(name[:-len(testing_suffix)] + training_suffix)
+    return partners
+
+
+def align_columns(df, columns, fill_value=0):
+    """Reindex ``df`` to ``columns`` in one step, filling the missing ones and dropping the others."""
+    columns = pd.Index(columns)
+    if df.columns.equals(columns):
+        return df
+    return df.reindex(columns=columns, fill_value=fill_value)
+
+
+def align_datasets(datasets, pairs=None, fill_value=0):
+    """
+    Align the testing set of every pair to its training set's columns.
+
+    Parameters:
+    - datasets: A dictionary with dataset names as keys and DataFrames as values.
+    - pairs: ``(training, testing)`` name pairs, by default ``dataset_pairs`` of the names.
+    - fill_value: Value of the columns a testing set lacks.
+
+    Returns:
+    - A new dictionary with the testing sets aligned and the other datasets unchanged.
+    """
+    aligned = dict(datasets)
+    for training, testing in dataset_pairs(datasets) if pairs is None else pairs:
+        if training in datasets and testing in datasets:
+            aligned[testing] = align_columns(datasets[testing], datasets[training].columns, fill_value)
+    return aligned
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""Stage timers and counters of the data pipeline.
+
+Pipeline code wraps its stages in ``stage``::
+
+    with profiling.stage('read', file=filepath) as span:
+        df = read_table(filepath)
+        span.count(len(df))
+
+Profiling is off by default: ``stage`` then returns a shared no-op context
+manager, so an instrumented stage costs a function call and an attribute
+lookup. Once ``enable`` has been called, every stage is recorded with its
+start, duration, arguments and number of rows. The records can be written as
+a Chrome trace (``chrome://tracing`` or https://ui.perfetto.dev) and summed up
+per stage.
+
+Worker processes profile into their own ``Profiler``; the parent merges their
+``events`` with ``Profiler.extend``.
+"""
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+import pandas as pd
+
+
+class Span:
+    """A stage being timed, see ``stage``."""
+
+    __slots__ = ('profiler', 'name', 'args', 'rows', 'start')
+
+    def __init__(self, profiler, name, args):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+        self.rows = None
+
+    def count(self, rows):
+        """Add ``rows`` to the rows processed by the stage."""
+        self.rows = (self.rows or 0) + int(rows)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        end = time.perf_counter()
+        args = dict(self.args)
+        if self.rows is not None:
+            args['rows'] = self.rows
+        if exc_type is not None:
+            args['error'] = exc_type.__name__
+        self.profiler.events.append({
+            'name': self.name, 'ph': 'X', 'pid': os.getpid(), 'tid': threading.get_ident(),
+            'ts': self.start * 1e6, 'dur': (end - self.start) * 1e6, 'args': args,
+        })
+        return False
+
+
+class _NullSpan:
+    """Stand-in for ``Span`` while profiling is disabled."""
+
+    __slots__ = ()
+
+    def count(self, rows):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Profiler:
+    """
+    Records of the stages run while it is enabled.
+
+    Attributes:
+    - events: Complete (``ph: X``) Chrome trace events, timestamps in microseconds.
+    - counters: Totals of the named counters, see ``count``.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.counters = Counter()
+
+    def extend(self, events):
+        """Add the events recorded by another profiler, e.g. in a worker process."""
+        self.events.extend(events)
+
+    def chrome_trace(self):
+        """The events as a Chrome trace object."""
+        events = list(self.events)
+        events += [{'name': name, 'ph': 'C', 'pid': os.getpid(), 'tid': 0,
+                    'ts': max((event['ts'] + event['dur'] for event in self.events), default=0),
+                    'args': {name: value}}
+                   for name, value in self.counters.items()]
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write_trace(self, path):
+        """Store the Chrome trace as JSON."""
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+
+    def summary(self):
+        """
+        Time spent in every stage.
+
+        Returns:
+        - A DataFrame with the calls, total and mean seconds, rows and rows per second of
+          every stage, slowest first. Nested stages are also counted in their parents.
+        """
+        columns = ['stage', 'calls', 'total_s', 'mean_ms', 'max_ms', 'rows', 'rows_per_s']
+        if not self.events:
+            return pd.DataFrame(columns=columns)
+        events = pd.DataFrame({
+            'stage': [event['name'] for event in self.events],
+            'seconds': [event['dur'] / 1e6 for event in self.events],
+            'rows': [event['args'].get('rows', 0) for event in self.events],
+        })
+        summary = events.groupby('stage', sort=False).agg(
+            calls=('seconds', 'size'), total_s=('seconds', 'sum'), mean_ms=('seconds', 'mean'),
+            max_ms=('seconds', 'max'), rows=('rows', 'sum')).reset_index()
+        summary[['mean_ms', 'max_ms']] *= 1000
+        summary['rows_per_s'] = (summary['rows'] / summary['total_s']).where(summary['rows'] > 0)
+        return summary.sort_values('total_s', ascending=False, kind='stable')[columns].reset_index(drop=True)
+
+
+_PROFILER = None
+
+
+def enable():
+    """Start recording the stages into a new ``Profiler`` and return it."""
+    global _PROFILER
+    _PROFILER = Profiler()
+    return _PROFILER
+
+
+def disable():
+    """Stop recording and return the profiler that was active, if any."""
+    global _PROFILER
+    profiler, _PROFILER = _PROFILER, None
+    return profiler
+
+
+def active():
+    """The recording ``Profiler``, or None when profiling is disabled."""
+    return _PROFILER
+
+
+def stage(name, **args):
+    """Context manager timing a pipeline stage, ``args`` are stored with its record.
+
+    The managed object's ``count(rows)`` adds to the rows the stage processed.
+    """
+    if _PROFILER is None:
+        return _NULL_SPAN
+    return Span(_PROFILER, name, args)
+
+
+def count(name, value=1):
+    """Add ``value`` to a named counter."""
+    if _PROFILER is not None:
+        _PROFILER.counters[name] += value
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+"""Synthetic sessions shared by the tests, see ``benchmarks.synthetic``."""
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import movement_session, traffic_session, user_profile
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
+
+
+@pytest.fixture
+def movement(rng):
+    """Two minutes of movement samples at 30 Hz."""
+    return movement_session(rng, user_profile(rng), 120, 30)
+
+
+@pytest.fixture
+def traffic(rng):
+    """Two minutes of packets at 20 per second."""
+    return traffic_session(rng, user_profile(rng), 120, 20)
@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+from click.testing import CliRunner
+
+from benchmarks.run import main
+
+
+def test_short_sessions_are_rejected_before_training(tmp_path):
+    result = CliRunner().invoke(main, [str(tmp_path / 'benchmarks.json'), '--duration', '300',
+                                       '--benchmark', 'train_model'])
+    assert result.exit_code == 2
+    assert '--duration' in result.output
+    assert not (tmp_path / 'benchmarks.json').exists()
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+import logging
+
+import pandas as pd
+import pytest
+
+from src.features.cache import FeatureCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return FeatureCache(tmp_path / 'cache')
+
+
+def test_put_then_get(cache):
+    df = pd.DataFrame({'a': [1.0, 2.0], 'ID': ['x', 'y']})
+    cache.put('key', df)
+    pd.testing.assert_frame_equal(cache.get('key'), df)
+    assert cache.get('other') is None
+
+
+@pytest.mark.parametrize('content', [b'', b'\x80\x04garbage', b'not a pickle at all'])
+def test_unreadable_entry_is_a_miss_and_removed(cache, caplog, content):
+    cache.put('key', pd.DataFrame({'a': [1.0]}))
+    path = cache._path('key')
+    path.write_bytes(content)
+
+    with caplog.at_level(logging.WARNING):
+        assert cache.get('key') is None
+    assert not path.exists()
+    assert 'unreadable cache entry' in caplog.text
+
+
+def test_truncated_entry_is_a_miss(cache):
+    cache.put('key', pd.DataFrame({'a': range(1000)}))
+    path = cache._path('key')
+    path.write_bytes(path.read_bytes()[:100])
+    assert cache.get('key') is None
+    assert not path.exists()
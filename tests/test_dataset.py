@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.data.dataset import FeatureDataset, features_and_labels
+from src.data.storage import write_table
+
+
+@pytest.fixture(params=['csv', 'parquet'])
+def dataset(request, tmp_path, rng):
+    pytest.importorskip('pyarrow') if request.param == 'parquet' else None
+    frame = pd.DataFrame(rng.random((24, 3)), columns=['a_mean', 'b_mean', 'c_std'])
+    frame['ID'] = np.repeat(['user0', 'user1', 'user2'], 8)
+    frame['time_interval'] = np.tile(np.arange(1, 9), 3)
+    path = str(tmp_path / f'traffic_slow_cleaned.{request.param}')
+    write_table(frame, path, compact=False)
+    return FeatureDataset(path), frame
+
+
+def test_select_reads_the_requested_slice(dataset):
+    data, frame = dataset
+    df = data.select(['a_mean'], intervals=range(1, 4), ids=['user1'])
+    expected = frame[(frame['time_interval'] < 4) & (frame['ID'] == 'user1')]
+    assert list(df.columns) == ['a_mean', 'ID', 'time_interval']
+    np.testing.assert_allclose(df['a_mean'], expected['a_mean'])
+
+
+def test_in_place_edits_do_not_reach_the_cache(dataset):
+    data, _ = dataset
+    original = data.select(['a_mean', 'b_mean'])
+    for df in (data.select(['a_mean', 'b_mean']), data.select(['a_mean'], intervals=[1, 2])):
+        df.iloc[:, 0] = -1.0
+        df['a_mean'] *= 2
+    pd.testing.assert_frame_equal(data.select(['a_mean', 'b_mean']), original)
+    pd.testing.assert_frame_equal(data.select(['a_mean'], intervals=[1, 2]),
+                                  original.loc[original['time_interval'] <= 2, ['a_mean', 'ID', 'time_interval']]
+                                  .reset_index(drop=True))
+
+
+def test_features_and_labels_split_off_the_id(dataset):
+    data, _ = dataset
+    X, y = features_and_labels(data.select())
+    assert 'ID' not in X.columns and 'time_interval' in X.columns
+    assert len(X) == len(y)
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+
+from benchmarks.import_time import BUDGETS, FORBIDDEN, measure
+
+# Budgets are multiplied by this factor on slower machines
+SCALE = float(os.environ.get('IMPORT_TIME_SCALE', 1))
+
+
+@pytest.mark.parametrize('command', list(BUDGETS), ids=lambda command: ' '.join(command) or 'group')
+def test_command_imports_within_budget(command):
+    import_seconds, _, packages = measure(command, repeat=2)
+    assert import_seconds <= BUDGETS[command] * SCALE
+    assert not packages & set(FORBIDDEN.get(command, []))
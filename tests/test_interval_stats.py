@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.features.build_features import feature_engineering
+from src.features.interval_stats import interval_statistics, interval_statistics_loop
+
+
+def _session_features(df, data_type):
+    """Engineered features of a session, with a bucket holding a single row."""
+    lone = df.iloc[[-1]].copy()
+    lone['time'] = df['time'].iloc[-1] + 25
+    if data_type == 'traffic':
+        # The lone packet's bucket only sees one of the directions
+        lone['direction'] = 'UL'
+    df = pd.concat([df, lone], ignore_index=True)
+    df = feature_engineering(df, data_type)
+    df['time_interval'] = (df['time'] / 10).astype(int)
+    return df
+
+
+def assert_same_statistics(vectorised, loop):
+    assert list(vectorised.columns) == list(loop.columns)
+    assert len(vectorised) == len(loop)
+    for col in loop.columns:
+        expected, got = loop[col], vectorised[col]
+        if pd.api.types.is_numeric_dtype(expected) and pd.api.types.is_numeric_dtype(got):
+            np.testing.assert_allclose(got.to_numpy(dtype=np.float64), expected.to_numpy(dtype=np.float64),
+                                       rtol=1e-9, atol=1e-12, equal_nan=True, err_msg=str(col))
+        else:
+            assert got.astype(object).tolist() == expected.astype(object).tolist(), col
+
+
+@pytest.mark.parametrize('data_type', ['movement', 'traffic'])
+def test_engines_give_the_same_statistics(movement, traffic, data_type):
+    df = _session_features(movement if data_type == 'movement' else traffic, data_type)
+    assert df['time_interval'].value_counts().min() == 1
+
+    vectorised = interval_statistics(df, 'group1_order1_user0')
+    loop = interval_statistics_loop(df, 'group1_order1_user0')
+    assert_same_statistics(vectorised, loop)
+    if data_type == 'traffic':
+        assert any(str(col).startswith('direction_count_') for col in vectorised.columns)
+
+
+@pytest.mark.parametrize('first_interval, expected', [
+    # The leading category of the session is not the first interval's
+    (['DL'] * 6 + ['UL'] * 4, ['direction_count_dl', 'direction_count_ul']),
+    # Ties go to the category seen first
+    (['UL', 'DL'] * 5, ['direction_count_ul', 'direction_count_dl']),
+])
+def test_category_columns_follow_the_loop_order(first_interval, expected):
+    df = pd.DataFrame({
+        'time': np.r_[np.linspace(0, 9, 10), np.linspace(10, 19, 12)],
+        'direction': first_interval + ['UL'] * 9 + ['DL', 'other', 'other'],
+        'size': np.arange(22, dtype=np.float64),
+    })
+    df['time_interval'] = (df['time'] / 10).astype(int)
+
+    vectorised = interval_statistics(df, 'group1_order1_user0')
+    loop = interval_statistics_loop(df, 'group1_order1_user0')
+    assert_same_statistics(vectorised, loop)
+    assert vectorised.dtypes.tolist() == loop.dtypes.tolist()
+    # Categories first seen in a later interval come last, as the loop appends them
+    assert list(vectorised.columns[-6:]) == ['direction_mode', *expected, 'time_interval', 'ID',
+                                             'direction_count_other']
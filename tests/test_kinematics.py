@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import warnings
+
+import numpy as np
+import pandas as pd
+from scipy.spatial.distance import euclidean
+
+from src.features.kinematics import PAIRS, SEGMENTS, movement_kinematics
+
+
+def _baseline_kinematics(df):
+    """The movement features as ``feature_engineering`` computed them column by column."""
+    df = df.copy()
+    dt = df['time'].diff().shift(-1)
+    dt.iloc[-1] = dt.iloc[-2]
+    features = {}
+    for segment in SEGMENTS:
+        for axis in 'XYZ':
+            features[f'Velocity_{segment}Pos{axis}'] = df[f'{segment}Pos{axis}'].diff() / dt
+        features[f'{segment}_Velocity'] = np.sqrt(sum(features[f'Velocity_{segment}Pos{axis}'] ** 2 for axis in 'XYZ'))
+        for axis in 'XYZ':
+            features[f'Accel_{segment}Pos{axis}'] = features[f'Velocity_{segment}Pos{axis}'].diff() / dt
+        for axis in 'XYZ':
+            features[f'{segment}_OrientationVelocity{axis}'] = df[f'{segment}Orientation{axis}'].diff() / dt
+        for axis in 'XYZ':
+            features[f'{segment}_OrientationAccel{axis}'] = features[f'{segment}_OrientationVelocity{axis}'].diff() / dt
+    for segment1, segment2 in PAIRS:
+        features[f'distance_{segment1}_to_{segment2}'] = df.apply(lambda row: euclidean(
+            (row[f'{segment1}PosX'], row[f'{segment1}PosY'], row[f'{segment1}PosZ']),
+            (row[f'{segment2}PosX'], row[f'{segment2}PosY'], row[f'{segment2}PosZ'])), axis=1)
+    return pd.DataFrame(features)
+
+
+def test_kinematics_match_the_column_by_column_formulas(movement):
+    movement = movement.copy()
+    # Repeated timestamps give infinite velocities, and infinite minus infinite accelerations
+    movement.loc[100:101, 'time'] = movement.loc[102, 'time']
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', RuntimeWarning)
+        kinematics = movement_kinematics(movement)
+    expected = _baseline_kinematics(movement)
+
+    assert list(kinematics.columns) == list(expected.columns)
+    assert np.isinf(kinematics['Velocity_HeadPosX']).any()
+    np.testing.assert_allclose(kinematics.to_numpy(), expected.to_numpy(), rtol=1e-12, atol=0, equal_nan=True)
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+from click.testing import CliRunner
+
+from src.data.manifest import Manifest, parse_path, scan
+from src.features import build_features
+
+
+@pytest.mark.parametrize('path', [
+    r'C:\data\raw\Raw_traffic_and_movement_data\group3_order1_user12\fast\user12_fast_movement.csv',
+    '/data/raw/Raw_traffic_and_movement_data/group3_order1_user12/fast/user12_fast_movement.csv',
+])
+def test_parse_path_with_either_separator(path):
+    assert parse_path(path) == {'id': 'group3_order1_user12', 'group': 3, 'order': 1, 'user': 12,
+                                'speed': 'fast', 'data_type': 'movement'}
+    assert build_features.extract_ids(path) == 'group3_order1_user12'
+
+
+def test_speed_falls_back_to_the_directory():
+    assert parse_path('raw/group1_order2_user1/Slow/traffic.parquet')['speed'] == 'slow'
+
+
+@pytest.fixture
+def raw(tmp_path):
+    root = tmp_path / 'fast_and_slow' / 'raw'
+    for user in range(3):
+        for speed in ('fast', 'slow'):
+            directory = root / f'group1_order{user % 2 + 1}_user{user}' / speed
+            directory.mkdir(parents=True)
+            for data_type in ('movement', 'traffic'):
+                (directory / f'user{user}_{speed}_{data_type}.csv').write_text('time\n0\n')
+            (directory / 'notes.txt').write_text('')
+    return root
+
+
+def test_datasets_select_by_parsed_fields(raw):
+    datasets = scan(str(raw)).datasets()
+    assert list(datasets) == ['movement_fast_stat', 'movement_slow_stat', 'traffic_fast_stat', 'traffic_slow_stat']
+    # The root path holds both speeds, only the file's own path decides; files come in path order
+    filepaths, data_type = datasets['traffic_slow_stat']
+    assert data_type == 'traffic'
+    assert [os.path.basename(path) for path in filepaths] == [
+        'user0_slow_traffic.csv', 'user2_slow_traffic.csv', 'user1_slow_traffic.csv']
+
+
+def test_refresh_lists_only_changed_directories(raw, tmp_path):
+    index = str(tmp_path / 'index.json')
+    first = scan(str(raw), index)
+    assert len(first) == 12
+
+    again = scan(str(raw), index)
+    assert again.rescanned == 0 and again.files == first.files
+
+    (raw / 'group1_order1_user0' / 'fast' / 'user0_fast_traffic.csv').unlink()
+    changed = scan(str(raw), index)
+    assert changed.rescanned == 1 and len(changed) == 11
+
+
+def test_threaded_scan_gives_the_same_index(raw):
+    assert Manifest(str(raw)).refresh(threads=4).files == scan(str(raw)).files
+
+
+def test_build_features_passes_threads_to_the_scan(raw, tmp_path, monkeypatch):
+    calls = []
+
+    def raw_datasets(input_filepath, manifest_path=None, threads=1):
+        calls.append((input_filepath, manifest_path, threads))
+        return {}
+
+    monkeypatch.setattr(build_features, 'raw_datasets', raw_datasets)
+    monkeypatch.setattr(build_features, 'process_datasets', lambda *args, **kwargs: {})
+    result = CliRunner().invoke(build_features.main, [str(raw), str(tmp_path), '10', '--threads', '4'])
+    assert result.exit_code == 0, result.output
+    assert calls == [(str(raw), None, 4)]
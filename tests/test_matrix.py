@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import sparse
+
+from src.data.matrix import FeatureMatrix, count_columns
+
+
+@pytest.fixture
+def cleaned(rng):
+    """Scaled features: dense columns with a few NaN, count columns mostly 0 or NaN."""
+    rows = 50
+    frame = pd.DataFrame({
+        'size_mean': rng.random(rows),
+        'packet_count_mean': rng.random(rows),
+        'time_interval': np.arange(rows) // 6 + 1,
+    })
+    frame.loc[3, 'size_mean'] = np.nan
+    for category in ['dl', 'ul', 'other']:
+        counts = np.where(rng.random(rows) < 0.7, 0.0, rng.random(rows))
+        counts[rng.random(rows) < 0.2] = np.nan
+        frame[f'direction_count_{category}'] = counts
+    return frame
+
+
+def test_count_columns_are_the_category_counts_only(cleaned):
+    assert count_columns(cleaned.columns) == ['direction_count_dl', 'direction_count_ul', 'direction_count_other']
+
+
+@pytest.mark.parametrize('as_sparse', [False, True])
+def test_model_input_equals_the_frame_values(cleaned, as_sparse):
+    matrix = FeatureMatrix.from_frame(cleaned)
+    X = matrix.model_input(as_sparse=as_sparse)
+    assert sparse.issparse(X) == as_sparse
+    X = X.toarray() if as_sparse else X
+    np.testing.assert_array_equal(X, cleaned.to_numpy(dtype=np.float32))
+
+
+def test_take_and_to_frame_keep_the_values(cleaned):
+    matrix = FeatureMatrix.from_frame(cleaned).take(np.arange(10, 30))
+    pd.testing.assert_frame_equal(matrix.to_frame(), cleaned.iloc[10:30].reset_index(drop=True).astype(np.float32))
+
+
+def test_model_input_is_dense_unless_csr_is_smaller(cleaned):
+    matrix = FeatureMatrix.from_frame(cleaned)
+    # The dense statistics and the NaN entries of missing categories outweigh the implicit zeros
+    assert not matrix.is_sparse_smaller()
+    X = matrix.model_input()
+    assert isinstance(X, np.ndarray) and X.dtype == np.float32 and X.nbytes * 2 == cleaned.to_numpy().nbytes
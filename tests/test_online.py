@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import csv
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.data.storage import write_table
+from src.features.build_features import process_file
+from src.features.online import OnlineSession, parse_value
+
+
+def _replay(path, data_type):
+    """Statistics of the closed intervals of a raw table fed to an ``OnlineSession`` line by line."""
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        session = OnlineSession(next(reader), data_type, reservoir=100000)
+        closed = [stats for fields in reader for _, stats in session.push([parse_value(field) for field in fields])]
+    closed += [stats for _, stats in session.flush()]
+    return closed
+
+
+def assert_matches_offline(closed, offline):
+    # Flattened as in the saved ``*_stat`` datasets
+    offline = offline.set_axis(['_'.join(col) if isinstance(col, tuple) else col for col in offline.columns], axis=1)
+    assert len(closed) == len(offline)
+    for stats, (_, row) in zip(closed, offline.iterrows()):
+        # Online statistics only count the categories seen in their own interval
+        expected = row.dropna()
+        assert set(expected.index) <= set(stats)
+        for col, value in stats.items():
+            assert col in row.index
+            if value is None or isinstance(value, str):
+                assert row[col] == value
+            else:
+                np.testing.assert_allclose(value, float(row[col]), rtol=1e-9, atol=1e-12, equal_nan=True, err_msg=col)
+
+
+def test_missing_text_in_first_row_stays_categorical(tmp_path, rng):
+    n = 600
+    raw = pd.DataFrame({
+        'time': np.arange(n) * 0.1,
+        'label': rng.choice(['a', 'b', 'c'], n).astype(object),
+        'value': rng.normal(size=n),
+    })
+    raw.loc[0, ['label', 'value']] = np.nan
+    path = str(tmp_path / 'user0_slow_other.csv')
+    write_table(raw, path)
+
+    offline = process_file(path, 10, 'other')
+    assert 'label_mode' in offline and 'label_mean' not in offline
+    assert_matches_offline(_replay(path, 'other'), offline)
+
+
+def test_traffic_direction_is_categorical_by_schema(tmp_path, traffic):
+    traffic = traffic.astype({'direction': object})
+    traffic.loc[0, 'direction'] = np.nan
+    path = str(tmp_path / 'user0_slow_traffic.csv')
+    write_table(traffic, path)
+
+    closed = _replay(path, 'traffic')
+    assert 'direction_mode' in closed[0] and 'direction_mean' not in closed[0]
+    assert_matches_offline(closed, process_file(path, 10, 'traffic'))
+
+
+def test_text_in_numeric_column_after_first_interval(tmp_path):
+    session = OnlineSession(['time', 'value'], 'other')
+    session.push([0.0, 1.0])
+    session.push([10.0, 2.0])
+    with pytest.raises(ValueError, match='value'):
+        session.push([11.0, 'x'])
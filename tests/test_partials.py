@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.features.build_features import feature_engineering
+from src.features.interval_stats import QUANTILES, interval_statistics
+from src.features.partials import IntervalPartials
+
+IDS = 'group1_order1_user0'
+
+
+@pytest.fixture(params=['movement', 'traffic'])
+def features(request, movement, traffic):
+    """Engineered features of a movement or a traffic session."""
+    raw = movement if request.param == 'movement' else traffic
+    return feature_engineering(raw.copy(), request.param)
+
+
+def assert_same_statistics(got, expected):
+    pd.testing.assert_frame_equal(got, expected, check_exact=False, rtol=1e-9, atol=1e-12)
+
+
+@pytest.mark.parametrize('window', [10, 30, 60])
+def test_windows_match_interval_statistics_of_rebucketed_rows(features, window):
+    rows = features.copy()
+    rows['time_interval'] = (rows['time'] / window).astype(int)
+    expected = interval_statistics(rows, IDS)
+    # The minute each window starts in, the 10 second buckets giving it directly
+    expected['time_interval'] = np.unique(rows['time_interval']) * window // 60 + 1
+
+    assert_same_statistics(IntervalPartials.from_frame(features, IDS).statistics(window), expected)
+
+
+def test_concatenated_chunks_match_a_single_pass(features):
+    whole = IntervalPartials.from_frame(features, IDS)
+    # Chunks end in the middle of buckets
+    parts = [IntervalPartials.from_frame(features.iloc[start:start + 333], IDS)
+             for start in range(0, len(features), 333)]
+    joined = IntervalPartials.concat(parts)
+
+    np.testing.assert_array_equal(joined.buckets, whole.buckets)
+    for window in [10, 60]:
+        assert_same_statistics(joined.statistics(window), whole.statistics(window))
+
+
+@pytest.mark.parametrize('window', [1, 10])
+def test_sketched_quartiles_stay_within_the_rank_error_bound(rng, window):
+    sketch_size = 16
+    time = np.sort(rng.uniform(0, 20, 20000))
+    values = np.round(rng.lognormal(0, 1, len(time)), 3)
+    partials = IntervalPartials.from_frame(pd.DataFrame({'time': time, 'value': values}), IDS,
+                                           sketch_size=sketch_size)
+    stats = partials.statistics(window)
+
+    buckets = time.astype(int)
+    for k, interval in enumerate(np.unique(time // window)):
+        in_window = (time // window) == interval
+        exact = np.sort(values[in_window])
+        bound = sum(int(np.ceil(np.sum(buckets[in_window] == bucket) / sketch_size))
+                    for bucket in np.unique(buckets[in_window]))
+        for quantile, name in zip(QUANTILES, ['25%', '50%', '75%']):
+            position = (len(exact) - 1) * quantile
+            lower = exact[max(int(np.floor(position)) - bound, 0)]
+            upper = exact[min(int(np.ceil(position)) + bound, len(exact) - 1)]
+            assert lower <= stats.loc[k, ('value', name)] <= upper
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import io
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from click.testing import CliRunner
+from sklearn.ensemble import RandomForestClassifier
+
+from src.data.storage import write_table
+from src.models.predict_model import BatchPredictor, MicroBatcher, main, predict_dataset
+
+
+@pytest.fixture
+def cleaned(rng):
+    """A cleaned dataset of three users, six intervals each."""
+    rows = 18
+    frame = pd.DataFrame(rng.random((rows, 4)), columns=['a_mean', 'b_mean', 'c_std', 'd_max'])
+    frame['ID'] = np.repeat([0, 1, 2], 6)
+    frame['a_mean'] += frame['ID']
+    frame['time_interval'] = np.tile(np.arange(1, 7), 3)
+    return frame
+
+
+@pytest.fixture
+def model(cleaned):
+    X = cleaned.drop(columns=['ID', 'time_interval'])
+    return RandomForestClassifier(n_estimators=10, random_state=0).fit(X, cleaned['ID'])
+
+
+def test_top_k_predictions_are_sorted_and_match_predict(cleaned, model):
+    predictions, report = predict_dataset(model, cleaned, top_k=2, batch_size=5)
+    X = cleaned.drop(columns=['ID', 'time_interval'])
+    np.testing.assert_array_equal(predictions['predicted'], model.predict(X))
+    assert (predictions['probability'] >= predictions['probability_2']).all()
+    assert report['rows'] == len(cleaned)
+
+
+def test_micro_batches_match_the_whole_batch(cleaned, model):
+    X = cleaned.drop(columns=['ID', 'time_interval'])
+    predictor = BatchPredictor(model, top_k=3)
+    labels, probabilities = predictor.predict(X)
+    with MicroBatcher(predictor, max_batch_size=4, max_wait=0.01) as batcher:
+        futures = [batcher.submit(row) for row in X.to_dict('records')]
+        results = [future.result() for future in futures]
+    for i, (row_labels, row_probabilities) in enumerate(results):
+        np.testing.assert_array_equal(row_labels, labels[i])
+        np.testing.assert_allclose(row_probabilities, probabilities[i])
+    assert max(batcher.batch_sizes) <= 4
+
+
+def test_cli_writes_dataset_predictions_to_stdout(tmp_path, cleaned, model):
+    joblib.dump(model, tmp_path / 'model.joblib')
+    write_table(cleaned, str(tmp_path / 'cleaned.csv'))
+    result = CliRunner().invoke(main, [str(tmp_path / 'model.joblib'), str(tmp_path / 'cleaned.csv'), '-'])
+    assert result.exit_code == 0, result.output
+    predictions = pd.read_csv(io.StringIO(result.stdout))
+    assert list(predictions.columns) == ['time_interval', 'ID', 'predicted', 'probability']
+    assert len(predictions) == len(cleaned)
+
+
+def test_cli_rejects_an_unknown_output_format(tmp_path, cleaned, model):
+    joblib.dump(model, tmp_path / 'model.joblib')
+    write_table(cleaned, str(tmp_path / 'cleaned.csv'))
+    result = CliRunner().invoke(main, [str(tmp_path / 'model.joblib'), str(tmp_path / 'cleaned.csv'),
+                                       str(tmp_path / 'predictions.txt')])
+    assert result.exit_code == 2
+    assert 'OUTPUT_FILEPATH' in result.output
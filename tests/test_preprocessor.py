@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.process.preprocessor import Preprocessor
+from src.process.process_data import encoding, find_non_varying_variables, match_columns, scaling
+
+
+@pytest.fixture
+def pair(rng):
+    """Raw slow and fast statistics with padded names, constant columns and a column only the fast set has."""
+    def stat_rows(rows, extra=False):
+        df = pd.DataFrame({
+            ' size_mean': rng.normal(100, 20, rows),
+            'size_std ': rng.uniform(0, 5, rows),
+            'version': 4.0,
+            'direction_mode': rng.choice(['DL', 'UL'], rows).astype(object),
+            'time_interval': np.arange(rows) // 6 + 1,
+            'ID': rng.choice(['group1_order1_user0', 'group1_order1_user1'], rows).astype(object),
+        })
+        if extra:
+            df['rate_max'] = rng.uniform(0, 1, rows)
+        return df
+    return stat_rows(60), stat_rows(40, extra=True)
+
+
+def _old_clean(df):
+    """The cleaning steps of ``preprocess`` before they were fitted into a ``Preprocessor``."""
+    df = df.copy()
+    df.columns = df.columns.str.strip()
+    df = df.drop(columns=find_non_varying_variables(df)['Variable'])
+    return encoding(scaling(df))
+
+
+def test_transform_reproduces_the_old_preprocess(pair):
+    slow, fast = pair
+    old_slow, old_fast = _old_clean(slow), _old_clean(fast)
+    old_fast = match_columns(old_slow, old_fast)
+    old_slow, old_fast = (df.reindex(sorted(df.columns), axis=1) for df in (old_slow, old_fast))
+
+    slow_state = Preprocessor().fit(slow)
+    fast_state = Preprocessor().fit(fast).align(slow_state.output_columns)
+    for state, df, expected in [(slow_state, slow, old_slow), (fast_state, fast, old_fast)]:
+        transformed = state.transform(df)
+        pd.testing.assert_frame_equal(transformed, expected, check_dtype=False)
+        values = df.rename(columns=str.strip)[state.columns].to_numpy(dtype=object)
+        np.testing.assert_allclose(state.transform_values(values), transformed.to_numpy(dtype=np.float64))
+        np.testing.assert_allclose(state.transform_values(values[0]), transformed.to_numpy(dtype=np.float64)[0])
+
+
+def test_save_load_round_trip(tmp_path, pair):
+    slow, _ = pair
+    state = Preprocessor().fit(slow)
+    state.extend_vocabulary('ID', ['group1_order1_user7'])
+    path = str(tmp_path / 'traffic_slow_preprocess.json')
+    state.save(path)
+
+    loaded = Preprocessor.load(path)
+    assert loaded.to_dict() == state.to_dict()
+    pd.testing.assert_frame_equal(loaded.transform(slow), state.transform(slow))
+
+
+def test_inverse_transform_restores_wide_tables_without_fragmenting(rng):
+    rows = 30
+    df = pd.DataFrame({f'feature{j}_mean': rng.uniform(0, 1, rows) for j in range(20)})
+    df = pd.concat([df, pd.DataFrame({f'constant{j}_max': 1.0 for j in range(300)}, index=df.index)], axis=1)
+    df['direction_mode'] = rng.choice(['DL', 'UL'], rows).astype(object)
+    state = Preprocessor().fit(df)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', pd.errors.PerformanceWarning)
+        restored = state.inverse_transform(state.transform(df))
+    pd.testing.assert_frame_equal(restored[df.columns], df, check_dtype=False)
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.data.storage import read_table, table_path, write_table
+from src.process.process_data import preprocess, preprocess_incremental, source_path
+
+
+def _stat_rows(rng, users, minutes=3, high=1.0, extra=False):
+    """Statistics rows of some sessions, six 10 second intervals per minute."""
+    rows = len(users) * minutes * 6
+    df = pd.DataFrame({
+        'ID': np.repeat([f'group1_order1_user{user}' for user in users], minutes * 6),
+        'time_interval': np.tile(np.repeat(np.arange(1, minutes + 1), 6), len(users)),
+        'size_mean': rng.uniform(0, high, rows),
+        'size_std': rng.uniform(0, high, rows),
+        'version': 4.0,
+        'direction_mode': rng.choice(['DL', 'UL'], rows).astype(object),
+        'direction_count_dl': rng.integers(0, 10, rows).astype(np.float64),
+    })
+    # Both bounds of every scaled column are in the first sessions, new ones stay within them
+    df.loc[0, ['size_mean', 'size_std', 'direction_count_dl']] = [0, 1, 0]
+    df.loc[1, ['size_mean', 'size_std', 'direction_count_dl']] = [1, 0, 9]
+    if extra:
+        df['rate_max'] = rng.uniform(0, 1, rows)
+    return df
+
+
+def _write(df, directory, name, format):
+    path = table_path(str(directory), f'{name}_stat', format)
+    write_table(df, path)
+    return path
+
+
+def _cleaned(directory, format):
+    return {name: read_table(table_path(str(directory), f'{name}_cleaned', format))
+            for name in ['traffic_slow', 'traffic_fast']}
+
+
+def assert_same_cleaned(incremental, full):
+    for name in full:
+        pd.testing.assert_frame_equal(incremental[name], full[name], check_dtype=False, check_categorical=False,
+                                      obj=name)
+
+
+@pytest.mark.parametrize('format', ['csv', 'parquet'])
+def test_append_then_refit_equals_full_preprocess(tmp_path, rng, format):
+    inputs, output = tmp_path / 'inputs', tmp_path / 'output'
+    inputs.mkdir()
+    output.mkdir()
+    slow = [_stat_rows(rng, [0, 1, 2])]
+    # The testing set has a column the training set lacks, dropped by the alignment
+    fast = _stat_rows(rng, [0, 1, 2], extra=True)
+    preprocess({'traffic_slow': _write(slow[0], inputs, 'traffic_slow', format),
+                'traffic_fast': _write(fast, inputs, 'traffic_fast', format)}, str(output))
+
+    def full_preprocess(step):
+        directory = tmp_path / f'full{step}'
+        directory.mkdir()
+        preprocess({'traffic_slow': _write(pd.concat(slow, ignore_index=True), directory, 'traffic_slow', format),
+                    'traffic_fast': _write(fast, directory, 'traffic_fast', format)}, str(directory))
+        return _cleaned(directory, format)
+
+    # New sessions within the fitted ranges are appended
+    slow.append(_stat_rows(rng, [3, 4]))
+    new_path = _write(slow[-1], tmp_path, 'traffic_slow', format)
+    appended = preprocess_incremental({'traffic_slow': new_path}, str(output))
+    assert len(appended['traffic_slow']) == len(slow[-1])
+    assert_same_cleaned(_cleaned(output, format), full_preprocess(1))
+
+    # Rerunning the same input adds nothing
+    assert preprocess_incremental({'traffic_slow': new_path}, str(output)) == {}
+    assert len(read_table(source_path(str(output), 'traffic_slow', format))) == sum(map(len, slow))
+    assert_same_cleaned(_cleaned(output, format), full_preprocess(2))
+
+    # Out of range values and a new column refit from the source rows
+    slow.append(_stat_rows(rng, [5], high=3.0, extra=True))
+    refitted = preprocess_incremental({'traffic_slow': _write(slow[-1], tmp_path, 'traffic_slow', format)},
+                                      str(output))
+    assert len(refitted['traffic_slow']) == sum(map(len, slow))
+    cleaned = _cleaned(output, format)
+    assert cleaned['traffic_fast']['rate_max'].gt(0).any()
+    assert_same_cleaned(cleaned, full_preprocess(3))
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.data.storage import write_table
+from src.features.build_features import process_file
+
+
+@pytest.mark.parametrize('chunksize', [7, 1000])
+def test_chunked_spectral_statistics_match_whole_file(tmp_path, movement, chunksize):
+    # A slower first stretch makes the first chunk's sample rate differ from the session's
+    movement = movement.copy()
+    movement.loc[:49, 'time'] = movement.loc[:49, 'time'] * 2
+    movement['time'] = np.maximum.accumulate(movement['time'].to_numpy())
+    path = str(tmp_path / 'user0_slow_movement.csv')
+    write_table(movement, path)
+
+    whole = process_file(path, 10, 'movement', spectral=True)
+    chunked = process_file(path, 10, 'movement', chunksize=chunksize, spectral=True)
+    pd.testing.assert_frame_equal(chunked, whole, check_exact=False, rtol=1e-9)
+
+
+def test_chunked_traffic_statistics_match_whole_file(tmp_path, traffic):
+    path = str(tmp_path / 'user0_slow_traffic.csv')
+    write_table(traffic, path)
+
+    whole = process_file(path, 10, 'traffic')
+    chunked = process_file(path, 10, 'traffic', chunksize=500)
+    pd.testing.assert_frame_equal(chunked, whole, check_exact=False, rtol=1e-9)